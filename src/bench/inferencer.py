@@ -0,0 +1,81 @@
+"""
+Micro-benchmark of the Inferencer prediction overhead.
+
+# Run the benchmark from the 'src' directory with:
+    python -m bench.inferencer
+
+Compares the time of a single prediction made by the previous implementation
+(TensorDataset + DataLoader + Variable + NumPy float64) with Inferencer.predict,
+and with the bare forward pass of the Model.
+"""
+
+import argparse
+import io
+import numpy as np
+import timeit
+import torch
+
+from torch.autograd import Variable
+
+from core.inferencer import Inferencer
+from core.model import Model
+
+def setup_inferencer() -> Inferencer:
+    """
+    Loads random weights to the Inferencer.
+    """
+    buffer = io.BytesIO()
+    torch.save(Model(input_dim = 2, output_dim = 1).state_dict(), buffer)
+
+    inferencer = Inferencer()
+    inferencer.load_weights('0' * 32, buffer.getvalue())
+    return inferencer
+
+def predict_legacy(model: Model, v: list) -> float:
+    """
+    The prediction as it was made before the fast path was introduced.
+    """
+    x = torch.unsqueeze(torch.from_numpy(np.asarray(v)), 0)
+    ds = torch.utils.data.TensorDataset(x)
+    inference_loader = torch.utils.data.DataLoader(ds)
+
+    with torch.no_grad():
+        for inference in inference_loader:
+            inference_batch = Variable(inference[0]).float()
+            output_batch = model(inference_batch)
+            return torch.squeeze(output_batch).numpy().astype(float).tolist()
+
+def measure_us(fn, count: int, repeat: int) -> float:
+    """
+    Returns the best time of a single fn() call (in microseconds).
+    """
+    fn()
+    return min(timeit.repeat(fn, number=count, repeat=repeat)) / count * 1e6
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--count', type=int, default=5000, help='Calls per measurement.')
+    p.add_argument('--repeat', type=int, default=5, help='Measurements made, the best one is reported.')
+    args = p.parse_args()
+
+    inferencer = setup_inferencer()
+    model = Model(input_dim = 2, output_dim = 1).eval()
+    v = [0.3, 0.7]
+    x = torch.tensor([v], dtype=torch.float32)
+
+    def forward_only():
+        with torch.inference_mode():
+            return model(x)
+
+    time_legacy = measure_us(lambda: predict_legacy(model, v), args.count, args.repeat)
+    time_fast = measure_us(lambda: inferencer.predict(v), args.count, args.repeat)
+    time_forward = measure_us(forward_only, args.count, args.repeat)
+
+    print(f'Legacy predict:     {time_legacy:8.2f} us')
+    print(f'Inferencer.predict: {time_fast:8.2f} us')
+    print(f'Model forward only: {time_forward:8.2f} us')
+    print(f'Overhead above the forward pass: '
+        f'{time_legacy - time_forward:.2f} us -> {time_fast - time_forward:.2f} us')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,483 @@
+"""
+Load test of the whole pipeline: a Gateway and Workers started locally.
+
+# Run the benchmark from the 'src' directory with:
+    python -m bench.load
+
+# Open-loop load of 500 requests per second over ipc://, saved as the baseline:
+    python -m bench.load --transport ipc --mode open --rps 500 --output baseline.json
+
+# The same load compared with the baseline (exits with 1 on a regression):
+    python -m bench.load --transport ipc --mode open --rps 500 --baseline baseline.json
+
+Command line arguments:
+
+--workers         specifies the number of Workers started.
+--transport       specifies the transport between the Gateway and Workers (tcp or ipc).
+--url             specifies the URL of a Gateway already running (nothing is started then).
+--gw_args         specifies the extra command line arguments of the Gateway.
+--worker_args     specifies the extra command line arguments of Workers.
+--scenarios       specifies the requests made: predict, predict_data and set_weights (each one in turn).
+--mode            specifies the load: open (requests sent at the rate) or closed (requests sent by the clients).
+--rps             specifies the rate of requests per second of the open-loop load.
+--concurrency     specifies the number of clients (connections) of the closed-loop load, the maximum number of connections of the open-loop load.
+--duration_s      specifies the duration of every scenario (in seconds).
+--warmup_s        specifies the time requests are made before the measurement (in seconds).
+--output          specifies the file the results are saved to as JSON (printed otherwise).
+--baseline        specifies the file of the results to compare with.
+--tolerance       specifies the change of throughput and latency (in percents) counted as a regression.
+
+The latency of the open-loop load is measured from the time the request was due,
+so the requests delayed by the slow responses are accounted for (no coordinated omission).
+"""
+
+import argparse
+import base64
+import io
+import json
+import math
+import os
+import platform
+import random
+import shlex
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import trio
+import uuid
+
+from typing import Any, Dict, List, Optional, Tuple
+
+SCENARIO_PREDICT = 'predict'
+SCENARIO_PREDICT_DATA = 'predict_data'
+SCENARIO_SET_WEIGHTS = 'set_weights'
+
+SCENARIOS = (SCENARIO_PREDICT, SCENARIO_PREDICT_DATA, SCENARIO_SET_WEIGHTS)
+
+MODE_OPEN = 'open'
+MODE_CLOSED = 'closed'
+
+TRANSPORT_TCP = 'tcp'
+TRANSPORT_IPC = 'ipc'
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+# Time to wait for the Workers to join the Gateway
+STARTUP_TIMEOUT_S = 60.0
+
+class _HttpConnection:
+    """
+    Minimal HTTP/1.1 client connection (kept alive between requests), so the client
+    costs as little as possible and never limits the load.
+    """
+
+    def __init__(self, stream: trio.SocketStream):
+        self.__stream = stream
+        self.__buffer = bytearray()
+
+    @staticmethod
+    async def open(host: str, port: int) -> '_HttpConnection':
+        return _HttpConnection(await trio.open_tcp_stream(host, port))
+
+    async def close(self):
+        await self.__stream.aclose()
+
+    async def request(self, method: str, path: str, content_type: str, body: bytes) -> Tuple[int, bytes]:
+        """
+        Returns the status code and body of the response.
+        """
+        head = (f'{method} {path} HTTP/1.1\r\nHost: localhost\r\n'
+            f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n')
+        await self.__stream.send_all(head.encode('latin-1') + body)
+
+        index_end = await self.__receive_until(b'\r\n\r\n')
+        lines = bytes(self.__buffer[:index_end]).decode('latin-1').split('\r\n')
+        del self.__buffer[:index_end + 4]
+
+        status = int(lines[0].split(' ', 2)[1])
+        headers = dict(line.lower().split(':', 1) for line in lines[1:])
+        if 'content-length' not in headers:
+            raise ValueError('the response has no content length')
+
+        size = int(headers['content-length'])
+        while len(self.__buffer) < size:
+            await self.__receive()
+        body = bytes(self.__buffer[:size])
+        del self.__buffer[:size]
+        return status, body
+
+    async def __receive_until(self, separator: bytes) -> int:
+        while True:
+            index = self.__buffer.find(separator)
+            if index >= 0:
+                return index
+            await self.__receive()
+
+    async def __receive(self):
+        data = await self.__stream.receive_some(65536)
+        if not data:
+            raise trio.BrokenResourceError('the connection is closed')
+        self.__buffer += data
+
+def make_weights() -> bytes:
+    """
+    Returns the Base64 encoded random weights of the Model.
+    """
+    # Note: PyTorch is imported only when the weights are needed
+    import torch
+    from core.model import Model
+
+    buffer = io.BytesIO()
+    torch.save(Model(input_dim = 2, output_dim = 1).state_dict(), buffer)
+    return base64.standard_b64encode(buffer.getvalue())
+
+def make_request(scenario: str, weights: List[bytes]) -> Tuple[str, str, str, bytes]:
+    """
+    Returns the method, path, content type and body of the request of the scenario.
+    """
+    if scenario == SCENARIO_PREDICT:
+        body = json.dumps({'vector': [random.random(), random.random()]})
+        return 'POST', '/predict', 'application/json', body.encode()
+
+    if scenario == SCENARIO_PREDICT_DATA:
+        data = base64.standard_b64encode(struct.pack('<2f', random.random(), random.random()))
+        body = json.dumps({'data': data.decode()})
+        return 'POST', '/predict', 'application/json', body.encode()
+
+    # Note: the weights are sent with a new NN id, so Workers never skip the transfer as known
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="nn_id"\r\n\r\n{uuid.uuid4().hex}\r\n'
+        f'--{boundary}\r\nContent-Disposition: form-data; name="data"; filename="weights.b64"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n').encode()
+    body += random.choice(weights) + f'\r\n--{boundary}--\r\n'.encode()
+    return 'PUT', '/set_weights', f'multipart/form-data; boundary={boundary}', body
+
+class _Recorder:
+    """
+    Records the outcomes of the requests completed after the warmup.
+    """
+
+    def __init__(self, time_start: float):
+        self.time_start = time_start
+        self.latencies_ms = []
+        self.status_codes = {}
+        self.count_errors = 0
+        self.messages_failed = {}
+
+    def record(self, time_due: float, time_done: float, status: int, body: bytes):
+        if time_due < self.time_start:
+            return
+
+        self.latencies_ms.append((time_done - time_due) * 1000)
+        self.status_codes[status] = self.status_codes.get(status, 0) + 1
+        if status != 200 or not _is_successful(body):
+            self.count_errors += 1
+            message = _get_message(body)
+            self.messages_failed[message] = self.messages_failed.get(message, 0) + 1
+
+def _is_successful(body: bytes) -> bool:
+    try:
+        return json.loads(body).get('status', False) is True
+    except ValueError:
+        return False
+
+def _get_message(body: bytes) -> str:
+    try:
+        return str(json.loads(body).get('message', ''))[:100]
+    except ValueError:
+        return body[:100].decode(errors='replace')
+
+async def run_closed(host: str, port: int, scenario: str, weights: List[bytes],
+    concurrency: int, recorder: _Recorder, time_end: float):
+
+    async def client():
+        connection = None
+        while trio.current_time() < time_end:
+            method, path, content_type, body = make_request(scenario, weights)
+            time_due = trio.current_time()
+            status, response = 0, b''
+            try:
+                if connection is None:
+                    connection = await _HttpConnection.open(host, port)
+                status, response = await connection.request(method, path, content_type, body)
+            except (OSError, ValueError, trio.BrokenResourceError):
+                if connection is not None:
+                    await connection.close()
+                connection = None
+            recorder.record(time_due, trio.current_time(), status, response)
+
+        if connection is not None:
+            await connection.close()
+
+    async with trio.open_nursery() as nursery:
+        for _ in range(concurrency):
+            nursery.start_soon(client)
+
+async def run_open(host: str, port: int, scenario: str, weights: List[bytes],
+    rps: float, concurrency: int, recorder: _Recorder, time_end: float):
+
+    connections_idle = []
+    limiter = trio.CapacityLimiter(concurrency)
+
+    async def send(time_due: float):
+        method, path, content_type, body = make_request(scenario, weights)
+        status, response = 0, b''
+        async with limiter:
+            connection = connections_idle.pop() if connections_idle else None
+            try:
+                if connection is None:
+                    connection = await _HttpConnection.open(host, port)
+                status, response = await connection.request(method, path, content_type, body)
+                connections_idle.append(connection)
+            except (OSError, ValueError, trio.BrokenResourceError):
+                if connection is not None:
+                    await connection.close()
+        recorder.record(time_due, trio.current_time(), status, response)
+
+    async with trio.open_nursery() as nursery:
+        time_due = trio.current_time()
+        while time_due < time_end:
+            await trio.sleep_until(time_due)
+            nursery.start_soon(send, time_due)
+            time_due += 1 / rps
+
+    for connection in connections_idle:
+        await connection.close()
+
+def summarize(recorder: _Recorder, duration_s: float) -> Dict[str, Any]:
+    latencies = sorted(recorder.latencies_ms)
+    count = len(latencies)
+
+    result = {}
+    result['requests'] = count
+    result['errors'] = recorder.count_errors
+    result['status_codes'] = {str(code): n for code, n in sorted(recorder.status_codes.items())}
+    result['messages_failed'] = recorder.messages_failed
+    result['throughput_rps'] = (count - recorder.count_errors) / duration_s
+
+    latency = {}
+    latency['avg'] = sum(latencies) / count if count > 0 else 0.0
+    for q in PERCENTILES:
+        latency[f'p{q:g}'] = latencies[max(0, math.ceil(count * q / 100) - 1)] if count > 0 else 0.0
+    latency['max'] = latencies[-1] if count > 0 else 0.0
+    result['latency_ms'] = latency
+    return result
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> Dict[str, Any]:
+    """
+    Returns the changes (in percents) of the throughput and latency of every scenario found in both results,
+    and the regressions: the throughput dropped or the p50/p99 latency grown by more than the tolerance.
+    """
+    def change(value: float, value_base: float) -> float:
+        if value_base == 0:
+            return 0.0
+        return (value - value_base) / value_base * 100
+
+    comparison = {'scenarios': {}, 'regressions': []}
+    for scenario, result in results['scenarios'].items():
+        result_base = baseline.get('scenarios', {}).get(scenario)
+        if result_base is None:
+            continue
+
+        changes = {}
+        changes['throughput_rps'] = change(result['throughput_rps'], result_base['throughput_rps'])
+        for key in ('p50', 'p99'):
+            changes[f'latency_{key}_ms'] = change(result['latency_ms'][key], result_base['latency_ms'][key])
+        comparison['scenarios'][scenario] = changes
+
+        if changes['throughput_rps'] < -tolerance:
+            comparison['regressions'].append(f'{scenario}: throughput {changes["throughput_rps"]:+.1f}%')
+        for key in ('latency_p50_ms', 'latency_p99_ms'):
+            if changes[key] > tolerance:
+                comparison['regressions'].append(f'{scenario}: {key} {changes[key]:+.1f}%')
+    return comparison
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class Cluster:
+    """
+    The Gateway and Workers running in the child processes.
+    """
+
+    def __init__(self, count_workers: int, transport: str, gw_args: List[str], worker_args: List[str]):
+        self.__count_workers = count_workers
+        self.__port = get_free_port()
+
+        if transport == TRANSPORT_IPC:
+            self.__dir = tempfile.TemporaryDirectory(prefix='pipeline-bench-')
+            addr_service = f'ipc://{self.__dir.name}/service'
+            addr_worker = f'ipc://{self.__dir.name}/worker'
+        else:
+            self.__dir = None
+            addr_service = f'tcp://127.0.0.1:{get_free_port()}'
+            addr_worker = f'tcp://127.0.0.1:{get_free_port()}'
+
+        src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        addrs = ['--addr_service', addr_service, '--addr_worker', addr_worker]
+        self.__commands = [[sys.executable, os.path.join(src, 'gw.py'),
+            '--addr_rest', f'127.0.0.1:{self.__port}'] + addrs + gw_args]
+        self.__commands += [[sys.executable, os.path.join(src, 'worker.py')] + addrs + worker_args
+            for _ in range(count_workers)]
+        self.__cwd = src
+        self.__processes = []
+
+    @property
+    def port(self) -> int:
+        return self.__port
+
+    async def start(self):
+        for command in self.__commands:
+            self.__processes.append(subprocess.Popen(command, cwd=self.__cwd,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+        # The Workers are ready when the Gateway receives their heartbeats
+        with trio.fail_after(STARTUP_TIMEOUT_S):
+            while True:
+                await trio.sleep(0.2)
+                try:
+                    connection = await _HttpConnection.open('127.0.0.1', self.__port)
+                    try:
+                        _, body = await connection.request('GET', '/status', 'application/json', b'')
+                    finally:
+                        await connection.close()
+                    if json.loads(body).get('workers_count') == self.__count_workers:
+                        return
+                except (OSError, ValueError, trio.BrokenResourceError):
+                    pass
+
+    def stop(self):
+        for process in self.__processes:
+            process.terminate()
+        for process in self.__processes:
+            process.wait()
+        if self.__dir is not None:
+            self.__dir.cleanup()
+
+async def load_weights(host: str, port: int, weights: List[bytes], count_workers: int):
+    """
+    Loads the weights the predictions are made by.
+
+    Note: Workers join the Gateway's service listener a bit later than the computation one,
+    so the weights are loaded again until count_workers Workers respond.
+    """
+    with trio.fail_after(STARTUP_TIMEOUT_S):
+        while True:
+            connection = await _HttpConnection.open(host, port)
+            try:
+                status, body = await connection.request(*make_request(SCENARIO_SET_WEIGHTS, weights))
+            finally:
+                await connection.close()
+            if status != 200 or not _is_successful(body):
+                raise RuntimeError(f'cannot load weights: {status} {body.decode(errors="replace")}')
+            if json.loads(body).get('workers_count', 0) >= count_workers:
+                return
+            await trio.sleep(0.2)
+
+async def run(args) -> Dict[str, Any]:
+    weights = [make_weights() for _ in range(4)]
+
+    cluster = None
+    if args.url is None:
+        cluster = Cluster(args.workers, args.transport, shlex.split(args.gw_args), shlex.split(args.worker_args))
+        host, port = '127.0.0.1', cluster.port
+    else:
+        host, _, port = args.url.split('://')[-1].rstrip('/').partition(':')
+        port = int(port or 80)
+
+    results = {}
+    results['config'] = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    results['host'] = {'platform': platform.platform(), 'python': platform.python_version(),
+        'cpu_count': os.cpu_count()}
+    results['time'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    results['scenarios'] = {}
+
+    try:
+        if cluster is not None:
+            await cluster.start()
+
+        await load_weights(host, port, weights, args.workers if cluster is not None else 0)
+
+        for scenario in args.scenarios:
+            time_start = trio.current_time() + args.warmup_s
+            time_end = time_start + args.duration_s
+            recorder = _Recorder(time_start)
+            if args.mode == MODE_OPEN:
+                await run_open(host, port, scenario, weights, args.rps, args.concurrency, recorder, time_end)
+            else:
+                await run_closed(host, port, scenario, weights, args.concurrency, recorder, time_end)
+            results['scenarios'][scenario] = summarize(recorder, args.duration_s)
+    finally:
+        if cluster is not None:
+            cluster.stop()
+
+    return results
+
+def print_summary(results: Dict[str, Any], comparison: Optional[Dict[str, Any]]):
+    """
+    Prints the human readable summary to stderr (the JSON is printed to stdout).
+    """
+    for scenario, result in results['scenarios'].items():
+        latency = result['latency_ms']
+        line = (f'{scenario:13} {result["throughput_rps"]:9.1f} rps  errors {result["errors"]:5}  '
+            f'p50 {latency["p50"]:8.2f} ms  p99 {latency["p99"]:8.2f} ms  max {latency["max"]:8.2f} ms')
+        if comparison is not None and scenario in comparison['scenarios']:
+            changes = comparison['scenarios'][scenario]
+            line += (f'  (rps {changes["throughput_rps"]:+.1f}%, p50 {changes["latency_p50_ms"]:+.1f}%, '
+                f'p99 {changes["latency_p99_ms"]:+.1f}%)')
+        print(line, file=sys.stderr)
+
+    if comparison is not None:
+        for regression in comparison['regressions']:
+            print(f'Regression: {regression}', file=sys.stderr)
+
+def main():
+    p = argparse.ArgumentParser(usage=__doc__)
+    p.add_argument('--workers', type=int, default=2, help='Number of Workers started.')
+    p.add_argument('--transport', choices=(TRANSPORT_TCP, TRANSPORT_IPC), default=TRANSPORT_TCP,
+        help='Transport between the Gateway and Workers.')
+    p.add_argument('--url', default=None, help='URL of a Gateway already running (nothing is started then).')
+    p.add_argument('--gw_args', default='', help='Extra command line arguments of the Gateway.')
+    p.add_argument('--worker_args', default='', help='Extra command line arguments of Workers.')
+    p.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=[SCENARIO_PREDICT],
+        help='Requests made (each scenario in turn).')
+    p.add_argument('--mode', choices=(MODE_OPEN, MODE_CLOSED), default=MODE_CLOSED,
+        help='Open-loop (requests sent at the rate) or closed-loop (requests sent by the clients) load.')
+    p.add_argument('--rps', type=float, default=200.0, help='Requests per second of the open-loop load.')
+    p.add_argument('--concurrency', type=int, default=16,
+        help='Clients of the closed-loop load, maximum connections of the open-loop load.')
+    p.add_argument('--duration_s', type=float, default=10.0, help='Duration of every scenario.')
+    p.add_argument('--warmup_s', type=float, default=2.0, help='Time requests are made before the measurement.')
+    p.add_argument('--output', default=None, help='File the results are saved to (printed otherwise).')
+    p.add_argument('--baseline', default=None, help='File of the results to compare with.')
+    p.add_argument('--tolerance', type=float, default=10.0,
+        help='Change of throughput and latency (in percents) counted as a regression.')
+    args = p.parse_args()
+
+    results = trio.run(run, args)
+
+    comparison = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            comparison = compare(results, json.load(f), args.tolerance)
+        results['comparison'] = comparison
+
+    print_summary(results, comparison)
+
+    text = json.dumps(results, indent=2)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if comparison is not None and len(comparison['regressions']) > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
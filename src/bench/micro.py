@@ -0,0 +1,240 @@
+"""
+Micro-benchmarks of the components on the path of every request.
+
+# Run the benchmarks from the 'src' directory with:
+    python -m bench.micro
+
+# Run the benchmarks of the frames only, saved as the baseline:
+    python -m bench.micro --filter frame --output baseline.json
+
+# The same benchmarks compared with the baseline (exits with 1 on a regression):
+    python -m bench.micro --filter frame --baseline baseline.json
+
+Command line arguments:
+
+--filter          specifies the substring of the names of the benchmarks run.
+--time_ms         specifies the time of a single measurement (in milliseconds).
+--repeat          specifies the number of measurements made.
+--warmup_ms       specifies the time the benchmark is run before the measurements (in milliseconds).
+--output          specifies the file the results are saved to as JSON (printed otherwise).
+--baseline        specifies the file of the results to compare with.
+--tolerance       specifies the growth of the median time (in percents) counted as a regression.
+
+Every measurement calls the benchmark as many times as fit to the measurement time
+(with the garbage collection disabled), the median time of a call is compared.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+import uuid
+
+from typing import Any, Callable, Dict, Optional
+
+from core.defaults import Defaults
+
+def setup_message_helper_cmd_status() -> Callable:
+    from core.msg_helper import MessageHelper
+    return lambda: MessageHelper.cmd_status
+
+def setup_message_helper_server_busy() -> Callable:
+    from core.msg_helper import MessageHelper
+    return lambda: MessageHelper.api_response_server_busy
+
+def setup_message_helper_predict() -> Callable:
+    from core.msg_helper import MessageHelper
+    result = {'status': True, 'message': '0' * 32, 'result': 0.5}
+    return lambda: MessageHelper.api_response_predict(result)
+
+def setup_sliding_window_add_value() -> Callable:
+    from core.sliding_window_stats import SlidingWindowStats
+    stats = SlidingWindowStats()
+    values = [1.0 + i % 97 * 0.37 for i in range(1000)]
+    index = 0
+
+    def add_value():
+        nonlocal index
+        stats.add_value(values[index])
+        index = (index + 1) % len(values)
+    return add_value
+
+def setup_sliding_window_max() -> Callable:
+    from core.sliding_window_stats import SlidingWindowStats
+    stats = SlidingWindowStats(601)
+    for i in range(1000):
+        stats.add_value(1.0 + i % 97 * 0.37)
+    return lambda: stats.max
+
+def setup_frame_encode_request() -> Callable:
+    from core.frame import Frame
+    lengths, data = Frame.pack_vectors([[0.3, 0.7]])
+    request_id = uuid.uuid4().hex
+    return lambda: Frame.encode_request(Frame.KIND_PREDICT, request_id, '', lengths, data, 1000)
+
+def setup_frame_decode_request() -> Callable:
+    from core.frame import Frame
+    lengths, data = Frame.pack_vectors([[0.3, 0.7]])
+    frame = Frame.encode_request(Frame.KIND_PREDICT, uuid.uuid4().hex, '', lengths, data, 1000)
+    return lambda: Frame.decode_request(frame)
+
+def setup_frame_encode_response() -> Callable:
+    from core.frame import Frame
+    request_id = uuid.uuid4().hex
+    results = [(True, '0' * 32, 0.5)]
+    return lambda: Frame.encode_response(request_id, results)
+
+def setup_frame_decode_response() -> Callable:
+    from core.frame import Frame
+    frame = Frame.encode_response(uuid.uuid4().hex, [(True, '0' * 32, 0.5)])
+    return lambda: Frame.decode_response(frame)
+
+def setup_inferencer_predict(optimization: str = 'none') -> Callable:
+    import torch
+    from core.inferencer import Inferencer
+    from core.model import Model
+
+    # Note: the accuracy is not checked, so the random weights are optimized anyway
+    Inferencer.setup(Defaults.WORK_COUNT_MODELS_MAX, Defaults.WORK_SIZE_MODELS_MAX_MB, 
+        optimization, math.inf, Defaults.WORK_COUNT_TORCH_THREADS)
+
+    buffer = io.BytesIO()
+    torch.save(Model(input_dim = 2, output_dim = 1).state_dict(), buffer)
+    inferencer = Inferencer()
+    nn_id = uuid.uuid4().hex
+    # Note: the JSON results are printed to stdout, so the Inferencer's output is passed to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        inferencer.load_weights(nn_id, buffer.getvalue())
+        inferencer.optimize_weights(nn_id)
+
+    v = [0.3, 0.7]
+    return lambda: inferencer.predict(v, nn_id)
+
+def setup_get_local_ips() -> Callable:
+    from core.utility import get_local_ips
+    return get_local_ips
+
+# Name -> the function returning the callable measured
+BENCHMARKS = {
+    'message_helper.cmd_status': setup_message_helper_cmd_status,
+    'message_helper.api_response_server_busy': setup_message_helper_server_busy,
+    'message_helper.api_response_predict': setup_message_helper_predict,
+    'sliding_window_stats.add_value': setup_sliding_window_add_value,
+    'sliding_window_stats.max': setup_sliding_window_max,
+    'frame.encode_request': setup_frame_encode_request,
+    'frame.decode_request': setup_frame_decode_request,
+    'frame.encode_response': setup_frame_encode_response,
+    'frame.decode_response': setup_frame_decode_response,
+    'inferencer.predict': setup_inferencer_predict,
+    'inferencer.predict.script': lambda: setup_inferencer_predict('script'),
+    'inferencer.predict.int8': lambda: setup_inferencer_predict('int8'),
+    'utility.get_local_ips': setup_get_local_ips,
+}
+
+def measure(fn: Callable, time_ms: float, repeat: int, warmup_ms: float) -> Dict[str, Any]:
+    """
+    Returns the statistics of the time of a single fn() call (in nanoseconds).
+    """
+    timer = timeit.Timer(fn)
+
+    # Note: the warmup also finds the number of calls fitting to the measurement time
+    time_end = time.perf_counter() + warmup_ms / 1000
+    count = 1
+    while True:
+        elapsed = timer.timeit(count)
+        if elapsed < time_ms / 1000 / 10:
+            count *= 10
+        elif time.perf_counter() >= time_end:
+            break
+    count = max(1, int(count * time_ms / 1000 / elapsed))
+
+    times_ns = [elapsed_s / count * 1e9 for elapsed_s in timer.repeat(repeat, count)]
+
+    result = {}
+    result['count'] = count
+    result['median_ns'] = statistics.median(times_ns)
+    result['min_ns'] = min(times_ns)
+    result['stdev_ns'] = statistics.stdev(times_ns) if len(times_ns) > 1 else 0.0
+    return result
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> Dict[str, Any]:
+    """
+    Returns the changes (in percents) of the median time of every benchmark found in both results,
+    and the regressions: the median time grown by more than the tolerance.
+    """
+    comparison = {'benchmarks': {}, 'regressions': []}
+    for name, result in results['benchmarks'].items():
+        result_base = baseline.get('benchmarks', {}).get(name)
+        if result_base is None or result_base['median_ns'] == 0:
+            continue
+
+        change = (result['median_ns'] - result_base['median_ns']) / result_base['median_ns'] * 100
+        comparison['benchmarks'][name] = change
+        if change > tolerance:
+            comparison['regressions'].append(f'{name}: {change:+.1f}%')
+    return comparison
+
+def print_summary(results: Dict[str, Any], comparison: Optional[Dict[str, Any]]):
+    """
+    Prints the human readable summary to stderr (the JSON is printed to stdout).
+    """
+    for name, result in results['benchmarks'].items():
+        line = f'{name:42} {result["median_ns"]:12.1f} ns  (min {result["min_ns"]:.1f}, stdev {result["stdev_ns"]:.1f})'
+        if comparison is not None and name in comparison['benchmarks']:
+            line += f'  {comparison["benchmarks"][name]:+.1f}%'
+        print(line, file=sys.stderr)
+
+    if comparison is not None:
+        for regression in comparison['regressions']:
+            print(f'Regression: {regression}', file=sys.stderr)
+
+def main():
+    p = argparse.ArgumentParser(usage=__doc__)
+    p.add_argument('--filter', default='', help='Substring of the names of the benchmarks run.')
+    p.add_argument('--time_ms', type=float, default=200.0, help='Time of a single measurement.')
+    p.add_argument('--repeat', type=int, default=7, help='Measurements made.')
+    p.add_argument('--warmup_ms', type=float, default=200.0, help='Time the benchmark is run before the measurements.')
+    p.add_argument('--output', default=None, help='File the results are saved to (printed otherwise).')
+    p.add_argument('--baseline', default=None, help='File of the results to compare with.')
+    p.add_argument('--tolerance', type=float, default=10.0,
+        help='Growth of the median time (in percents) counted as a regression.')
+    args = p.parse_args()
+
+    results = {}
+    results['config'] = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    results['host'] = {'platform': platform.platform(), 'python': platform.python_version(),
+        'cpu_count': os.cpu_count()}
+    results['time'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    results['benchmarks'] = {}
+
+    for name, setup in BENCHMARKS.items():
+        if args.filter in name:
+            results['benchmarks'][name] = measure(setup(), args.time_ms, args.repeat, args.warmup_ms)
+
+    comparison = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            comparison = compare(results, json.load(f), args.tolerance)
+        results['comparison'] = comparison
+
+    print_summary(results, comparison)
+
+    text = json.dumps(results, indent=2)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if comparison is not None and len(comparison['regressions']) > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
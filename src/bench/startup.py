@@ -0,0 +1,339 @@
+"""
+Startup time and memory of the Gateway and Worker processes.
+
+# Run the benchmark from the 'src' directory with:
+    python -m bench.startup
+
+# The same, saved as the baseline:
+    python -m bench.startup --output baseline.json
+
+# The same compared with the baseline (exits with 1 on a regression):
+    python -m bench.startup --baseline baseline.json
+
+Command line arguments:
+
+--components      specifies the processes measured: gw and worker.
+--repeat          specifies the number of times every process is started.
+--gw_args         specifies the extra command line arguments of the Gateway.
+--worker_args     specifies the extra command line arguments of the Worker.
+--output          specifies the file the results are saved to as JSON (printed otherwise).
+--baseline        specifies the file of the results to compare with.
+--tolerance       specifies the growth of the time and memory (in percents) counted as a regression.
+
+For every process measured:
+    import_s      the time to start the interpreter and import the module (without running it),
+    ready_s       the time from the start to the process is ready: the Gateway responds to /status
+                  and all its processes (--processes in --gw_args) listen at the REST port,
+                  the Worker is connected to the Gateway (the Gateway is started once beforehand),
+    rss_mb        the resident memory of the process ready (with its child processes),
+    heavy_modules the heavy modules (see HEAVY_MODULES) imported by the module.
+The times and memory reported are the medians. A heavy module imported anew is a regression as well.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+
+from typing import Any, Dict, List, Optional, Set
+
+from bench.load import get_free_port
+
+COMPONENT_GW = 'gw'
+COMPONENT_WORKER = 'worker'
+
+COMPONENTS = (COMPONENT_GW, COMPONENT_WORKER)
+
+# Note: the Gateway never runs NNs, so none of these are expected to be imported by it
+HEAVY_MODULES = ('torch', 'numpy')
+
+STARTUP_TIMEOUT_S = 60.0
+POLL_INTERVAL_S = 0.01
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def get_status(port: int) -> Optional[Dict[str, Any]]:
+    """
+    Returns the /status of the Gateway, or None when it's not responding yet.
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1.0)
+    try:
+        connection.request('GET', '/status')
+        response = connection.getresponse()
+        if response.status != 200:
+            return None
+        return json.loads(response.read())
+    except (OSError, ValueError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+
+def wait_for(predicate, process: subprocess.Popen) -> float:
+    """
+    Waits until predicate() is true, returns the time waited (in seconds).
+    """
+    time_start = time.perf_counter()
+    while not predicate():
+        if process.poll() is not None:
+            raise RuntimeError(f'process exited with {process.returncode}: {shlex.join(process.args)}')
+        if time.perf_counter() - time_start > STARTUP_TIMEOUT_S:
+            raise RuntimeError(f'process is not ready in {STARTUP_TIMEOUT_S} s: {shlex.join(process.args)}')
+        time.sleep(POLL_INTERVAL_S)
+    return time.perf_counter() - time_start
+
+def get_rss_mb(pid: int) -> float:
+    """
+    Returns the resident memory of the process and its descendants (in MiB, Linux only, 0 elsewhere).
+    """
+    if not os.path.isdir('/proc'):
+        return 0.0
+
+    children = {}
+    rss_kb = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/status') as f:
+                fields = dict(line.split(':', 1) for line in f if ':' in line)
+        except OSError:
+            # The process has exited meanwhile
+            continue
+        children.setdefault(int(fields['PPid']), []).append(int(entry))
+        rss_kb[int(entry)] = int(fields.get('VmRSS', '0 kB').split()[0])
+
+    total_kb = 0
+    pids = [pid]
+    while len(pids) > 0:
+        p = pids.pop()
+        total_kb += rss_kb.get(p, 0)
+        pids.extend(children.get(p, []))
+    return total_kb / 1024
+
+def get_listening_pids(port: int) -> Set[int]:
+    """
+    Returns the processes listening at the TCP port (Linux only, empty elsewhere).
+    """
+    if not os.path.isdir('/proc'):
+        return set()
+
+    inodes = set()
+    for table in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(table) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    # Note: 0A is the LISTEN state
+                    if int(fields[1].rsplit(':', 1)[1], 16) == port and fields[3] == '0A':
+                        inodes.add(fields[9])
+        except OSError:
+            continue
+
+    pids = set()
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            fds = os.listdir(f'/proc/{entry}/fd')
+        except OSError:
+            # The process has exited meanwhile (or is not accessible)
+            continue
+        for fd in fds:
+            try:
+                link = os.readlink(f'/proc/{entry}/fd/{fd}')
+            except OSError:
+                continue
+            if link.startswith('socket:[') and link[8:-1] in inodes:
+                pids.add(int(entry))
+                break
+    return pids
+
+def count_gw_processes(gw_args: List[str]) -> int:
+    p = argparse.ArgumentParser(add_help=False)
+    p.add_argument('--processes', type=int, default=1)
+    return p.parse_known_args(gw_args)[0].processes
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    process.wait()
+
+def measure_import(module: str) -> Dict[str, Any]:
+    """
+    Returns the time to import the module in a new interpreter and the heavy modules imported by it.
+    """
+    code = f'import json, sys; import {module}; ' \
+        f'print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))'
+    time_start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], cwd=SRC, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    return {'import_s': time.perf_counter() - time_start, 'heavy_modules': json.loads(output)}
+
+class Addresses:
+    """
+    The free addresses the Gateway (and the Worker) are started with.
+    """
+
+    def __init__(self):
+        self.port = get_free_port()
+        self.args = ['--addr_service', f'tcp://127.0.0.1:{get_free_port()}',
+            '--addr_worker', f'tcp://127.0.0.1:{get_free_port()}']
+
+    @property
+    def gw_args(self) -> List[str]:
+        return ['--addr_rest', f'127.0.0.1:{self.port}'] + self.args
+
+def start(script: str, args: List[str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, os.path.join(SRC, script)] + args, cwd=SRC,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def measure_gw(gw_args: List[str]) -> Dict[str, float]:
+    addrs = Addresses()
+    count_processes = count_gw_processes(gw_args)
+
+    def is_ready() -> bool:
+        if get_status(addrs.port) is None:
+            return False
+        # Note: every Gateway process serves the REST API, not only the first one
+        return not os.path.isdir('/proc') or len(get_listening_pids(addrs.port)) >= count_processes
+
+    process = start('gw.py', addrs.gw_args + gw_args)
+    try:
+        ready_s = wait_for(is_ready, process)
+        return {'ready_s': ready_s, 'rss_mb': get_rss_mb(process.pid)}
+    finally:
+        stop(process)
+
+def measure_worker(addrs: Addresses, gw: subprocess.Popen, worker_args: List[str]) -> Dict[str, float]:
+    def count_workers() -> int:
+        status = get_status(addrs.port)
+        return 0 if status is None else status.get('workers_count', 0)
+
+    process = start('worker.py', addrs.args + worker_args)
+    try:
+        ready_s = wait_for(lambda: count_workers() > 0, process)
+        return {'ready_s': ready_s, 'rss_mb': get_rss_mb(process.pid)}
+    finally:
+        stop(process)
+        # The next Worker is started once the Gateway is told this one has gone
+        wait_for(lambda: count_workers() == 0, gw)
+
+def summarize(measurements: List[Dict[str, float]]) -> Dict[str, float]:
+    return {key: statistics.median(m[key] for m in measurements) for key in measurements[0]}
+
+def run(args) -> Dict[str, Any]:
+    results = {}
+    results['config'] = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    results['host'] = {'platform': platform.platform(), 'python': platform.python_version(),
+        'cpu_count': os.cpu_count()}
+    results['time'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    results['components'] = {}
+
+    gw_args = shlex.split(args.gw_args)
+    worker_args = shlex.split(args.worker_args)
+
+    for component in args.components:
+        imports = [measure_import(component) for _ in range(args.repeat)]
+        if component == COMPONENT_GW:
+            measurements = [measure_gw(gw_args) for _ in range(args.repeat)]
+        else:
+            addrs = Addresses()
+            gw = start('gw.py', addrs.gw_args + gw_args)
+            try:
+                wait_for(lambda: get_status(addrs.port) is not None, gw)
+                measurements = [measure_worker(addrs, gw, worker_args) for _ in range(args.repeat)]
+            finally:
+                stop(gw)
+
+        result = summarize(measurements)
+        result['import_s'] = statistics.median(i['import_s'] for i in imports)
+        result['heavy_modules'] = imports[0]['heavy_modules']
+        results['components'][component] = result
+
+    return results
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> Dict[str, Any]:
+    """
+    Returns the changes (in percents) of the time and memory of every process found in both results,
+    and the regressions: the time or memory grown by more than the tolerance, the heavy modules imported anew.
+    """
+    comparison = {'components': {}, 'regressions': []}
+    for component, result in results['components'].items():
+        result_base = baseline.get('components', {}).get(component)
+        if result_base is None:
+            continue
+
+        changes = {}
+        for key in ('import_s', 'ready_s', 'rss_mb'):
+            if result_base[key] == 0:
+                continue
+            changes[key] = (result[key] - result_base[key]) / result_base[key] * 100
+            if changes[key] > tolerance:
+                comparison['regressions'].append(f'{component}: {key} {changes[key]:+.1f}%')
+        comparison['components'][component] = changes
+
+        for module in set(result['heavy_modules']) - set(result_base['heavy_modules']):
+            comparison['regressions'].append(f'{component}: imports {module}')
+    return comparison
+
+def print_summary(results: Dict[str, Any], comparison: Optional[Dict[str, Any]]):
+    """
+    Prints the human readable summary to stderr (the JSON is printed to stdout).
+    """
+    for component, result in results['components'].items():
+        changes = {} if comparison is None else comparison['components'].get(component, {})
+
+        def change(key: str) -> str:
+            return f' ({changes[key]:+.1f}%)' if key in changes else ''
+
+        heavy_modules = ', '.join(result['heavy_modules']) or 'none'
+        print(f'{component:8} import {result["import_s"] * 1000:8.1f} ms{change("import_s")}'
+            f'  ready {result["ready_s"] * 1000:8.1f} ms{change("ready_s")}'
+            f'  RSS {result["rss_mb"]:7.1f} MiB{change("rss_mb")}'
+            f'  heavy modules: {heavy_modules}', file=sys.stderr)
+
+    if comparison is not None:
+        for regression in comparison['regressions']:
+            print(f'Regression: {regression}', file=sys.stderr)
+
+def main():
+    p = argparse.ArgumentParser(usage=__doc__)
+    p.add_argument('--components', nargs='+', choices=COMPONENTS, default=list(COMPONENTS),
+        help='Processes measured.')
+    p.add_argument('--repeat', type=int, default=5, help='Times every process is started.')
+    p.add_argument('--gw_args', default='', help='Extra command line arguments of the Gateway.')
+    p.add_argument('--worker_args', default='', help='Extra command line arguments of the Worker.')
+    p.add_argument('--output', default=None, help='File the results are saved to (printed otherwise).')
+    p.add_argument('--baseline', default=None, help='File of the results to compare with.')
+    p.add_argument('--tolerance', type=float, default=10.0,
+        help='Growth of the time and memory (in percents) counted as a regression.')
+    args = p.parse_args()
+
+    results = run(args)
+
+    comparison = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            comparison = compare(results, json.load(f), args.tolerance)
+        results['comparison'] = comparison
+
+    print_summary(results, comparison)
+
+    text = json.dumps(results, indent=2)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if comparison is not None and len(comparison['regressions']) > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
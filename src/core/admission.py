@@ -0,0 +1,200 @@
+"""
+Admission control of the prediction requests on the Gateway.
+
+"""
+
+import math
+import trio
+
+from collections import OrderedDict, deque
+from typing import Any, List
+
+from core.metrics import Counter, Metrics
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BULK = 'bulk'
+
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+class RequestShed(Exception):
+    """
+    Raised when the request is shed by the admission queue.
+    """
+
+class RateLimiter:
+    """
+    Per-client token buckets: every client may send up to burst requests at once
+    and up to rate requests per second on average.
+
+    Only count_clients_max recently seen clients are remembered.
+    """
+
+    def __init__(self, rate: float, burst: int, count_clients_max: int):
+        assert rate >= 0, \
+            f"rate should not be negative, got: {rate}"
+        assert burst > 0, \
+            f"burst should be greater than 0, got: {burst}"
+
+        self.__rate = rate
+        self.__burst = burst
+        self.__count_clients_max = count_clients_max
+
+        # Client -> (tokens, time of the last update)
+        self.__buckets = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.__rate > 0
+
+    def allow(self, client: str) -> bool:
+        """
+        Takes a token from the client's bucket. Returns False when the bucket is empty.
+        """
+        if self.__rate == 0:
+            return True
+
+        time_now = trio.current_time()
+        tokens, time_update = self.__buckets.pop(client, (self.__burst, time_now))
+        tokens = min(self.__burst, tokens + (time_now - time_update) * self.__rate)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+
+        self.__buckets[client] = (tokens, time_now)
+        if len(self.__buckets) > self.__count_clients_max:
+            self.__buckets.popitem(last=False)
+        return allowed
+
+class _CoDel:
+    """
+    Controlled Delay (CoDel) shedding policy: once the time spent in the queue stays
+    above the target for the interval, the requests are shed at the rate growing
+    as the square root of the number of requests shed, until the queue time falls below the target.
+    """
+
+    def __init__(self, target_s: float, interval_s: float):
+        self.__target_s = target_s
+        self.__interval_s = interval_s
+
+        self.__time_first_above = 0.0
+        self.__dropping = False
+        self.__count = 0
+        self.__time_drop_next = 0.0
+
+    def should_drop(self, sojourn_s: float, time_now: float) -> bool:
+        ok_to_drop = False
+        if sojourn_s < self.__target_s:
+            self.__time_first_above = 0.0
+        elif self.__time_first_above == 0.0:
+            self.__time_first_above = time_now + self.__interval_s
+        elif time_now >= self.__time_first_above:
+            ok_to_drop = True
+
+        if self.__dropping:
+            if not ok_to_drop:
+                self.__dropping = False
+            elif time_now >= self.__time_drop_next:
+                self.__count += 1
+                self.__time_drop_next = self.__control_law(self.__time_drop_next)
+                return True
+            return False
+
+        if ok_to_drop:
+            self.__dropping = True
+            # Note: the shedding rate reached recently is resumed
+            if self.__count > 2 and time_now - self.__time_drop_next < 16 * self.__interval_s:
+                self.__count -= 2
+            else:
+                self.__count = 1
+            self.__time_drop_next = self.__control_law(time_now)
+            return True
+        return False
+
+    def __control_law(self, time: float) -> float:
+        return time + self.__interval_s / math.sqrt(self.__count)
+
+class AdmissionQueue:
+    """
+    Queue of the prediction requests with priority classes: interactive requests
+    are always passed to the cluster before bulk ones.
+
+    Every priority class has a room of its own, so bulk requests never take the room of interactive ones.
+    Requests are rejected when the room of their class is full and shed (responded with None) by
+    the CoDel policy of their class when they wait in the queue for too long.
+
+    The requests put together (the shards of a batch) are queued as a whole: the time they wait is
+    measured until the first of them is passed to the cluster, and they are shed all together.
+    """
+
+    def __init__(self, size: int, codel_target_ms: float, codel_interval_ms: float):
+        assert size > 0, \
+            f"queue size should be greater than 0, got: {size}"
+
+        self.__size = size
+        # Every entry is the time the requests are put at and the requests left
+        self.__queues = {priority: deque() for priority in PRIORITIES}
+        self.__counts = {priority: 0 for priority in PRIORITIES}
+
+        self.__codels = None
+        if codel_target_ms > 0:
+            self.__codels = {priority: _CoDel(codel_target_ms / 1000, codel_interval_ms / 1000)
+                for priority in PRIORITIES}
+
+        self.__lot = trio.lowlevel.ParkingLot()
+
+    @property
+    def size(self) -> int:
+        """
+        Returns the room of every priority class.
+        """
+        return self.__size
+
+    @property
+    def count(self) -> int:
+        return sum(self.__counts.values())
+
+    def count_by_priority(self, priority: str) -> int:
+        return self.__counts[priority]
+
+    def put(self, requests: List[Any], priority: str) -> bool:
+        """
+        Puts all the requests to the queue, or none of them when there is no room.
+        """
+        if self.__counts[priority] + len(requests) > self.__size:
+            return False
+
+        self.__queues[priority].append((trio.current_time(), deque(requests)))
+        self.__counts[priority] += len(requests)
+        self.__lot.unpark(count=len(requests))
+        return True
+
+    async def get(self) -> Any:
+        """
+        Returns the next request to pass to the cluster.
+        """
+        while True:
+            for priority in PRIORITIES:
+                queue = self.__queues[priority]
+                while len(queue) > 0:
+                    time_put, requests = queue[0]
+                    if time_put is not None:
+                        # The first request of those put together: they are admitted (or shed) at once
+                        time_now = trio.current_time()
+                        if self.__codels is not None and \
+                                self.__codels[priority].should_drop(time_now - time_put, time_now):
+                            queue.popleft()
+                            self.__counts[priority] -= len(requests)
+                            Metrics().inc(Counter.REQUESTS_SHED, len(requests))
+                            for request in requests:
+                                request.reply(None)
+                            continue
+                        queue[0] = (None, requests)
+
+                    request = requests.popleft()
+                    if len(requests) == 0:
+                        queue.popleft()
+                    self.__counts[priority] -= 1
+                    return request
+
+            await self.__lot.park()
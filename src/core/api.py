@@ -4,86 +4,323 @@ REST API running on a Gateway
 """
 
 import base64
+import binascii
 import json
+import math
+import time
+import trio
 
-from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 from starlette.applications import Starlette
-from starlette.requests import Request
-from starlette.responses import JSONResponse
-from starlette.routing import Route
+from starlette.requests import HTTPConnection, Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket
 from starlette.datastructures import UploadFile
 from starlette.exceptions import HTTPException
 
+from core.admission import PRIORITIES, PRIORITY_BULK, PRIORITY_INTERACTIVE, AdmissionQueue, RateLimiter, RequestShed
 from core.app_stats import ApplicationStatistics
+from core.defaults import Defaults
+from core.frame import Frame
+from core.metrics import Counter, Metrics, Stage
 from core.msg_helper import MessageHelper
+from core.optimization import OPTIMIZATIONS
+from core.peers import Peers
+from core.pending import PendingRequest
+from core.result_cache import ResultCache
+from core.router import Router
+from core.weights import read_base64_upload
 
 class APIGateway(Starlette):
     """ 
     REST API implementation
+
+    Every prediction request has a deadline: the request is cancelled when it's not handled
+    in time (or when the client disconnects) and is dropped by the cluster if not handled yet.
+
+    Prediction requests are admitted with the per-client rate limit (429 when exceeded)
+    and queued by priority: /predict requests are interactive and /predict_batch ones are bulk
+    by default. The requests are rejected (503) when the queue is full or shed by the queue
+    when they wait for too long.
+
+    /status and /metrics cover all the Gateway processes: the other ones are surveyed through peers.
     """
 
-    def __init__(self, 
-        chan_service_send_api2cluster, chan_service_receive_cluster2api,
-        chan_compute_send_api2cluster, chan_compute_receive_cluster2api):
+    # Request timeout in milliseconds, the Gateway's default one is used when not set
+    HEADER_TIMEOUT = 'X-Request-Timeout-Ms'
+
+    # Client the rate limit is applied to, the client's address is used when not set
+    HEADER_CLIENT = 'X-Client-Id'
+
+    # Priority class of the request: interactive or bulk
+    HEADER_PRIORITY = 'X-Priority'
+
+    # Maximum number of predictions of a stream handled at once
+    STREAM_IN_FLIGHT_MAX = 64
+
+    def __init__(self, chan_service_send_api2cluster, admission: AdmissionQueue, rate_limiter: RateLimiter,
+        shard_size: int, result_cache: ResultCache, router: Router, peers: Peers, request_timeout_ms: int):
 
         super().__init__(routes=[
             Route('/status', self.__status, methods=['GET']),
+            Route('/metrics', self.__metrics, methods=['GET']),
             Route('/predict', self.__predict, methods=['POST']),
+            Route('/predict_batch', self.__predict_batch, methods=['POST']),
+            WebSocketRoute('/predict_stream', self.__predict_stream),
             Route('/set_weights', self.__set_weights, methods=['PUT'])
         ])
 
         self.__chan_service_send_api2cluster = chan_service_send_api2cluster
-        self.__chan_service_receive_cluster2api = chan_service_receive_cluster2api
+        self.__admission = admission
+        self.__rate_limiter = rate_limiter
 
-        self.__chan_compute_send_api2cluster = chan_compute_send_api2cluster
-        self.__chan_compute_receive_cluster2api = chan_compute_receive_cluster2api
+        self.__shard_size = shard_size
+        self.__result_cache = result_cache
+        self.__router = router
+        self.__peers = peers
+        self.__request_timeout_ms = request_timeout_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns the status and metrics of this Gateway process.
+        """
+        return MessageHelper.gw_snapshot(
+            self.__peers.index,
+            self.__admission,
+            ApplicationStatistics().export(ApplicationStatistics.REQ_HANDLING_TIME),
+            self.__result_cache,
+            self.__router.workers,
+            Metrics().snapshot())
 
     async def __status(self, request: Request) -> JSONResponse:
         """
         /status handler
+
+        Responds from memory: the Workers push their statuses with heartbeats
+        (every Gateway process is connected to all the Workers).
         """
-        stats = self.__chan_service_send_api2cluster.statistics()
-        if stats.current_buffer_used == stats.max_buffer_size:
-            # Return 503 Service Unavailable
-            return JSONResponse(MessageHelper.response_server_busy, status_code=503)
+        snapshots = await self.__snapshots()
+
+        # Return 200 OK
+        return JSONResponse(MessageHelper.api_response_status(
+            snapshots, [w.status for w in self.__router.members]), status_code=200)
 
-        await self.__chan_service_send_api2cluster.send(MessageHelper.cmd_status)
-        async for item in self.__chan_service_receive_cluster2api:
-            # Return 200 OK
-            return JSONResponse(json.loads(item), status_code=200)
+    async def __metrics(self, request: Request) -> PlainTextResponse:
+        """
+        /metrics handler
+
+        Responds with the metrics of the Gateway and Workers (passed with heartbeats) in the Prometheus text format.
+        """
+        snapshots = await self.__snapshots()
+
+        text = Metrics.render('pipeline_gateway', 
+            [({}, Metrics.merge([snapshot['metrics'] for snapshot in snapshots]))])
+        text += Metrics.render('pipeline_worker', 
+            [({'worker': w.address}, w.metrics) for w in self.__router.members])
+
+        # Return 200 OK
+        return PlainTextResponse(text, status_code=200, media_type='text/plain; version=0.0.4')
 
     async def __predict(self, request: Request) -> JSONResponse:
         """
         /predict handler
         """
-        stats = self.__chan_compute_send_api2cluster.statistics()
-        if stats.current_buffer_used == stats.max_buffer_size:
+        metrics = Metrics()
+
+        time_start = time.perf_counter()
+
+        deadline = APIGateway.__get_deadline(self.__get_timeout_ms(request))
+        priority = APIGateway.__get_priority(request, PRIORITY_INTERACTIVE)
+
+        if not self.__rate_limiter.allow(APIGateway.__get_client(request)):
+            metrics.inc(Counter.REQUESTS_THROTTLED)
+            # Return 429 Too Many Requests
+            return JSONResponse(json.loads(MessageHelper.api_response_rate_limited), status_code=429)
+
+        try:
+            payload = await request.json()
+        except ValueError:
+            # Note: the body that's not UTF-8 fails to decode before it's parsed
+            raise HTTPException(status_code=400, detail='cannot parse request body')
+
+        nn_id, lengths, data = APIGateway.__parse_vector(payload)
+
+        metrics.observe(Stage.API_PARSE, time.perf_counter() - time_start)
+
+        async def predict():
+            return await self.__predict_vector(nn_id, lengths, data, deadline, priority)
+
+        try:
+            result = await APIGateway.__run_until(request, deadline, predict)
+        except RequestShed:
             # Return 503 Service Unavailable
-            return JSONResponse(MessageHelper.response_server_busy, status_code=503)
+            return JSONResponse(json.loads(MessageHelper.api_response_server_busy), status_code=503)
+        if result is None:
+            metrics.inc(Counter.REQUESTS_EXPIRED)
+            # Return 504 Gateway Timeout
+            return JSONResponse(json.loads(MessageHelper.api_response_deadline_exceeded), status_code=504)
 
-        stats = ApplicationStatistics()
-        req_handling_time_stats = stats.get_stats_holder(ApplicationStatistics.REQ_HANDLING_TIME)
+        APIGateway.__record(time_start, [result])
 
-        time_start = datetime.now()
+        # Return 200 OK
+        return JSONResponse(MessageHelper.api_response_predict(result), status_code=200)
+
+    async def __predict_stream(self, websocket: WebSocket):
+        """
+        /predict_stream handler
+
+        Every message is a prediction request tagged with an id chosen by the client, the results
+        are sent back with the same ids as soon as they are made (not in the order of the requests).
+        While STREAM_IN_FLIGHT_MAX predictions are handled, the next messages are not read.
+        """
+        metrics = Metrics()
+
+        try:
+            timeout_ms = self.__get_timeout_ms(websocket)
+            priority = APIGateway.__get_priority(websocket, PRIORITY_INTERACTIVE)
+        except HTTPException as e:
+            # Note: the connection is refused (403 Forbidden)
+            await websocket.close(code=1008, reason=e.detail)
+            return
+        client = APIGateway.__get_client(websocket)
+
+        await websocket.accept()
+
+        chan_results_send, chan_results_receive = trio.open_memory_channel(APIGateway.STREAM_IN_FLIGHT_MAX)
+        semaphore = trio.Semaphore(APIGateway.STREAM_IN_FLIGHT_MAX)
+
+        async def send_results():
+            async for response in chan_results_receive:
+                await websocket.send_text(json.dumps(response))
+
+        async def reply(tag: Any, result: Dict[str, Any]):
+            await chan_results_send.send(MessageHelper.api_response_predict_stream(tag, result))
+
+        async def predict(tag: Any, nn_id: str, lengths: List[int], data: bytes, time_start: float):
+            deadline = APIGateway.__get_deadline(timeout_ms)
+            result = None
+            try:
+                with trio.move_on_at(deadline):
+                    result = await self.__predict_vector(nn_id, lengths, data, deadline, priority)
+            except RequestShed:
+                result = MessageHelper.result_failed(MessageHelper.MESSAGE_SERVER_BUSY)
+            finally:
+                semaphore.release()
+
+            if result is None:
+                metrics.inc(Counter.REQUESTS_EXPIRED)
+                result = MessageHelper.result_failed(MessageHelper.MESSAGE_DEADLINE_EXCEEDED)
+            else:
+                APIGateway.__record(time_start, [result])
+            await reply(tag, result)
+
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(send_results)
+
+            while True:
+                message = await websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+
+                time_start = time.perf_counter()
+                tag = None
+                try:
+                    payload = json.loads(message.get('text') or message.get('bytes') or '')
+                    # Note: the error is reported (with no id) and the next messages are still handled
+                    APIGateway.__check_object(payload)
+                    tag = payload.get('id')
+                    nn_id, lengths, data = APIGateway.__parse_vector(payload)
+                except ValueError:
+                    await reply(tag, MessageHelper.result_failed('cannot parse request'))
+                    continue
+                except HTTPException as e:
+                    await reply(tag, MessageHelper.result_failed(e.detail))
+                    continue
+
+                metrics.observe(Stage.API_PARSE, time.perf_counter() - time_start)
+
+                if not self.__rate_limiter.allow(client):
+                    metrics.inc(Counter.REQUESTS_THROTTLED)
+                    await reply(tag, MessageHelper.result_failed(MessageHelper.MESSAGE_RATE_LIMITED))
+                    continue
+
+                await semaphore.acquire()
+                nursery.start_soon(predict, tag, nn_id, lengths, data, time_start)
+
+            # The client is gone: the predictions not made yet are cancelled
+            nursery.cancel_scope.cancel()
+
+    async def __predict_batch(self, request: Request) -> JSONResponse:
+        """
+        /predict_batch handler
+
+        Splits the vectors to shards, the shards are handled by the Workers in parallel.
+        """
+        metrics = Metrics()
+
+        time_start = time.perf_counter()
+
+        deadline = APIGateway.__get_deadline(self.__get_timeout_ms(request))
+        priority = APIGateway.__get_priority(request, PRIORITY_BULK)
+
+        if not self.__rate_limiter.allow(APIGateway.__get_client(request)):
+            metrics.inc(Counter.REQUESTS_THROTTLED)
+            # Return 429 Too Many Requests
+            return JSONResponse(json.loads(MessageHelper.api_response_rate_limited), status_code=429)
 
         try:
             payload = await request.json()
-            if 'vector' not in payload and 'data' not in payload:
-                # Return 400 Bad Request
-                raise HTTPException(status_code=400, detail='vector or data is required')
-            s = json.dumps(payload)
-        except json.JSONDecodeError:
+        except ValueError:
             raise HTTPException(status_code=400, detail='cannot parse request body')
+        APIGateway.__check_object(payload)
+        if 'vectors' not in payload:
+            # Return 400 Bad Request
+            raise HTTPException(status_code=400, detail='vectors are required')
+        vectors = payload['vectors']
+        if not isinstance(vectors, list) or len(vectors) == 0:
+            # Return 400 Bad Request
+            raise HTTPException(status_code=400, detail='vectors should be a non-empty array')
+
+        nn_id = APIGateway.__get_nn_id(payload)
+
+        shards = [vectors[i:i + self.__shard_size] for i in range(0, len(vectors), self.__shard_size)]
+        if len(shards) > self.__admission.size:
+            # Note: the batch never fits the queue, so it's not worth a retry
+            # Return 413 Payload Too Large
+            raise HTTPException(status_code=413, 
+                detail=f'vectors should be at most {self.__admission.size * self.__shard_size} per batch')
+
+        try:
+            shards = [Frame.pack_vectors(shard) for shard in shards]
+        except TypeError:
+            # Return 400 Bad Request
+            raise HTTPException(status_code=400, detail='vectors should be arrays of numbers')
+
+        metrics.observe(Stage.API_PARSE, time.perf_counter() - time_start)
 
-        await self.__chan_compute_send_api2cluster.send(s)
-        async for item in self.__chan_compute_receive_cluster2api:
-            time_end = datetime.now()
-            time_diff = time_end - time_start
-            delta_ms = time_diff.total_seconds() * 1000
-            req_handling_time_stats.add_value(delta_ms)
+        async def predict_shards():
+            # Note: the shards are admitted all together, so a batch is never handled in part
+            pendings = [PendingRequest((Frame.KIND_PREDICT_BATCH, nn_id, lengths, data, deadline))
+                for lengths, data in shards]
+            return await self.__enqueue(pendings, priority)
 
-            # Return 200 OK
-            return JSONResponse(json.loads(item), status_code=200)
+        try:
+            results_by_shard = await APIGateway.__run_until(request, deadline, predict_shards)
+        except RequestShed:
+            # Return 503 Service Unavailable
+            return JSONResponse(json.loads(MessageHelper.api_response_server_busy), status_code=503)
+        if results_by_shard is None:
+            metrics.inc(Counter.REQUESTS_EXPIRED)
+            # Return 504 Gateway Timeout
+            return JSONResponse(json.loads(MessageHelper.api_response_deadline_exceeded), status_code=504)
+
+        results = [res for shard_results in results_by_shard for res in shard_results]
+
+        APIGateway.__record(time_start, results)
+
+        # Return 200 OK
+        return JSONResponse(MessageHelper.api_response_predict_batch(results), status_code=200)
 
     async def __set_weights(self, request: Request) -> JSONResponse:
         """
@@ -92,7 +329,7 @@ class APIGateway(Starlette):
         stats = self.__chan_service_send_api2cluster.statistics()
         if stats.current_buffer_used == stats.max_buffer_size:
             # Return 503 Service Unavailable
-            return JSONResponse(MessageHelper.response_server_busy, status_code=503)
+            return JSONResponse(json.loads(MessageHelper.api_response_server_busy), status_code=503)
 
         form = await request.form()
 
@@ -104,10 +341,16 @@ class APIGateway(Starlette):
             raise HTTPException(status_code=400, detail='NN id should be a string')
         nn_id = form['nn_id']
 
-        if len(nn_id) != 32 or not all(ch in '0123456789abcdef' for ch in nn_id):
+        if not APIGateway.__is_nn_id(nn_id):
             # Return 400 Bad Request
             raise HTTPException(status_code=400, detail='NN id should contain a lower case UUID string')
 
+        optimization = form.get('optimization', '')
+        if optimization != '' and optimization not in OPTIMIZATIONS:
+            # Return 400 Bad Request
+            raise HTTPException(status_code=400, 
+                detail=f'optimization should be one of: {", ".join(OPTIMIZATIONS)}')
+
         if 'data' not in form:
             # Return 400 Bad Request
             raise HTTPException(status_code=400, detail='weights data is required')
@@ -120,15 +363,194 @@ class APIGateway(Starlette):
             # Return 400 Bad Request
             raise HTTPException(status_code=400, detail='weights data should be a binary file')
 
-        data_b64_bytes = await form['data'].read()
         try:
-            data = base64.standard_b64decode(data_b64_bytes)
-        except base64.binascii.Error as err:
+            weights_file, weights_hash, size = await read_base64_upload(form['data'])
+        except binascii.Error:
             # Return 400 Bad Request
             raise HTTPException(status_code=400, detail='weights data has wrong format')
+
+        count_chunks = (size + Defaults.GW_SIZE_WEIGHTS_CHUNK - 1) // Defaults.GW_SIZE_WEIGHTS_CHUNK
        
-        await self.__chan_service_send_api2cluster.send(
-            MessageHelper.cmd_set_weights(nn_id, data_b64_bytes.decode('utf-8')))
-        async for item in self.__chan_service_receive_cluster2api:
-            # Return 200 OK
-            return JSONResponse(json.loads(item), status_code=200)
+        pending = PendingRequest((
+            MessageHelper.cmd_set_weights(nn_id, weights_hash, size, count_chunks, optimization), weights_file))
+        await self.__chan_service_send_api2cluster.send(pending)
+        item = await pending.wait()
+
+        # Return 200 OK
+        return JSONResponse(json.loads(item), status_code=200)
+
+    async def __snapshots(self) -> List[Dict[str, Any]]:
+        """
+        Returns the snapshots of all the Gateway processes responded, by process index.
+        """
+        snapshots = [self.snapshot()] + await self.__peers.survey(MessageHelper.cmd_status.encode())
+        return sorted(snapshots, key=lambda snapshot: snapshot['gateway'])
+
+    async def __predict_vector(self, nn_id: str, lengths: List[int], data: bytes,
+        deadline: float, priority: str) -> Dict[str, Any]:
+        """
+        Returns the result of the prediction made by the cluster (or taken from the cache).
+
+        Raises RequestShed when the request is rejected or shed by the queue.
+        """
+        async def predict():
+            pending = PendingRequest((Frame.KIND_PREDICT, nn_id, lengths, data, deadline))
+            return (await self.__enqueue([pending], priority))[0][0]
+
+        if self.__result_cache.enabled:
+            return await self.__result_cache.get(nn_id, data, predict)
+        return await predict()
+
+    async def __enqueue(self, pendings: List[PendingRequest], priority: str) -> List[List[Any]]:
+        """
+        Passes the requests to the cluster through the admission queue, returns the results of each request.
+
+        Raises RequestShed when the requests are rejected or shed by the queue.
+        """
+        if not self.__admission.put(pendings, priority):
+            Metrics().inc(Counter.REQUESTS_REJECTED)
+            raise RequestShed()
+
+        try:
+            results = [await pending.wait() for pending in pendings]
+        finally:
+            # Note: the requests not waited for yet are dropped as well when the caller is gone
+            for pending in pendings:
+                pending.abandon()
+        if any(res is None for res in results):
+            raise RequestShed()
+        return results
+
+    def __get_timeout_ms(self, connection: HTTPConnection) -> int:
+        """
+        Returns the time to handle the request (in milliseconds), 0 when there is no limit.
+        """
+        timeout_ms = self.__request_timeout_ms
+        if APIGateway.HEADER_TIMEOUT in connection.headers:
+            try:
+                timeout_ms = int(connection.headers[APIGateway.HEADER_TIMEOUT])
+                if timeout_ms <= 0:
+                    raise ValueError()
+            except ValueError:
+                # Return 400 Bad Request
+                raise HTTPException(status_code=400, 
+                    detail=f'{APIGateway.HEADER_TIMEOUT} should be a positive integer')
+        return timeout_ms
+
+    @staticmethod
+    def __get_deadline(timeout_ms: int) -> float:
+        """
+        Returns the deadline of the request (in terms of trio.current_time), infinity when there is no deadline.
+        """
+        if timeout_ms == 0:
+            return math.inf
+        return trio.current_time() + timeout_ms / 1000
+
+    @staticmethod
+    def __record(time_start: float, results: List[Dict[str, Any]]):
+        """
+        Records the request handling time and the predictions made.
+        """
+        delta_s = time.perf_counter() - time_start
+        ApplicationStatistics().get_stats_holder(ApplicationStatistics.REQ_HANDLING_TIME).add_value(delta_s * 1000)
+
+        metrics = Metrics()
+        metrics.observe(Stage.REQUEST, delta_s)
+        metrics.inc(Counter.PREDICTIONS, len(results))
+        metrics.inc(Counter.PREDICTIONS_FAILED, sum(1 for res in results if not res['status']))
+
+    @staticmethod
+    async def __run_until(request: Request, deadline: float, fn) -> Optional[Any]:
+        """
+        Returns the result of fn, or None when the deadline is passed or the client is disconnected before.
+
+        Raises RequestShed when fn does.
+        """
+        result = None
+        shed = False
+        with trio.move_on_at(deadline):
+            async with trio.open_nursery() as nursery:
+                async def watch_disconnect():
+                    while (await request.receive())['type'] != 'http.disconnect':
+                        pass
+                    nursery.cancel_scope.cancel()
+
+                async def run():
+                    nonlocal result, shed
+                    try:
+                        result = await fn()
+                    except RequestShed:
+                        shed = True
+                    nursery.cancel_scope.cancel()
+
+                nursery.start_soon(watch_disconnect)
+                nursery.start_soon(run)
+
+        if shed:
+            raise RequestShed()
+        return result
+
+    @staticmethod
+    def __get_priority(connection: HTTPConnection, priority_default: str) -> str:
+        priority = connection.headers.get(APIGateway.HEADER_PRIORITY, priority_default)
+        if priority not in PRIORITIES:
+            # Return 400 Bad Request
+            raise HTTPException(status_code=400, 
+                detail=f'{APIGateway.HEADER_PRIORITY} should be one of: {", ".join(PRIORITIES)}')
+        return priority
+
+    @staticmethod
+    def __get_client(connection: HTTPConnection) -> str:
+        if APIGateway.HEADER_CLIENT in connection.headers:
+            return connection.headers[APIGateway.HEADER_CLIENT]
+        if connection.client is None:
+            return ''
+        return connection.client.host
+
+    @staticmethod
+    def __parse_vector(payload: Dict[str, Any]) -> Tuple[str, List[int], bytes]:
+        """
+        Returns the NN id and the packed vector of the prediction request.
+        """
+        APIGateway.__check_object(payload)
+        if 'vector' not in payload and 'data' not in payload:
+            # Return 400 Bad Request
+            raise HTTPException(status_code=400, detail='vector or data is required')
+
+        nn_id = APIGateway.__get_nn_id(payload)
+
+        try:
+            if 'vector' in payload:
+                lengths, data = Frame.pack_vectors([payload['vector']])
+            else:
+                # The data is a Base64 encoded vector of little-endian float32 values
+                lengths, data = Frame.pack_data(base64.standard_b64decode(payload['data']))
+        except (TypeError, ValueError):
+            # Return 400 Bad Request
+            raise HTTPException(status_code=400, detail='vector or data has wrong format')
+        return nn_id, lengths, data
+
+    @staticmethod
+    def __check_object(payload: Any):
+        """
+        Checks the request is a JSON object (any other JSON value is valid as a body, but has no fields).
+        """
+        if not isinstance(payload, dict):
+            # Return 400 Bad Request
+            raise HTTPException(status_code=400, detail='request should be an object')
+
+    @staticmethod
+    def __is_nn_id(nn_id: str) -> bool:
+        return len(nn_id) == 32 and all(ch in '0123456789abcdef' for ch in nn_id)
+
+    @staticmethod
+    def __get_nn_id(payload) -> str:
+        """
+        Returns the optional NN id of the prediction request (empty when the default NN is requested).
+        """
+        APIGateway.__check_object(payload)
+        nn_id = payload.get('nn_id', '')
+        if nn_id != '' and (not isinstance(nn_id, str) or not APIGateway.__is_nn_id(nn_id)):
+            # Return 400 Bad Request
+            raise HTTPException(status_code=400, detail='NN id should contain a lower case UUID string')
+        return nn_id
@@ -3,6 +3,9 @@ Statistics holder.
 
 """
 
+from typing import Any, Dict, List
+
+from core.histogram import LogHistogram
 from core.singleton import Singleton
 from core.sliding_window_stats import SlidingWindowStats
 
@@ -10,6 +13,8 @@ class ApplicationStatistics(metaclass=Singleton):
     NN_INFERENCE_TIME = "nn_inference_time"
     REQ_HANDLING_TIME = "req_handling_time"
 
+    PERCENTILES = (50, 95, 99)
+
     def __init__(self):
         self.__stats = {}
 
@@ -25,6 +30,76 @@ class ApplicationStatistics(metaclass=Singleton):
 
         return self.__stats[key]
 
+    def summary(self, key: str) -> Dict[str, Any]:
+        """
+        Returns the average, percentiles and maximum of the values of the holder: 
+        for the Sliding Window and for each time window (with the rate of values).
+        """
+        return ApplicationStatistics.summarize([self.export(key)])
+
+    def export(self, key: str) -> Dict[str, Any]:
+        """
+        Returns the values of the holder as a JSON serializable object, so the values
+        of several processes are summarized together (see summarize).
+        """
+        holder = self.get_stats_holder(key)
+
+        export = {}
+        export['window'] = ApplicationStatistics.__export_values(
+            holder.histogram, holder.average, holder.max)
+        for window_s in SlidingWindowStats.TIME_WINDOWS_S:
+            snapshot = holder.time_window(window_s)
+            export[f'{window_s}s'] = ApplicationStatistics.__export_values(
+                snapshot.histogram, snapshot.average, snapshot.max, snapshot.window_s)
+        return export
+
+    @staticmethod
+    def summarize(exports: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Returns the summary (see summary) of the values exported by one or more holders.
+        """
+        summary = ApplicationStatistics.__summarize_values([export['window'] for export in exports])
+
+        for window_s in SlidingWindowStats.TIME_WINDOWS_S:
+            summary[f'{window_s}s'] = ApplicationStatistics.__summarize_values(
+                [export[f'{window_s}s'] for export in exports], window_s)
+
+        return summary
+
+    @staticmethod
+    def __export_values(histogram: LogHistogram, average: float, value_max: float, 
+        window_s: float = 0.0) -> Dict[str, Any]:
+
+        values = {}
+        values['count'] = histogram.count
+        values['total'] = average * histogram.count
+        values['max'] = value_max
+        values['window_s'] = window_s
+        values['buckets'] = list(histogram.counts.items())
+        return values
+
+    @staticmethod
+    def __summarize_values(values: List[Dict[str, Any]], window_s: float = 0.0) -> Dict[str, Any]:
+        """
+        Returns the summary of the values, with the count and rate of the values for the time window.
+        """
+        histogram = LogHistogram()
+        for v in values:
+            histogram.add_counts(v['buckets'])
+        count = sum(v['count'] for v in values)
+        value_max = max((v['max'] for v in values), default=0.0)
+
+        # Note: percentiles are approximate, so they are limited by the exact maximum
+        summary = {}
+        if window_s > 0:
+            summary['count'] = count
+            summary['rate'] = count / max((v['window_s'] for v in values), default=window_s)
+        summary['avg'] = sum(v['total'] for v in values) / count if count > 0 else 0.0
+        for q in ApplicationStatistics.PERCENTILES:
+            summary[f'p{q}'] = min(histogram.percentile(q), value_max)
+        summary['max'] = value_max
+        return summary
+
     @staticmethod
     def setup_for_gw():
         """
@@ -32,3 +32,27 @@ def classproperty(func):
         func = classmethod(func)
 
     return ClassPropertyDescriptor(func)
+
+class CachedClassPropertyDescriptor(ClassPropertyDescriptor):
+    """
+    The class property computed once: for the values which never change.
+
+    The value computed replaces the descriptor in the class, 
+    so it's read as a plain class attribute since then.
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, klass=None):
+        if klass is None:
+            klass = type(obj)
+        value = super().__get__(obj, klass)
+        setattr(klass, self.name, value)
+        return value
+
+def cached_classproperty(func):
+    if not isinstance(func, (classmethod, staticmethod)):
+        func = classmethod(func)
+
+    return CachedClassPropertyDescriptor(func)
@@ -6,3 +6,6 @@ System's internal commands support.
 class Command:
     STATUS = 'status'
     SET_WEIGHTS = 'set_weights'
+    SET_WEIGHTS_CHUNK = 'set_weights_chunk'
+    SET_WEIGHTS_END = 'set_weights_end'
+    INVALIDATE_RESULTS = 'invalidate_results'
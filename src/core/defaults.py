@@ -7,9 +7,57 @@ class Defaults:
     ADDR_REST = '127.0.0.1:54321'
     ADDR_SERVICE = 'tcp://127.0.0.1:54000'
     ADDR_WORKER = 'tcp://127.0.0.1:54001'
+    ADDR_PEERS = 'tcp://127.0.0.1:54002'
+
+    # The port of every next Gateway process is greater by the step (see addr_for_process)
+    ADDR_PORT_STEP = 10
+
+    GW_COUNT_PROCESSES = 1
+    GW_PEERS_SURVEY_TIME_MS = 200
 
     GW_SIZE_QUEUE_SERVICE = 2
-    GW_SIZE_QUEUE_COMPUTE = 3
+    GW_SIZE_QUEUE_COMPUTE = 256
+    GW_COUNT_DISPATCHERS = 8
+    GW_SIZE_SHARD = 64
+    GW_ROUTING = 'least_outstanding'
+    GW_LATENCY_EWMA_ALPHA = 0.2
+    GW_HEARTBEAT_EXPIRY_MS = 3000
+    GW_REQUEST_TIMEOUT_MS = 10000
+    GW_ATTEMPT_TIMEOUT_MS = 2000
+    GW_COUNT_RETRIES = 1
+    GW_HEDGE_PERCENTILE = 95
+    GW_HEDGE_BUDGET = 0.0
+
+    GW_CODEL_TARGET_MS = 50.0
+    GW_CODEL_INTERVAL_MS = 100.0
+    GW_CLIENT_RATE = 0.0
+    GW_CLIENT_BURST = 50
+    GW_COUNT_CLIENTS_MAX = 10000
+
+    GW_SIZE_RESULT_CACHE = 0
+    GW_RESULT_CACHE_TTL_S = 60.0
+
+    GW_SURVEY_TIME_MS = 500
+    GW_WEIGHTS_SURVEY_TIME_MS = 3000
+    GW_SIZE_WEIGHTS_CHUNK = 1024 * 1024
+    GW_WEIGHTS_COMPRESSION = 'zstd'
     
+    WORK_COUNT_GATEWAYS = 1
+    WORK_COUNT_RECEIVERS = 8
+    WORK_SIZE_BATCH_MAX = 1
+    WORK_BATCH_WAIT_MS = 2.0
+    WORK_COUNT_THREADS = 4
+
+    WORK_COUNT_MODELS_MAX = 8
+    WORK_SIZE_MODELS_MAX_MB = 0
+
+    WORK_OPTIMIZATION = 'none'
+    WORK_OPTIMIZATION_TOLERANCE = 0.05
+    WORK_COUNT_TORCH_THREADS = 0
+
+    WORK_CACHE_DIR = ''
+
+    WORK_HEARTBEAT_INTERVAL_MS = 1000
+
     WORK_RECONNECT_TIME_MIN_MS = 1000
     WORK_RECONNECT_TIME_MAX_MS = 5000
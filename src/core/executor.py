@@ -0,0 +1,38 @@
+"""
+Executor for the blocking calls made by async tasks.
+
+"""
+
+import trio
+
+from typing import Any, Callable
+
+class Executor:
+    """
+    Runs blocking calls (like the NN inference) either right in the trio event loop 
+    or in a pool of threads, so the event loop stays responsive while the call is running.
+    """
+
+    def __init__(self, count_threads: int):
+        assert count_threads >= 0, \
+            f"threads count should not be negative, got: {count_threads}"
+
+        if count_threads > 0:
+            self.__limiter = trio.CapacityLimiter(count_threads)
+        else:
+            self.__limiter = None
+
+    @property
+    def count_threads(self) -> int:
+        if self.__limiter is None:
+            return 0
+        return int(self.__limiter.total_tokens)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """
+        Runs fn(*args) and returns its result.
+        """
+        if self.__limiter is None:
+            return fn(*args)
+
+        return await trio.to_thread.run_sync(fn, *args, limiter=self.__limiter)
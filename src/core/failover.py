@@ -0,0 +1,123 @@
+"""
+Failover of the computation requests: retries on other Workers and hedged requests.
+
+"""
+
+import math
+import trio
+
+from typing import Optional
+
+from core.metrics import Counter, Metrics
+from core.router import Router
+from core.sliding_window_stats import SlidingWindowStats
+
+class Failover:
+    """
+    Passes the request frames to Workers, so a Worker stalled or dead delays
+    the request by the attempt timeout at most.
+
+    An attempt not responded in time (or failed as the Worker disconnected) is retried
+    on another Worker up to count_retries times. With hedging enabled a duplicate is sent
+    to another Worker once the request is not responded within the hedge percentile
+    of the recent latency, the first response is taken.
+
+    Hedges are limited by the budget: every request adds hedge_budget (a share of
+    the requests) to the hedges allowed, so the load is never multiplied when all Workers are slow.
+    """
+
+    # Number of the recent exchanges the hedging delay is computed by
+    SIZE_LATENCY_WINDOW = 1000
+
+    # Hedging starts once the latency of as many exchanges is known
+    COUNT_LATENCIES_MIN = 100
+
+    # Maximum number of hedges allowed at once
+    COUNT_HEDGES_BURST = 10
+
+    def __init__(self, router: Router, attempt_timeout_ms: int, count_retries: int,
+        hedge_percentile: float, hedge_budget: float):
+
+        assert attempt_timeout_ms >= 0, \
+            f"attempt timeout should not be negative, got: {attempt_timeout_ms}"
+        assert count_retries >= 0, \
+            f"retries count should not be negative, got: {count_retries}"
+        assert 0.0 <= hedge_budget <= 1.0, \
+            f"hedge budget should be in [0, 1], got: {hedge_budget}"
+
+        self.__router = router
+        self.__attempt_timeout_s = attempt_timeout_ms / 1000 if attempt_timeout_ms > 0 else math.inf
+        self.__count_retries = count_retries
+        self.__hedge_percentile = hedge_percentile
+        self.__hedge_budget = hedge_budget
+
+        self.__latencies = SlidingWindowStats(Failover.SIZE_LATENCY_WINDOW)
+        self.__hedge_delay_s = math.inf
+        self.__count_hedges_allowed = 0.0
+
+    async def exchange(self, request_id: str, frame: bytes) -> Optional[bytes]:
+        """
+        Returns the response frame, or None when no Worker responded.
+        """
+        metrics = Metrics()
+        router = self.__router
+
+        self.__count_hedges_allowed = min(Failover.COUNT_HEDGES_BURST,
+            self.__count_hedges_allowed + self.__hedge_budget)
+
+        workers_tried = []
+        results_send, results_receive = trio.open_memory_channel(math.inf)
+
+        async def attempt():
+            # Note: choosing the Worker does not yield while Workers are connected
+            worker = await router.choose(workers_tried)
+            workers_tried.append(worker)
+            results_send.send_nowait(
+                await router.exchange(worker, request_id, frame, self.__attempt_timeout_s))
+
+        time_start = trio.current_time()
+        time_hedge = time_start + self.__hedge_delay_s
+        count_retries = self.__count_retries
+        response = None
+
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(attempt)
+            count_attempts = 1
+
+            while count_attempts > 0:
+                with trio.move_on_at(time_hedge) as cancel_scope:
+                    response = await results_receive.receive()
+
+                if cancel_scope.cancelled_caught:
+                    time_hedge = math.inf
+                    if self.__count_hedges_allowed >= 1 and len(router.workers) > 1:
+                        self.__count_hedges_allowed -= 1
+                        metrics.inc(Counter.HEDGES)
+                        nursery.start_soon(attempt)
+                        count_attempts += 1
+                    continue
+
+                count_attempts -= 1
+                if response is not None:
+                    break
+                if count_retries > 0:
+                    count_retries -= 1
+                    metrics.inc(Counter.RETRIES)
+                    nursery.start_soon(attempt)
+                    count_attempts += 1
+
+            # The attempts still in flight are not needed anymore
+            nursery.cancel_scope.cancel()
+
+        if response is not None:
+            self.__add_latency((trio.current_time() - time_start) * 1000)
+        return response
+
+    def __add_latency(self, latency_ms: float):
+        self.__latencies.add_value(latency_ms)
+
+        # Note: the percentile is computed once per as many exchanges as the minimum known
+        count = self.__latencies.count_values_handled
+        if self.__hedge_budget > 0 and count >= Failover.COUNT_LATENCIES_MIN \
+                and count % Failover.COUNT_LATENCIES_MIN == 0:
+            self.__hedge_delay_s = self.__latencies.percentile(self.__hedge_percentile) / 1000
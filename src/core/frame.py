@@ -0,0 +1,290 @@
+"""
+Binary frames of the computation requests and responses passed between Gateway and Workers.
+
+Request frame:
+    header:  version (u8), kind (u8), flags (u16), request id (16 bytes), rows (u32), cols (u32)
+    nn id:   16 bytes, only when FLAG_NN_ID is set (otherwise the Worker's default NN is used)
+    budget:  u32 time left to handle the request (in milliseconds), only when FLAG_BUDGET is set
+    lengths: rows x u32, only when the vectors have different sizes (cols is 0)
+    payload: float32 values of all the vectors, row by row
+
+Response frame:
+    header:   version (u8), kind (u8), flags (u16), request id (16 bytes), rows (u32), cols (u32)
+    statuses: rows x u8
+    payload:  rows x cols float32 values of the results
+    messages: UTF-8 text, one message per row separated by new lines
+              (a single message for all rows when FLAG_SHARED_MESSAGE is set)
+
+Heartbeat frame (sent by Workers on their own):
+    header:  version (u8), kind (u8), flags (u16), request id (zeros), rows (0), cols (0)
+    payload: UTF-8 JSON with the Worker's status
+
+Address frame (sent by the Gateway to every Worker connected):
+    header:  version (u8), kind (u8), flags (u16), request id (zeros), rows (0), cols (0)
+    payload: UTF-8 address of the Worker's own computation listener of the Gateway
+
+All the values are little-endian.
+"""
+
+import struct
+import sys
+
+from array import array
+from typing import Any, Dict, List, Tuple
+
+class Frame:
+    VERSION = 4
+
+    KIND_PREDICT = 1
+    KIND_PREDICT_BATCH = 2
+    KIND_RESPONSE = 3
+    KIND_HEARTBEAT = 4
+    KIND_ADDRESS = 5
+
+    FLAG_SHARED_MESSAGE = 0x0001
+    FLAG_NN_ID = 0x0002
+    FLAG_BUDGET = 0x0004
+
+    __HEADER = struct.Struct('<BBH16sII')
+    __SIZE_NN_ID = 16
+    __BUDGET = struct.Struct('<I')
+    __SIZE_FLOAT = 4
+
+    @staticmethod
+    def pack_vectors(vectors: List[List[float]]) -> Tuple[List[int], bytes]:
+        """
+        Packs the vectors to float32 values. Returns the vectors sizes and the packed values.
+
+        Raises TypeError when a vector is not an array of numbers (or a number is too large for a float).
+        """
+        values = array('f')
+        lengths = []
+        for v in vectors:
+            if not isinstance(v, list):
+                raise TypeError('vector should be an array of numbers')
+            try:
+                values.extend(v)
+            except OverflowError:
+                # Note: JSON integers are unlimited, only those converted to float are accepted
+                raise TypeError('vector should be an array of numbers')
+            lengths.append(len(v))
+        return lengths, Frame.__to_little_endian(values)
+
+    @staticmethod
+    def pack_data(data: bytes) -> Tuple[List[int], bytes]:
+        """
+        Takes the vector already packed to float32 values. Returns the vector size and the values.
+
+        Raises ValueError when the data size is not a multiple of the float32 size.
+        """
+        if len(data) % Frame.__SIZE_FLOAT != 0:
+            raise ValueError('data size should be a multiple of 4 bytes')
+        return [len(data) // Frame.__SIZE_FLOAT], data
+
+    @staticmethod
+    def encode_request(kind: int, request_id: str, nn_id: str, lengths: List[int], data: bytes,
+        budget_ms: int = 0) -> bytes:
+        """
+        Encodes the request. The nn_id is either a lower case UUID string or an empty string,
+        the budget_ms is the time left to handle the request (0 means no limit).
+        """
+        rows = len(lengths)
+        cols = lengths[0] if rows > 0 and lengths.count(lengths[0]) == rows else 0
+
+        parts = []
+        flags = 0
+        if nn_id != '':
+            flags |= Frame.FLAG_NN_ID
+            parts.append(bytes.fromhex(nn_id))
+        if budget_ms > 0:
+            flags |= Frame.FLAG_BUDGET
+            parts.append(Frame.__BUDGET.pack(budget_ms))
+        if cols == 0 and rows > 0:
+            parts.append(struct.pack(f'<{rows}I', *lengths))
+        parts.append(data)
+
+        header = Frame.__HEADER.pack(
+            Frame.VERSION, kind, flags, bytes.fromhex(request_id), rows, cols)
+        return b''.join([header] + parts)
+
+    @staticmethod
+    def decode_request(buffer: bytes) -> Tuple[int, str, str, int, List[int], memoryview]:
+        """
+        Decodes the request frame. Returns its kind, request id, NN id, time budget (in milliseconds, 
+        0 means no limit), sizes of vectors and the float32 values of vectors (not copied).
+
+        Raises ValueError when the frame is malformed.
+        """
+        kind, request_id, rows, cols, offset = Frame.__decode_header(buffer)
+
+        flags = Frame.__HEADER.unpack_from(buffer)[2]
+
+        nn_id = ''
+        if flags & Frame.FLAG_NN_ID:
+            nn_id = bytes(buffer[offset:offset + Frame.__SIZE_NN_ID]).hex()
+            offset += Frame.__SIZE_NN_ID
+
+        try:
+            budget_ms = 0
+            if flags & Frame.FLAG_BUDGET:
+                budget_ms = Frame.__BUDGET.unpack_from(buffer, offset)[0]
+                offset += Frame.__BUDGET.size
+
+            if cols == 0 and rows > 0:
+                lengths = list(struct.unpack_from(f'<{rows}I', buffer, offset))
+                offset += rows * 4
+            else:
+                lengths = [cols] * rows
+        except struct.error:
+            raise ValueError('request frame is too short')
+
+        view = memoryview(buffer)
+
+        data = view[offset:]
+        if len(data) != sum(lengths) * Frame.__SIZE_FLOAT:
+            raise ValueError('request frame payload has wrong size')
+
+        return kind, request_id, nn_id, budget_ms, lengths, data
+
+    @staticmethod
+    def peek(buffer: bytes) -> Tuple[int, str]:
+        """
+        Returns the kind and the request id of the frame (even a malformed one), 
+        0 and an empty string when there is no header.
+        """
+        if len(buffer) < Frame.__HEADER.size:
+            return 0, ''
+        return buffer[1], bytes(buffer[4:20]).hex()
+
+    @staticmethod
+    def encode_heartbeat(status: str) -> bytes:
+        header = Frame.__HEADER.pack(
+            Frame.VERSION, Frame.KIND_HEARTBEAT, 0, bytes(16), 0, 0)
+        return header + status.encode()
+
+    @staticmethod
+    def decode_heartbeat(buffer: bytes) -> str:
+        """
+        Returns the Worker's status passed with the heartbeat.
+
+        Raises ValueError when the frame is malformed.
+        """
+        kind, _, _, _, offset = Frame.__decode_header(buffer)
+        if kind != Frame.KIND_HEARTBEAT:
+            raise ValueError(f'unexpected frame kind: {kind}')
+
+        return bytes(buffer[offset:]).decode('utf-8')
+
+    @staticmethod
+    def encode_address(addr: str) -> bytes:
+        header = Frame.__HEADER.pack(
+            Frame.VERSION, Frame.KIND_ADDRESS, 0, bytes(16), 0, 0)
+        return header + addr.encode()
+
+    @staticmethod
+    def decode_address(buffer: bytes) -> str:
+        """
+        Returns the address of the computation listener passed to the Worker.
+
+        Raises ValueError when the frame is malformed.
+        """
+        kind, _, _, _, offset = Frame.__decode_header(buffer)
+        if kind != Frame.KIND_ADDRESS:
+            raise ValueError(f'unexpected frame kind: {kind}')
+
+        return bytes(buffer[offset:]).decode('utf-8')
+
+    @staticmethod
+    def encode_response(request_id: str, results: List[Tuple[bool, str, Any]]) -> bytes:
+        """
+        Encodes the results made by the Inferencer.
+        """
+        cols = 1
+        for res in results:
+            if res[0] and isinstance(res[2], list):
+                cols = len(res[2])
+                break
+
+        statuses = bytes(1 if res[0] else 0 for res in results)
+
+        values = array('f')
+        for res in results:
+            if not res[0]:
+                values.extend([0.0] * cols)
+            elif cols == 1:
+                values.append(res[2])
+            else:
+                values.extend(res[2])
+
+        messages = [res[1] for res in results]
+        flags = 0
+        if len(messages) > 0 and messages.count(messages[0]) == len(messages):
+            flags |= Frame.FLAG_SHARED_MESSAGE
+            messages = messages[:1]
+
+        header = Frame.__HEADER.pack(
+            Frame.VERSION, Frame.KIND_RESPONSE, flags, bytes.fromhex(request_id), len(results), cols)
+        return b''.join((header, statuses, Frame.__to_little_endian(values),
+            '\n'.join(messages).encode()))
+
+    @staticmethod
+    def decode_response(buffer: bytes) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Decodes the response frame. Returns its request id and the results.
+
+        Raises ValueError when the frame is malformed.
+        """
+        kind, request_id, rows, cols, offset = Frame.__decode_header(buffer)
+        if kind != Frame.KIND_RESPONSE:
+            raise ValueError(f'unexpected frame kind: {kind}')
+
+        flags = Frame.__HEADER.unpack_from(buffer)[2]
+
+        view = memoryview(buffer)
+        statuses = view[offset:offset + rows]
+        offset += rows
+
+        size_values = rows * cols * Frame.__SIZE_FLOAT
+        values = array('f')
+        values.frombytes(view[offset:offset + size_values])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        offset += size_values
+
+        messages = bytes(view[offset:]).decode('utf-8').split('\n') if rows > 0 else []
+        if flags & Frame.FLAG_SHARED_MESSAGE:
+            messages = messages * rows
+        if len(statuses) != rows or len(values) != rows * cols or len(messages) != rows:
+            raise ValueError('response frame payload has wrong size')
+
+        results = []
+        for i in range(rows):
+            res = {}
+            res['status'] = bool(statuses[i])
+            res['message'] = messages[i]
+            if not res['status']:
+                res['result'] = 0.0
+            elif cols == 1:
+                res['result'] = values[i]
+            else:
+                res['result'] = values[i * cols:(i + 1) * cols].tolist()
+            results.append(res)
+
+        return request_id, results
+
+    @staticmethod
+    def __decode_header(buffer: bytes) -> Tuple[int, str, int, int, int]:
+        if len(buffer) < Frame.__HEADER.size:
+            raise ValueError('frame is too short')
+
+        version, kind, _, request_id, rows, cols = Frame.__HEADER.unpack_from(buffer)
+        if version != Frame.VERSION:
+            raise ValueError(f'unsupported frame version: {version}')
+
+        return kind, request_id.hex(), rows, cols, Frame.__HEADER.size
+
+    @staticmethod
+    def __to_little_endian(values: array) -> bytes:
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values.tobytes()
@@ -0,0 +1,216 @@
+"""
+Asynchronous tasks of the Gateway.
+
+Note: the Gateway never runs NNs, so nothing imported here (directly or not) imports torch.
+"""
+
+import json
+import math
+import pynng
+import time
+import trio
+
+from typing import Any, Callable, Dict, List
+
+from core.admission import AdmissionQueue
+from core.cmd import Command
+from core.defaults import Defaults
+from core.failover import Failover
+from core.frame import Frame
+from core.metrics import Counter, Metrics, Stage
+from core.msg_helper import MessageHelper
+from core.peers import Peers
+from core.result_cache import ResultCache
+from core.router import Router
+from core.weights import COMPRESSION_NONE, compress_chunk, supported_compressions
+
+async def task_gw_service(channel_receive, surveyor, router: Router, weights_compression: str, 
+    result_cache: ResultCache, peers: Peers):
+    """
+    Gateway task to handle service requests
+
+    The prediction results cached (by all the Gateway processes) are dropped once any Worker loads the new weights.
+    """
+
+    async for request in channel_receive:
+        item, weights_file = request.payload
+        cmd = json.loads(item)['cmd']
+
+        if cmd == Command.SET_WEIGHTS:
+            with weights_file:
+                response = await _gw_set_weights(surveyor, len(router.members), item, weights_file, weights_compression)
+            # Note: even partially failed loading changes the NNs used by some Workers
+            if any(res['result'] for res in json.loads(response)['workers']):
+                result_cache.invalidate()
+                await peers.survey(MessageHelper.cmd_invalidate_results.encode())
+
+        request.reply(response)
+
+async def _gw_set_weights(surveyor, count_members: int, item: str, weights_file, weights_compression: str) -> str:
+    """
+    Passes the weights to all the Workers chunk by chunk.
+
+    Workers already holding the weights with the same hash skip the transfer,
+    those having them cached skip it as well, but load them at the end (as the others do).
+    Note: the chunk surveys reach every Worker connected (the survey is a broadcast), the Workers 
+    skipping the transfer drop the chunks, the chunks are not sent when all the Workers skip it.
+    The Workers are waited for until all the count_members Workers (the members of the cluster) respond,
+    or until the survey time is over (when the members are not known yet).
+    """
+
+    cmd = json.loads(item)
+    weights_hash = cmd['hash']
+
+    responses = await _gw_survey(surveyor, item.encode(), Defaults.GW_SURVEY_TIME_MS, count_members)
+    count_workers = len(responses)
+
+    results = [{'result': True, 'skipped': True} for response in responses if response['skipped']]
+    count_cached = sum(1 for response in responses if not response['skipped'] and response.get('cached', False))
+    receiving = [response for response in responses if not response['skipped'] and not response.get('cached', False)]
+
+    count_receiving = len(receiving)
+    if count_receiving > 0:
+        compression = COMPRESSION_NONE
+        if weights_compression in supported_compressions() and \
+                all(weights_compression in response['compressions'] for response in receiving):
+            compression = weights_compression
+
+        for index in range(cmd['count_chunks']):
+            chunk = weights_file.read(Defaults.GW_SIZE_WEIGHTS_CHUNK)
+            msg = MessageHelper.cmd_set_weights_chunk(
+                weights_hash, index, compression, compress_chunk(chunk, compression))
+
+            # Workers failed with a chunk report it at the end, those not responded are not waited anymore
+            acks = await _gw_survey(surveyor, msg, Defaults.GW_WEIGHTS_SURVEY_TIME_MS, count_receiving)
+            count_receiving = len(acks)
+            if count_receiving == 0:
+                break
+
+    # Note: the weights are loaded at the end, so the Workers may take longer than for the begin survey
+    if count_receiving + count_cached > 0:
+        msg = MessageHelper.cmd_set_weights_end(weights_hash).encode()
+        results.extend(
+            await _gw_survey(surveyor, msg, Defaults.GW_WEIGHTS_SURVEY_TIME_MS, count_receiving + count_cached))
+
+    overall_result = count_workers > 0 and len(results) == count_workers and \
+        all(response['result'] for response in results)
+
+    return MessageHelper.api_response_set_weights(overall_result, results)
+
+async def _gw_survey(surveyor, message: bytes, survey_time_ms: int, count_expected: int = 0) -> List[Dict]:
+    """
+    Sends the survey to Workers and collects their responses until the survey time is over
+    or count_expected responses are received (when count_expected is set).
+    """
+
+    surveyor.survey_time = survey_time_ms
+    await surveyor.asend(message)
+
+    responses = []
+    while count_expected == 0 or len(responses) < count_expected:
+        try:
+            response_bytes = await surveyor.arecv()
+        except pynng.Timeout:
+            break
+        responses.append(json.loads(response_bytes.decode('utf-8')))
+
+    return responses
+
+async def task_gw_peers(respondent, snapshot: Callable[[], Dict[str, Any]], result_cache: ResultCache):
+    """
+    Gateway task to respond the surveys of the other Gateway processes (see Peers)
+    """
+
+    while True:
+        cmd = json.loads((await respondent.arecv()).decode('utf-8'))
+
+        if cmd['cmd'] == Command.STATUS:
+            response = json.dumps(snapshot())
+        elif cmd['cmd'] == Command.INVALIDATE_RESULTS:
+            result_cache.invalidate()
+            response = MessageHelper.cmd_response_invalidate_results
+        else:
+            # Never expected: the peer is of another version
+            continue
+
+        await respondent.asend(response.encode())
+
+async def task_gw_predict(admission: AdmissionQueue, sock, router: Router, failover: Failover,
+    count_dispatchers: int):
+    """
+    Gateway task to handle the 'predict' request
+
+    Runs count_dispatchers dispatchers, so up to count_dispatchers requests are in flight 
+    in the cluster at once. The dispatchers take the requests from the admission queue
+    (by priority), every request is passed to the Worker chosen by the router
+    (and retried or hedged on other Workers by the failover), 
+    the responses are matched to the requests by the Workers and their ids.
+    """
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(_gw_receive_predict, sock, router)
+        for _ in range(count_dispatchers):
+            nursery.start_soon(_dispatch_predict, admission, failover)
+
+async def _gw_receive_predict(sock, router: Router):
+    """
+    Gateway task to receive the 'predict' responses and heartbeats of all the Workers
+    """
+
+    while True:
+        msg = await sock.arecv_msg()
+        kind, request_id = Frame.peek(msg.bytes)
+        if kind == Frame.KIND_HEARTBEAT:
+            try:
+                router.heartbeat(msg.pipe, json.loads(Frame.decode_heartbeat(msg.bytes)))
+            except ValueError:
+                # Never expected: the heartbeat is malformed
+                pass
+        else:
+            router.deliver(msg.pipe, request_id, msg.bytes)
+
+async def _dispatch_predict(admission: AdmissionQueue, failover: Failover):
+    """
+    Gateway dispatcher: passes 'predict' requests to Workers one by one
+
+    The requests expired (or cancelled by clients) are dropped, the time left 
+    to handle the request is passed to the Worker.
+    """
+
+    metrics = Metrics()
+
+    while True:
+        request = await admission.get()
+        time_start = time.perf_counter()
+        metrics.observe(Stage.QUEUE_WAIT, time_start - request.time_created)
+
+        kind, nn_id, lengths, data, deadline = request.payload
+        if request.abandoned or trio.current_time() >= deadline:
+            metrics.inc(Counter.REQUESTS_DROPPED)
+            request.reply([MessageHelper.result_failed(MessageHelper.MESSAGE_DEADLINE_EXCEEDED)] * len(lengths))
+            continue
+
+        budget_ms = 0
+        if deadline != math.inf:
+            budget_ms = math.ceil((deadline - trio.current_time()) * 1000)
+
+        with trio.move_on_at(deadline) as cancel_scope:
+            result_bytes = await failover.exchange(
+                request.id, Frame.encode_request(kind, request.id, nn_id, lengths, data, budget_ms))
+
+        metrics.observe(Stage.EXCHANGE, time.perf_counter() - time_start)
+
+        if cancel_scope.cancelled_caught:
+            results = [MessageHelper.result_failed(MessageHelper.MESSAGE_DEADLINE_EXCEEDED)] * len(lengths)
+        elif result_bytes is None:
+            results = [MessageHelper.result_failed('No Worker responded')] * len(lengths)
+        else:
+            try:
+                _, results = Frame.decode_response(result_bytes)
+            except ValueError:
+                results = []
+            if len(results) != len(lengths):
+                # Never expected: the Worker was unable to decode the request or the response is malformed
+                results = [MessageHelper.result_failed('Malformed frame exchanged with Worker')] * len(lengths)
+
+        request.reply(results)
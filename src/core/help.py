@@ -16,6 +16,122 @@ class HelpStrings:
     def addr_worker(cls) -> str:
         return f'Address for computation calls in cluster. For example {Defaults.ADDR_WORKER}'
 
+    @classproperty
+    def addr_peers(cls) -> str:
+        return f'Address for calls between Gateway processes. For example {Defaults.ADDR_PEERS}'
+
+    @classproperty
+    def processes(cls) -> str:
+        return f'Number of Gateway processes serving the REST API with the same Workers. Default is {Defaults.GW_COUNT_PROCESSES}'
+
+    @classproperty
+    def gateways(cls) -> str:
+        return f'Number of Gateway processes to connect to (see --processes of the Gateway). Default is {Defaults.WORK_COUNT_GATEWAYS}'
+
+    @classproperty
+    def dispatchers(cls) -> str:
+        return f'Number of prediction requests handled by the cluster simultaneously. Default is {Defaults.GW_COUNT_DISPATCHERS}'
+
+    @classproperty
+    def shard_size(cls) -> str:
+        return f'Number of vectors of a batch prediction request handled by a single Worker. Default is {Defaults.GW_SIZE_SHARD}'
+
+    @classproperty
+    def weights_compression(cls) -> str:
+        return f'Compression of weights passed to Workers: zstd or none. Default is {Defaults.GW_WEIGHTS_COMPRESSION}'
+
+    @classproperty
+    def routing(cls) -> str:
+        return f'Routing of prediction requests to Workers: least_outstanding (the Worker with the least expected latency) or p2c (the best of two random Workers). Default is {Defaults.GW_ROUTING}'
+
+    @classproperty
+    def request_timeout_ms(cls) -> str:
+        return f'Default time (in milliseconds) to handle a prediction request, overridden with the X-Request-Timeout-Ms header. Value 0 means no limit. Default is {Defaults.GW_REQUEST_TIMEOUT_MS}'
+
+    @classproperty
+    def attempt_timeout_ms(cls) -> str:
+        return f'Time (in milliseconds) a Worker may take to respond before the request is retried on another Worker. Value 0 means no limit. Default is {Defaults.GW_ATTEMPT_TIMEOUT_MS}'
+
+    @classproperty
+    def retries(cls) -> str:
+        return f'Number of times a prediction request is retried on another Worker when a Worker times out or disconnects. Default is {Defaults.GW_COUNT_RETRIES}'
+
+    @classproperty
+    def hedge_budget(cls) -> str:
+        return f'Share of prediction requests (from 0 to 1) duplicated to another Worker when not responded within the p{Defaults.GW_HEDGE_PERCENTILE} latency. Value 0 disables hedging. Default is {Defaults.GW_HEDGE_BUDGET:g}'
+
+    @classproperty
+    def queue_size(cls) -> str:
+        return f'Maximum number of prediction requests (or shards of batch predictions) of every priority waiting for the cluster. Default is {Defaults.GW_SIZE_QUEUE_COMPUTE}'
+
+    @classproperty
+    def codel_target_ms(cls) -> str:
+        return f'Time (in milliseconds) a prediction request may wait in the queue: requests are shed once it is exceeded for {Defaults.GW_CODEL_INTERVAL_MS:g} ms. Value 0 disables shedding. Default is {Defaults.GW_CODEL_TARGET_MS:g}'
+
+    @classproperty
+    def client_rate(cls) -> str:
+        return f'Prediction requests per second allowed for a client (identified by the X-Client-Id header or the address). Value 0 means no limit. Default is {Defaults.GW_CLIENT_RATE:g}'
+
+    @classproperty
+    def client_burst(cls) -> str:
+        return f'Prediction requests a client may send at once above the rate. Default is {Defaults.GW_CLIENT_BURST}'
+
+    @classproperty
+    def result_cache_size(cls) -> str:
+        return f'Maximum number of prediction results cached by the Gateway. Value 0 disables caching. Default is {Defaults.GW_SIZE_RESULT_CACHE}'
+
+    @classproperty
+    def result_cache_ttl_s(cls) -> str:
+        return f'Time (in seconds) the prediction results are cached for. Default is {Defaults.GW_RESULT_CACHE_TTL_S}'
+
+    @classproperty
+    def single_flight(cls) -> str:
+        return 'Collapse identical prediction requests being handled at once into a single request to Workers.'
+
+    @classproperty
+    def receivers(cls) -> str:
+        return f'Number of prediction requests awaited (and handled) by the Worker simultaneously on every Gateway socket. --contexts is the deprecated alias. Default is {Defaults.WORK_COUNT_RECEIVERS}'
+
+    @classproperty
+    def batch_size(cls) -> str:
+        return f'Maximum number of prediction requests handled by the NN as a single batch (at most --receivers times --gateways requests are received at once). Value 1 disables batching. Default is {Defaults.WORK_SIZE_BATCH_MAX}'
+
+    @classproperty
+    def batch_wait_ms(cls) -> str:
+        return f'Maximum time (in milliseconds) to wait for a batch to fill. Default is {Defaults.WORK_BATCH_WAIT_MS}'
+
+    @classproperty
+    def threads(cls) -> str:
+        return f'Number of threads running the NN inference. Value 0 runs the inference in the event loop. Default is {Defaults.WORK_COUNT_THREADS}'
+
+    @classproperty
+    def models_max(cls) -> str:
+        return f'Maximum number of NN models held by the Worker at once. Default is {Defaults.WORK_COUNT_MODELS_MAX}'
+
+    @classproperty
+    def models_memory_mb(cls) -> str:
+        return f'Maximum memory (in megabytes) taken by NN models held by the Worker at once. Value 0 means no limit. Default is {Defaults.WORK_SIZE_MODELS_MAX_MB}'
+
+    @classproperty
+    def optimization(cls) -> str:
+        return f'Optimization of NN models loaded (unless specified with the weights): none, script (TorchScript trace and freeze) or int8 (dynamic int8 quantization of linear layers, then TorchScript). Default is {Defaults.WORK_OPTIMIZATION}'
+
+    @classproperty
+    def optimization_tolerance(cls) -> str:
+        return f'Maximum difference of the optimized model outputs from the eager model ones (relative to the maximum output) on the probe batch, the eager model is used otherwise. The int8 models usually differ by a few percent. Default is {Defaults.WORK_OPTIMIZATION_TOLERANCE}'
+
+    @classproperty
+    def torch_threads(cls) -> str:
+        return f'Number of threads used by PyTorch for a single inference. Value 0 keeps the PyTorch default (the number of CPU cores). Default is {Defaults.WORK_COUNT_TORCH_THREADS}'
+
+    @classproperty
+    def cache_dir(cls) -> str:
+        return 'Directory to keep the weights loaded, they are restored from it at start. Caching is disabled when not set.'
+
+    @classproperty
+    def heartbeat_ms(cls) -> str:
+        return f'Interval (in milliseconds) of heartbeats sent to the Gateway with the Worker\'s status. Default is {Defaults.WORK_HEARTBEAT_INTERVAL_MS}'
+
     @classproperty
     def help(cls) -> str:
         return 'Show this help message and exit.'
@@ -0,0 +1,115 @@
+"""
+Histogram with logarithmic buckets for the streaming percentiles computation.
+
+"""
+
+import math
+
+from typing import Dict, Iterable, Tuple
+
+class LogHistogram:
+    """
+    Counts the values in buckets growing exponentially (HDR histogram style), so any percentile
+    is known with the relative error within PRECISION whatever the values range is.
+
+    Adding and removing a value has O(1) complexity, the percentile computation has
+    O(b log b) complexity (where b is the number of buckets used, a few hundreds at most).
+    """
+
+    PRECISION = 0.02
+
+    # Values below are counted in the first bucket
+    VALUE_MIN = 0.001
+
+    __LOG_BASE = math.log(1.0 + 2 * PRECISION)
+    __LOG_VALUE_MIN = math.log(VALUE_MIN)
+    __SCALE = 1.0 / __LOG_BASE
+
+    def __init__(self):
+        self.__counts = {}
+        self.__count = 0
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    @property
+    def counts(self) -> Dict[int, int]:
+        """
+        Returns the counts of the values by bucket.
+        """
+        return dict(self.__counts)
+
+    @staticmethod
+    def bucket(value: float) -> int:
+        """
+        Returns the bucket of the value, so it's computed once when the value is counted in several histograms.
+        """
+        if value <= LogHistogram.VALUE_MIN:
+            return 0
+        return 1 + int((math.log(value) - LogHistogram.__LOG_VALUE_MIN) * LogHistogram.__SCALE)
+
+    def add(self, value: float):
+        self.add_to_bucket(LogHistogram.bucket(value))
+
+    def add_to_bucket(self, bucket: int):
+        counts = self.__counts
+        counts[bucket] = counts.get(bucket, 0) + 1
+        self.__count += 1
+
+    def remove(self, value: float):
+        """
+        Removes the value added before.
+        """
+        self.remove_from_bucket(LogHistogram.bucket(value))
+
+    def remove_from_bucket(self, bucket: int):
+        counts = self.__counts
+        count = counts[bucket] - 1
+        if count == 0:
+            del counts[bucket]
+        else:
+            counts[bucket] = count
+        self.__count -= 1
+
+    def merge(self, other: 'LogHistogram'):
+        """
+        Adds all the values of the other histogram.
+        """
+        self.add_counts(other.__counts.items())
+
+    def add_counts(self, counts: Iterable[Tuple[int, int]]):
+        """
+        Adds the values counted by bucket (see counts), e.g. by the histogram of another process.
+        """
+        for bucket, count in counts:
+            self.__counts[bucket] = self.__counts.get(bucket, 0) + count
+            self.__count += count
+
+    def clear(self):
+        self.__counts.clear()
+        self.__count = 0
+
+    def percentile(self, q: float) -> float:
+        """
+        Returns the q-th percentile (q is in [0, 100]), 0.0 when there are no values.
+        """
+        if self.__count == 0:
+            return 0.0
+
+        rank = max(1, math.ceil(self.__count * q / 100))
+        seen = 0
+        for bucket in sorted(self.__counts):
+            seen += self.__counts[bucket]
+            if seen >= rank:
+                return LogHistogram.__value(bucket)
+        return LogHistogram.__value(max(self.__counts))
+
+    @staticmethod
+    def __value(bucket: int) -> float:
+        """
+        Returns the middle of the bucket.
+        """
+        if bucket == 0:
+            return LogHistogram.VALUE_MIN
+        return LogHistogram.VALUE_MIN * math.exp((bucket - 0.5) * LogHistogram.__LOG_BASE)
@@ -4,25 +4,98 @@ NN inferencer: uses PyTorch, allows to load weights and to run the inference.
 """
 
 import base64
+import inspect
 import io
-import numpy as np
+import threading
 import torch
 import traceback
+import warnings
 
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple, Union
 
-from torch.autograd import Variable
-from typing import Any, List, Tuple
-
+from core.defaults import Defaults
 from core.model import Model
+from core.optimization import OPTIMIZATION_NONE, OPTIMIZATIONS
+from core.optimizer import make_probe, measure_error, optimize
 from core.singleton import Singleton
 
+_TORCH_LOAD_SUPPORTS_MMAP = 'mmap' in inspect.signature(torch.load).parameters
+
+# Input tensors are made on top of the received (read-only) frames and are never written
+warnings.filterwarnings('ignore', message='The given buffer is not writable')
+
+class ResidentModel:
+    """
+    The NN model loaded to the Inferencer.
+
+    The optimization is the one requested, the model is eager till it's optimized 
+    (and stays eager when the optimization fails).
+    """
+
+    def __init__(self, nn_id: str, nn_model: torch.nn.Module, weights_hash: str, optimization: str, size: int,
+        optimized: bool):
+        self.nn_id = nn_id
+        self.nn_model = nn_model
+        self.weights_hash = weights_hash
+        self.optimization = optimization
+        self.size = size
+        self.optimized = optimized
+
 class Inferencer(metaclass=Singleton):
+    """
+    Holds several NN models at once, the least recently used models are evicted 
+    when the count or memory limits are reached.
+
+    The models are never changed once loaded: the new weights are loaded to a new model
+    which is swapped in at once, so every prediction is made by a single version of the NN
+    (the one reported with the result).
+
+    The model is loaded as an eager one and is optimized (see core.optimization) later on, 
+    with optimize_weights, the optimized model is swapped in the same way. The eager model is kept 
+    when the optimized model's outputs differ from its ones by more than the tolerance.
+    """
+
     def __init__(self):
-        self.__nn_model = Model(input_dim = 2, 
-            output_dim = 1)
+        # NN models by id, the least recently used first
+        self.__models = OrderedDict()
+        self.__lock = threading.Lock()
 
+        # The NN used when the id is not specified: the one loaded last
         self.__nn_id = ""
 
+        self.__count_models_max = Defaults.WORK_COUNT_MODELS_MAX
+        self.__size_models_max = Defaults.WORK_SIZE_MODELS_MAX_MB * 1024 * 1024
+
+        self.__optimization = Defaults.WORK_OPTIMIZATION
+        self.__optimization_tolerance = Defaults.WORK_OPTIMIZATION_TOLERANCE
+
+    @staticmethod
+    def setup(count_models_max: int, size_models_max_mb: int, 
+        optimization: str, optimization_tolerance: float, count_torch_threads: int):
+        """
+        Sets the limits of models held at once (zero memory limit means no limit),
+        the optimization of the models loaded (when not specified with the weights)
+        and the number of threads used by PyTorch for a single inference (zero keeps the PyTorch's default).
+        """
+        assert count_models_max > 0, \
+            f"models count should be greater than 0, got: {count_models_max}"
+        assert optimization in OPTIMIZATIONS, \
+            f"optimization should be one of {OPTIMIZATIONS}, got: {optimization}"
+        assert optimization_tolerance >= 0, \
+            f"optimization tolerance should not be negative, got: {optimization_tolerance}"
+        assert count_torch_threads >= 0, \
+            f"torch threads count should not be negative, got: {count_torch_threads}"
+
+        inferencer = Inferencer()
+        inferencer.__count_models_max = count_models_max
+        inferencer.__size_models_max = size_models_max_mb * 1024 * 1024
+        inferencer.__optimization = optimization
+        inferencer.__optimization_tolerance = optimization_tolerance
+
+        if count_torch_threads > 0:
+            torch.set_num_threads(count_torch_threads)
+
     @property
     def ready(self) -> bool:
         return self.__nn_id != ""
@@ -31,55 +104,241 @@ class Inferencer(metaclass=Singleton):
     def nn_id(self) -> str:
         return self.__nn_id
 
-    def load_weights(self, nn_id: str, data: Any) -> Tuple[bool, str]:
+    @property
+    def nn_ids(self) -> List[str]:
+        """
+        Returns ids of all the models held, the least recently used first.
+        """
+        with self.__lock:
+            return list(self.__models.keys())
+
+    def load_weights(self, nn_id: str, data: Any, weights_hash: str = "", mmap: bool = False, 
+        optimization: str = "") -> Tuple[bool, str]:
         """
-        Loads NN weights. Also updates the NN identifier.
+        Loads NN weights from bytes, a file or a file path to a new model. 
+        The model becomes the default one, the least recently used models are evicted when necessary.
+
+        The new model is loaded and warmed up aside (it may be called from another thread), 
+        the predictions in flight are completed with the model they are started with.
+
+        The file specified by path is memory mapped when mmap is set and PyTorch supports it.
+        The optimization (the one set up when not specified) is applied by optimize_weights.
         """
 
-        buffer = io.BytesIO(data)
+        if optimization == "":
+            optimization = self.__optimization
+
+        if isinstance(data, (bytes, bytearray)):
+            data = io.BytesIO(data)
         
+        nn_model = Model(input_dim = 2, 
+            output_dim = 1)
+
         try:
-            self.__nn_model.load_state_dict(torch.load(buffer))
-        except RuntimeError:
+            if mmap and isinstance(data, str) and _TORCH_LOAD_SUPPORTS_MMAP:
+                state_dict = torch.load(data, mmap=True)
+            else:
+                state_dict = torch.load(data)
+            nn_model.load_state_dict(state_dict)
+            nn_model.eval()
+        except Exception:
+            # Note: besides the wrong tensors, data may be not a state dictionary at all
             trace_str = traceback.format_exc()
             return (False, trace_str)
 
-        self.__nn_model.eval()
-        
-        self.__nn_id = nn_id
+        # The model is run once before it's swapped in, so the first predictions are not slowed down
+        with torch.inference_mode():
+            nn_model(torch.zeros(1, nn_model.fc1.in_features))
+
+        # Note: the size of the eager model is counted, the quantized one is smaller
+        size = sum(t.numel() * t.element_size() for t in nn_model.state_dict().values())
+
+        self.__add(ResidentModel(nn_id, nn_model, weights_hash, optimization, size, 
+            optimization == OPTIMIZATION_NONE))
 
         return (True, "")
 
-    def predict(self, v: List) -> Tuple[bool, str, float]:
+    def optimize_weights(self, nn_id: str):
+        """
+        Optimizes the model loaded (unless it's optimized already or evicted meanwhile) and swaps it in 
+        for all the NNs sharing the model. It may take long, so it's called from another thread.
+        """
+
+        with self.__lock:
+            resident = self.__models.get(nn_id)
+        if resident is None or resident.optimized:
+            return
+
+        nn_model = self.__optimize(nn_id, resident.nn_model, resident.optimization)
+
+        with self.__lock:
+            for held in self.__models.values():
+                if held.nn_model is resident.nn_model:
+                    held.nn_model = nn_model
+                    held.optimized = True
+
+    def reuse_weights(self, nn_id: str, weights_hash: str, optimization: str = "") -> bool:
+        """
+        Makes the weights already held available under the NN identifier specified 
+        when their hash matches the one specified (and they are optimized the same way). 
+        Returns False when there are no such weights.
+        """
+
+        if weights_hash == "":
+            return False
+        if optimization == "":
+            optimization = self.__optimization
+
+        with self.__lock:
+            held = [m for m in self.__models.values() 
+                if m.weights_hash == weights_hash and m.optimization == optimization]
+        if len(held) == 0:
+            return False
+
+        self.__add(ResidentModel(nn_id, held[0].nn_model, weights_hash, optimization, held[0].size, 
+            held[0].optimized))
+        return True
+
+    def __optimize(self, nn_id: str, nn_model: Model, optimization: str) -> torch.nn.Module:
+        """
+        Returns the model optimized, or the eager model when the optimization fails or the accuracy check does.
+        """
+
+        probe = make_probe(nn_model.fc1.in_features)
+        try:
+            nn_model_optimized = optimize(nn_model, optimization, probe)
+            error = measure_error(nn_model_optimized, nn_model, probe)
+        except Exception:
+            print(f'NN {nn_id} is not optimized ({optimization}):\n{traceback.format_exc()}')
+            return nn_model
+
+        if not error <= self.__optimization_tolerance:
+            print(f'NN {nn_id} is not optimized ({optimization}): '
+                f'the error {error:.4g} exceeds the tolerance {self.__optimization_tolerance:g}')
+            return nn_model
+
+        print(f'NN {nn_id} is optimized ({optimization}): the error is {error:.4g}')
+        return nn_model_optimized
+
+    def __add(self, resident: ResidentModel):
+        with self.__lock:
+            self.__models.pop(resident.nn_id, None)
+            self.__models[resident.nn_id] = resident
+
+            # The model just added is never evicted
+            while len(self.__models) > 1 and (
+                    len(self.__models) > self.__count_models_max or 
+                    (self.__size_models_max > 0 and 
+                        sum(m.size for m in self.__models.values()) > self.__size_models_max)):
+                self.__models.popitem(last=False)
+
+            self.__nn_id = resident.nn_id
+
+    def __get(self, nn_id: str) -> Optional[ResidentModel]:
+        """
+        Returns the model by its id (or the default one when the id is empty) and marks it as recently used.
+        """
+        with self.__lock:
+            if nn_id == "":
+                nn_id = self.__nn_id
+            resident = self.__models.get(nn_id)
+            if resident is not None:
+                self.__models.move_to_end(nn_id)
+            return resident
+
+    @staticmethod
+    def tensor_from_buffer(data: Any, lengths: List[int]) -> Union[torch.Tensor, List[torch.Tensor]]:
+        """
+        Makes input vectors from the buffer of float32 values without copying them.
+
+        Returns a 2D tensor when all the vectors have the same size, otherwise a list of 1D tensors.
+        """
+        if len(data) > 0:
+            values = torch.frombuffer(data, dtype=torch.float32)
+        else:
+            values = torch.empty(0, dtype=torch.float32)
+
+        rows = len(lengths)
+        if rows > 0 and lengths.count(lengths[0]) == rows:
+            return values.reshape(rows, lengths[0])
+        return list(torch.split(values, lengths))
+
+    def predict(self, v: Union[List, torch.Tensor], nn_id: str = "") -> Tuple[bool, str, float]:
         """
         Runs the NN to predict sum of the input vector's v components.
+        
+        Uses the NN with the id specified, or the default one when the id is empty.
         """
 
-        if not self.ready:
-            return (False, 'No weights loaded', 0.0)
+        resident = self.__get(nn_id)
+        if resident is None:
+            return Inferencer.__result_not_loaded(nn_id)
+
+        return Inferencer.__predict(resident, v)
+
+    def predict_batch(self, vectors: Union[List, torch.Tensor], nn_id: str = "") -> List[Tuple[bool, str, float]]:
+        """
+        Runs the NN on a batch of input vectors at once.
+
+        When the batch can not be handled at once (for example one of vectors has a wrong size), 
+        falls back to handling vectors one by one, so each of them gets its own result.
+        """
 
-        x = torch.unsqueeze(torch.from_numpy(np.asarray(v)), 0)
-        ds = torch.utils.data.TensorDataset(x)
-        inference_loader = torch.utils.data.DataLoader(ds)
+        resident = self.__get(nn_id)
+        if resident is None:
+            return [Inferencer.__result_not_loaded(nn_id)] * len(vectors)
 
-        with torch.no_grad():
-            for inference in inference_loader:
-                inference_batch = Variable(inference[0]).float()
+        output_batch = None
 
-                try:
-                    # Compute model output
-                    output_batch = self.__nn_model(inference_batch)
-                except RuntimeError:
-                    # Can be caused for example by passing a wrong input 
-                    trace_str = traceback.format_exc()
-                    trace_str = base64.standard_b64encode(
-                        trace_str.encode()).decode('utf-8')
+        try:
+            if isinstance(vectors, torch.Tensor):
+                inference_batch = vectors
+            elif len(vectors) > 0 and isinstance(vectors[0], torch.Tensor):
+                inference_batch = torch.stack(vectors)
+            else:
+                inference_batch = torch.tensor(vectors, dtype=torch.float32)
+
+            with torch.inference_mode():
+                # Compute model output
+                output_batch = resident.nn_model(inference_batch)
+        except (RuntimeError, TypeError, ValueError):
+            # For example vectors of different sizes can not be stacked to a single tensor
+            pass
 
-                    return (False, trace_str, 0.0)
+        if output_batch is None:
+            return [Inferencer.__predict(resident, v) for v in vectors]
 
-                predicted_by_nn = torch.squeeze(output_batch).numpy().astype(float)
+        # Note: float is returned for each row when it consists of a single item only 
+        rows = output_batch.reshape(len(vectors), -1).tolist()
+        return [(True, resident.nn_id, row[0] if len(row) == 1 else row) for row in rows]
 
-                # Note: float is returned as the array consists of a single item only 
-                total = predicted_by_nn.tolist() 
+    @staticmethod
+    def __predict(resident: ResidentModel, v: Union[List, torch.Tensor]) -> Tuple[bool, str, float]:
+        try:
+            # Note: the input tensor is built as float32 directly, with no intermediate copies
+            if isinstance(v, torch.Tensor):
+                inference_batch = torch.unsqueeze(v, 0)
+            else:
+                inference_batch = torch.tensor([v], dtype=torch.float32)
+
+            with torch.inference_mode():
+                # Compute model output
+                output_batch = resident.nn_model(inference_batch)
+        except (RuntimeError, TypeError, ValueError):
+            # Can be caused for example by passing a wrong input 
+            trace_str = traceback.format_exc()
+            trace_str = base64.standard_b64encode(
+                trace_str.encode()).decode('utf-8')
 
-                return (True, self.__nn_id, total)
+            return (False, trace_str, 0.0)
+
+        # Note: float is returned as the output consists of a single item only 
+        total = torch.squeeze(output_batch).tolist()
+
+        return (True, resident.nn_id, total)
+
+    @staticmethod
+    def __result_not_loaded(nn_id: str) -> Tuple[bool, str, float]:
+        if nn_id == "":
+            return (False, 'No weights loaded', 0.0)
+        return (False, f'No weights loaded for NN {nn_id}', 0.0)
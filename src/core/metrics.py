@@ -0,0 +1,136 @@
+"""
+Metrics of the request handling stages exported in the Prometheus text format.
+
+"""
+
+import bisect
+
+from typing import Any, Dict, List, Tuple
+
+from core.singleton import Singleton
+
+class Stage:
+    # Gateway stages
+    API_PARSE = 'api_parse'
+    QUEUE_WAIT = 'queue_wait'
+    EXCHANGE = 'exchange'
+
+    # Worker stages
+    DECODE = 'decode'
+    INFERENCE = 'inference'
+    ENCODE = 'encode'
+
+    # The whole request handling (both Gateway and Worker)
+    REQUEST = 'request'
+
+class Counter:
+    PREDICTIONS = 'predictions'
+    PREDICTIONS_FAILED = 'predictions_failed'
+    REQUESTS_EXPIRED = 'requests_expired'
+    REQUESTS_DROPPED = 'requests_dropped'
+    REQUESTS_REJECTED = 'requests_rejected'
+    REQUESTS_THROTTLED = 'requests_throttled'
+    REQUESTS_SHED = 'requests_shed'
+    RETRIES = 'retries'
+    HEDGES = 'hedges'
+
+class Metrics(metaclass=Singleton):
+    """
+    Holds a histogram of durations (in seconds, measured with the monotonic clock) per stage
+    and the counters of the node.
+
+    The Workers pass the snapshots of their metrics to the Gateway, the Gateway renders
+    its own metrics (summed over the Gateway processes) and those of the Workers (labeled by the Worker).
+    """
+
+    BUCKETS_S = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+        0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        # Stage -> [counts by bucket (the last one is +Inf)..., sum of durations]
+        self.__stages = {}
+        self.__counters = {}
+
+    def observe(self, stage: str, duration_s: float):
+        histogram = self.__stages.get(stage)
+        if histogram is None:
+            histogram = [0] * (len(Metrics.BUCKETS_S) + 1) + [0.0]
+            self.__stages[stage] = histogram
+
+        histogram[bisect.bisect_left(Metrics.BUCKETS_S, duration_s)] += 1
+        histogram[-1] += duration_s
+
+    def inc(self, counter: str, value: int = 1):
+        self.__counters[counter] = self.__counters.get(counter, 0) + value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns the metrics as a JSON serializable object.
+        """
+        snapshot = {}
+        snapshot['stages'] = {stage: list(histogram) for stage, histogram in self.__stages.items()}
+        snapshot['counters'] = dict(self.__counters)
+        return snapshot
+
+    @staticmethod
+    def merge(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Returns the sum of the snapshots (e.g. of several Gateway processes).
+        """
+        stages = {}
+        counters = {}
+        for snapshot in snapshots:
+            for stage, histogram in snapshot.get('stages', {}).items():
+                histogram_sum = stages.get(stage)
+                if histogram_sum is None:
+                    stages[stage] = list(histogram)
+                else:
+                    stages[stage] = [a + b for a, b in zip(histogram_sum, histogram)]
+            for counter, value in snapshot.get('counters', {}).items():
+                counters[counter] = counters.get(counter, 0) + value
+
+        snapshot = {}
+        snapshot['stages'] = stages
+        snapshot['counters'] = counters
+        return snapshot
+
+    @staticmethod
+    def render(prefix: str, snapshots: List[Tuple[Dict[str, str], Dict[str, Any]]]) -> str:
+        """
+        Renders the snapshots (with the labels of each) in the Prometheus text format.
+        """
+        lines = []
+
+        name = f'{prefix}_stage_seconds'
+        lines.append(f'# HELP {name} Duration of the request handling stage.')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, snapshot in snapshots:
+            for stage, histogram in sorted(snapshot.get('stages', {}).items()):
+                labels_stage = dict(labels, stage=stage)
+                count = 0
+                for le, count_bucket in zip(Metrics.BUCKETS_S + ('+Inf',), histogram[:-1]):
+                    count += count_bucket
+                    lines.append(f'{name}_bucket{Metrics.__labels(dict(labels_stage, le=le))} {count}')
+                lines.append(f'{name}_sum{Metrics.__labels(labels_stage)} {histogram[-1]}')
+                lines.append(f'{name}_count{Metrics.__labels(labels_stage)} {count}')
+
+        counters = sorted(set(counter for _, snapshot in snapshots
+            for counter in snapshot.get('counters', {})))
+        for counter in counters:
+            name = f'{prefix}_{counter}_total'
+            lines.append(f'# TYPE {name} counter')
+            for labels, snapshot in snapshots:
+                if counter in snapshot.get('counters', {}):
+                    lines.append(f'{name}{Metrics.__labels(labels)} {snapshot["counters"][counter]}')
+
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def __labels(labels: Dict[str, Any]) -> str:
+        if len(labels) == 0:
+            return ''
+        pairs = []
+        for key, value in labels.items():
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+            pairs.append(f'{key}="{value}"')
+        return '{' + ','.join(pairs) + '}'
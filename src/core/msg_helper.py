@@ -7,79 +7,204 @@ import json
 
 from typing import Any, List, Dict
 
-from core.cls_property import classproperty
+from core.admission import PRIORITY_BULK, PRIORITY_INTERACTIVE
+from core.app_stats import ApplicationStatistics
+from core.cls_property import cached_classproperty
 from core.cmd import Command
 
 class MessageHelper:
-    @classproperty
+    MESSAGE_DEADLINE_EXCEEDED = 'Deadline exceeded'
+    MESSAGE_SERVER_BUSY = 'Server is busy'
+    MESSAGE_RATE_LIMITED = 'Rate limit exceeded'
+
+    # The counts of the Gateway processes summed up in the status
+    __GW_SNAPSHOT_COUNTS = ('queue_requests_current', 'queue_requests_max', 
+        'queue_requests_interactive', 'queue_requests_bulk')
+    __GW_SNAPSHOT_COUNTS_CACHE = ('result_cache_hits', 'result_cache_misses', 
+        'result_cache_collapsed', 'result_cache_size')
+
+    @cached_classproperty
     def cmd_status(cls) -> str:
         cmd = {}
         cmd['cmd'] = Command.STATUS
         return json.dumps(cmd)
 
+    @cached_classproperty
+    def cmd_invalidate_results(cls) -> str:
+        cmd = {}
+        cmd['cmd'] = Command.INVALIDATE_RESULTS
+        return json.dumps(cmd)
+
+    @cached_classproperty
+    def cmd_response_invalidate_results(cls) -> str:
+        cmd_resp = {}
+        cmd_resp['result'] = True
+        return json.dumps(cmd_resp)
+
     @staticmethod
     def cmd_response_status(
         addr: str, 
         nn_id: str, 
+        nn_ids: List[str],
         req_handling_time_ms: float, 
         count_values_handled: int, 
-        inference_time_ms: float) -> str:
+        inference_time_ms: float,
+        req_handling_time_summary: Dict[str, Any],
+        inference_time_summary: Dict[str, Any],
+        metrics: Dict[str, Any]) -> str:
 
         cmd_resp = {}
         cmd_resp['address'] = addr
         cmd_resp['nn_id'] = nn_id
+        cmd_resp['nn_ids'] = nn_ids
         cmd_resp['req_handling_time_avg_ms'] = req_handling_time_ms
         cmd_resp['count_requests_handled'] = count_values_handled
         cmd_resp['inference_time_avg_ms'] = inference_time_ms
+        cmd_resp['req_handling_time_ms'] = req_handling_time_summary
+        cmd_resp['inference_time_ms'] = inference_time_summary
+        cmd_resp['metrics'] = metrics
         return json.dumps(cmd_resp)
 
     @staticmethod
-    def cmd_set_weights(nn_id: str, data: str) -> str:
+    def cmd_set_weights(nn_id: str, weights_hash: str, size: int, count_chunks: int, optimization: str) -> str:
+        """
+        Note: the empty optimization means the one set up for every Worker.
+        """
         cmd = {}
         cmd['cmd'] = Command.SET_WEIGHTS
         cmd['nn_id'] = nn_id
-        cmd['data'] = data
+        cmd['hash'] = weights_hash
+        cmd['size'] = size
+        cmd['count_chunks'] = count_chunks
+        cmd['optimization'] = optimization
         return json.dumps(cmd)
 
     @staticmethod
-    def cmd_response_set_weights(res_status: bool, res_trace_str: str) -> str:
+    def cmd_set_weights_chunk(weights_hash: str, index: int, compression: str, chunk: bytes) -> bytes:
+        """
+        Note: the chunk is passed as is, after the command and a new line separator.
+        """
+        cmd = {}
+        cmd['cmd'] = Command.SET_WEIGHTS_CHUNK
+        cmd['hash'] = weights_hash
+        cmd['index'] = index
+        cmd['compression'] = compression
+        return b'\n'.join((json.dumps(cmd).encode(), chunk))
+
+    @staticmethod
+    def cmd_set_weights_end(weights_hash: str) -> str:
+        cmd = {}
+        cmd['cmd'] = Command.SET_WEIGHTS_END
+        cmd['hash'] = weights_hash
+        return json.dumps(cmd)
+
+    @staticmethod
+    def cmd_response_set_weights_begin(skipped: bool, cached: bool, compressions: List[str]) -> str:
+        """
+        Note: the weights skipped are held already, the weights cached are loaded (from the Worker's cache) 
+        at the end of the transfer, neither are transferred.
+        """
+        cmd_resp = {}
+        cmd_resp['result'] = True
+        cmd_resp['skipped'] = skipped
+        cmd_resp['cached'] = cached
+        cmd_resp['compressions'] = compressions
+        return json.dumps(cmd_resp)
+
+    @staticmethod
+    def cmd_response_set_weights_chunk(res_status: bool) -> str:
         cmd_resp = {}
         cmd_resp['result'] = res_status
-        if not res_status and res_trace_str != "": 
-            cmd_resp['trace'] = res_trace_str
         return json.dumps(cmd_resp)
 
     @staticmethod
-    def cmd_response_predict(res) -> str:
+    def cmd_response_set_weights(res_status: bool, res_trace_str: str, skipped: bool = False) -> str:
         cmd_resp = {}
-        cmd_resp['status'] = res[0]
-        cmd_resp['message'] = res[1]
-        cmd_resp['result'] = res[2]
+        cmd_resp['result'] = res_status
+        if skipped:
+            cmd_resp['skipped'] = True
+        if not res_status and res_trace_str != "": 
+            cmd_resp['trace'] = res_trace_str
         return json.dumps(cmd_resp)
 
-    @classproperty
+    @cached_classproperty
     def api_response_server_busy(cls) -> str:
         resp = {}
         resp['status'] = False
-        resp['message'] = 'Server is busy'
+        resp['message'] = MessageHelper.MESSAGE_SERVER_BUSY
+        return json.dumps(resp)
+
+    @cached_classproperty
+    def api_response_rate_limited(cls) -> str:
+        resp = {}
+        resp['status'] = False
+        resp['message'] = MessageHelper.MESSAGE_RATE_LIMITED
         return json.dumps(resp)
 
+    @cached_classproperty
+    def api_response_deadline_exceeded(cls) -> str:
+        resp = {}
+        resp['status'] = False
+        resp['message'] = MessageHelper.MESSAGE_DEADLINE_EXCEEDED
+        return json.dumps(resp)
+
+    @staticmethod
+    def gw_snapshot(
+        index: int,
+        admission: Any,
+        req_handling_time_export: Dict[str, Any],
+        result_cache: Any,
+        routing: List[Any],
+        metrics: Dict[str, Any]) -> Dict[str, Any]:
+
+        snapshot = {}
+        snapshot['gateway'] = index
+        snapshot['queue_requests_current'] = admission.count
+        snapshot['queue_requests_max'] = admission.size
+        snapshot['queue_requests_interactive'] = admission.count_by_priority(PRIORITY_INTERACTIVE)
+        snapshot['queue_requests_bulk'] = admission.count_by_priority(PRIORITY_BULK)
+        snapshot['req_handling_time_ms'] = req_handling_time_export
+        snapshot['result_cache_hits'] = result_cache.count_hits
+        snapshot['result_cache_misses'] = result_cache.count_misses
+        snapshot['result_cache_collapsed'] = result_cache.count_collapsed
+        snapshot['result_cache_size'] = result_cache.count_results
+        snapshot['routing'] = [MessageHelper.__routing_entry(index, w) for w in routing]
+        snapshot['metrics'] = metrics
+        return snapshot
+
     @staticmethod
-    def api_response_status(
-        queue_requests_current: int,
-        queue_requests_max: int, 
-        req_handling_time_avg_ms: float, 
-        results: List[Any]) -> str:
+    def api_response_status(snapshots: List[Dict[str, Any]], results: List[Any]) -> Dict[str, Any]:
+        """
+        Returns the status of the Gateway processes (their snapshots summed up) and Workers.
+        """
+        req_handling_time_summary = ApplicationStatistics.summarize(
+            [snapshot['req_handling_time_ms'] for snapshot in snapshots])
 
         resp = {}
         resp['status'] = True
         resp['message'] = 'OK'
-        resp['queue_requests_current'] = queue_requests_current
-        resp['queue_requests_max'] = queue_requests_max
-        resp['req_handling_time_avg_ms'] = req_handling_time_avg_ms
+        resp['gateways_count'] = len(snapshots)
+        for key in MessageHelper.__GW_SNAPSHOT_COUNTS:
+            resp[key] = sum(snapshot[key] for snapshot in snapshots)
+        resp['req_handling_time_avg_ms'] = req_handling_time_summary['avg']
+        resp['req_handling_time_ms'] = req_handling_time_summary
+        for key in MessageHelper.__GW_SNAPSHOT_COUNTS_CACHE:
+            resp[key] = sum(snapshot[key] for snapshot in snapshots)
+        resp['routing'] = [entry for snapshot in snapshots for entry in snapshot['routing']]
         resp['workers_count'] = len(results)
         resp['workers'] = results
-        return json.dumps(resp)
+        return resp
+
+    @staticmethod
+    def __routing_entry(index: int, worker: Any) -> Dict[str, Any]:
+        entry = {}
+        entry['gateway'] = index
+        entry['address'] = worker.address
+        entry['requests_in_flight'] = worker.count_in_flight
+        entry['count_requests'] = worker.count_requests
+        entry['count_timeouts'] = worker.count_timeouts
+        entry['latency_ewma_ms'] = worker.latency_ewma_ms
+        return entry
 
     @staticmethod
     def api_response_set_weights(overall_result: bool, results: List[Any]) -> str:
@@ -87,6 +212,9 @@ class MessageHelper:
         if overall_result:
           resp['status'] = True
           resp['message'] = 'OK'
+        elif len(results) == 0:
+          resp['status'] = False
+          resp['message'] = 'No workers responded'
         else:
           resp['status'] = False
           resp['message'] = 'One or more workers were failed with weights loading'
@@ -95,9 +223,40 @@ class MessageHelper:
         return json.dumps(resp)
 
     @staticmethod
-    def api_response_predict(result: Dict[str, Any]) -> str:
+    def api_response_predict(result: Dict[str, Any]) -> Dict[str, Any]:
         resp = {}
         resp['status'] = result['status']
         resp['message'] = result['message']
         resp['result'] = result['result']
-        return json.dumps(resp)
+        return resp
+
+    @staticmethod
+    def api_response_predict_stream(tag: Any, result: Dict[str, Any]) -> Dict[str, Any]:
+        resp = {}
+        resp['id'] = tag
+        resp['status'] = result['status']
+        resp['message'] = result['message']
+        resp['result'] = result['result']
+        return resp
+
+    @staticmethod
+    def result_failed(message: str) -> Dict[str, Any]:
+        res = {}
+        res['status'] = False
+        res['message'] = message
+        res['result'] = 0.0
+        return res
+
+    @staticmethod
+    def api_response_predict_batch(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        overall_result = all(res['status'] for res in results)
+
+        resp = {}
+        resp['status'] = overall_result
+        if overall_result:
+            resp['message'] = 'OK'
+        else:
+            resp['message'] = 'One or more predictions were failed'
+        resp['count'] = len(results)
+        resp['results'] = results
+        return resp
@@ -0,0 +1,16 @@
+"""
+Optimizations of NN models applied by Workers when the weights are loaded (see core.optimizer).
+
+Note: the names are checked by the Gateway as well, so nothing is imported here.
+"""
+
+# The model is run as is (eager)
+OPTIMIZATION_NONE = 'none'
+
+# The model is traced and frozen with TorchScript
+OPTIMIZATION_SCRIPT = 'script'
+
+# The linear layers are quantized to int8 dynamically, then the model is traced and frozen
+OPTIMIZATION_INT8 = 'int8'
+
+OPTIMIZATIONS = (OPTIMIZATION_NONE, OPTIMIZATION_SCRIPT, OPTIMIZATION_INT8)
@@ -0,0 +1,59 @@
+"""
+Optimizer of NN models: applies the optimization to the model loaded and checks its accuracy 
+against the eager model on a probe batch.
+
+"""
+
+import torch
+import warnings
+
+from core.optimization import OPTIMIZATION_INT8, OPTIMIZATION_NONE, OPTIMIZATIONS
+
+# Note: TorchScript and eager mode quantization are deprecated by recent PyTorch versions, yet supported
+warnings.filterwarnings('ignore', message=r'`torch\.jit\.\w+` is deprecated')
+warnings.filterwarnings('ignore', message=r'torch\.ao\.quantization is deprecated')
+warnings.filterwarnings('ignore', message=r'torch\.quantize_per_tensor')
+
+# The probe batch is the same for every load, so the accuracy checks are reproducible
+SIZE_PROBE = 64
+PROBE_SEED = 0
+
+# TorchScript optimizes the model during the first runs
+COUNT_WARMUP_RUNS = 3
+
+def make_probe(count_features: int) -> torch.Tensor:
+    """
+    Returns the batch of input vectors the optimized model is traced and checked with.
+    """
+    generator = torch.Generator().manual_seed(PROBE_SEED)
+    return torch.randn(SIZE_PROBE, count_features, generator=generator)
+
+def optimize(nn_model: torch.nn.Module, optimization: str, probe: torch.Tensor) -> torch.nn.Module:
+    """
+    Returns the model optimized (the model itself for OPTIMIZATION_NONE), the model should be in eval mode.
+    Raises an exception (of any kind) when the model can not be optimized.
+    """
+    assert optimization in OPTIMIZATIONS, \
+        f"optimization should be one of {OPTIMIZATIONS}, got: {optimization}"
+
+    if optimization == OPTIMIZATION_NONE:
+        return nn_model
+
+    if optimization == OPTIMIZATION_INT8:
+        nn_model = torch.ao.quantization.quantize_dynamic(nn_model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    # Note: the quantized model is traced as well, as it's slower than the eager model otherwise
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(nn_model, probe))
+
+def measure_error(nn_model: torch.nn.Module, nn_model_eager: torch.nn.Module, probe: torch.Tensor) -> float:
+    """
+    Returns the maximum difference of the model's outputs from the eager model's ones on the probe batch,
+    relative to the maximum output of the eager model. The model is warmed up meanwhile.
+    """
+    with torch.inference_mode():
+        expected = nn_model_eager(probe)
+        for _ in range(COUNT_WARMUP_RUNS):
+            actual = nn_model(probe)
+
+    return ((actual - expected).abs().max() / expected.abs().max().clamp(min=1e-6)).item()
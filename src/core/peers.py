@@ -0,0 +1,62 @@
+"""
+Calls between the Gateway processes sharing the Workers.
+
+"""
+
+import json
+import pynng
+import trio
+
+from typing import Any, Dict, List
+
+class Peers:
+    """
+    The Gateway processes (see --processes of the Gateway) serve the same REST port
+    and the same Workers, every process has its own admission queue, result cache and statistics.
+
+    Every process surveys the others (peers) to aggregate the status and metrics of the Gateway,
+    and to drop the results cached once new weights are loaded through it.
+    The surveys are responded by task_gw_peers.
+    """
+
+    def __init__(self, surveyor: pynng.Surveyor0, index: int, count_processes: int, survey_time_ms: int):
+        assert 0 <= index < count_processes, \
+            f"process index should be in [0, {count_processes}), got: {index}"
+        assert survey_time_ms > 0, \
+            f"survey time should be greater than 0, got: {survey_time_ms}"
+
+        self.__surveyor = surveyor
+        self.__index = index
+        self.__count_peers = count_processes - 1
+        self.__survey_time_ms = survey_time_ms
+
+        # Note: a new survey cancels the one in progress, so the surveys are made one by one
+        self.__lock = trio.Lock()
+
+    @property
+    def index(self) -> int:
+        """
+        Returns the index of this Gateway process.
+        """
+        return self.__index
+
+    async def survey(self, message: bytes) -> List[Dict[str, Any]]:
+        """
+        Returns the responses of the peers responded within the survey time.
+        """
+        if self.__count_peers == 0:
+            return []
+
+        async with self.__lock:
+            self.__surveyor.survey_time = self.__survey_time_ms
+            await self.__surveyor.asend(message)
+
+            responses = []
+            while len(responses) < self.__count_peers:
+                try:
+                    response_bytes = await self.__surveyor.arecv()
+                except pynng.Timeout:
+                    break
+                responses.append(json.loads(response_bytes.decode('utf-8')))
+
+        return responses
@@ -0,0 +1,73 @@
+"""
+Requests travelling between the REST API and the cluster tasks.
+
+"""
+
+import time
+import trio
+import uuid
+
+from typing import Any
+
+class PendingRequest:
+    """
+    A request together with its own one-shot reply slot.
+
+    The caller sends the request to a cluster task and waits on the slot,
+    the cluster task replies to this exact request. So concurrent callers
+    never see each other's responses and responses may complete out of order.
+    """
+
+    def __init__(self, payload: Any):
+        self.__id = uuid.uuid4().hex
+        self.__payload = payload
+        self.__time_created = time.perf_counter()
+        self.__chan_send, self.__chan_receive = trio.open_memory_channel(1)
+
+    @property
+    def id(self) -> str:
+        return self.__id
+
+    @property
+    def payload(self) -> Any:
+        return self.__payload
+
+    @property
+    def time_created(self) -> float:
+        """
+        Returns the time the request is created at (the value of time.perf_counter).
+        """
+        return self.__time_created
+
+    @property
+    def abandoned(self) -> bool:
+        """
+        Returns True when the caller is not waiting for the response anymore.
+        """
+        return self.__chan_send.statistics().open_receive_channels == 0
+
+    def reply(self, response: Any):
+        """
+        Passes the response to the waiting caller.
+
+        Never blocks: only the first response is kept, the response is dropped
+        when the caller is not waiting anymore.
+        """
+        try:
+            self.__chan_send.send_nowait(response)
+        except (trio.WouldBlock, trio.BrokenResourceError, trio.ClosedResourceError):
+            pass
+        self.__chan_send.close()
+
+    def abandon(self):
+        """
+        Tells the request is not waited for anymore (see abandoned), the response is dropped.
+        """
+        self.__chan_receive.close()
+
+    async def wait(self) -> Any:
+        """
+        Waits for the response to this request.
+        """
+        with self.__chan_receive:
+            return await self.__chan_receive.receive()
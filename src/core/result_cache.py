@@ -0,0 +1,126 @@
+"""
+Prediction results cache of the Gateway.
+
+"""
+
+import time
+import trio
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+class ResultCache:
+    """
+    Bounded LRU cache of successful prediction results with the time to live,
+    keyed by the NN id and the packed input vector.
+
+    In the single-flight mode identical requests being in flight at once are collapsed:
+    only the first one is passed to the cluster, the rest wait for its result.
+
+    The cache is disabled when both its size is 0 and the single-flight mode is off.
+    """
+
+    def __init__(self, size: int, ttl_s: float, single_flight: bool):
+        assert size >= 0, \
+            f"cache size should not be negative, got: {size}"
+        assert ttl_s > 0, \
+            f"time to live should be greater than 0, got: {ttl_s}"
+
+        self.__size = size
+        self.__ttl_s = ttl_s
+        self.__single_flight = single_flight
+
+        self.__results = OrderedDict()
+        self.__in_flight = {}
+
+        # Results computed before the invalidation are not stored
+        self.__generation = 0
+
+        self.__count_hits = 0
+        self.__count_misses = 0
+        self.__count_collapsed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.__size > 0 or self.__single_flight
+
+    @property
+    def count_hits(self) -> int:
+        return self.__count_hits
+
+    @property
+    def count_misses(self) -> int:
+        return self.__count_misses
+
+    @property
+    def count_collapsed(self) -> int:
+        return self.__count_collapsed
+
+    @property
+    def count_results(self) -> int:
+        return len(self.__results)
+
+    async def get(self, nn_id: str, data: bytes,
+        predict: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Returns the result cached, otherwise the one made by predict (stored when successful).
+        """
+        key = (nn_id, bytes(data))
+
+        entry = self.__results.get(key)
+        if entry is not None:
+            result, time_expire = entry
+            if time.monotonic() < time_expire:
+                self.__results.move_to_end(key)
+                self.__count_hits += 1
+                return result
+            del self.__results[key]
+
+        if key in self.__in_flight:
+            event, slot = self.__in_flight[key]
+            await event.wait()
+            if len(slot) > 0:
+                self.__count_collapsed += 1
+                return slot[0]
+            # The request in flight was cancelled: the prediction is made on its own
+
+        self.__count_misses += 1
+        return await self.__predict(key, predict)
+
+    def invalidate(self):
+        """
+        Drops all the results (the weights of NNs are changed).
+        """
+        self.__results.clear()
+        self.__in_flight.clear()
+        self.__generation += 1
+
+    async def __predict(self, key: Tuple[str, bytes],
+        predict: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+
+        if not self.__single_flight:
+            result = await predict()
+            self.__store(key, result, self.__generation)
+            return result
+
+        event, slot = trio.Event(), []
+        self.__in_flight[key] = (event, slot)
+        generation = self.__generation
+        try:
+            result = await predict()
+            slot.append(result)
+            self.__store(key, result, generation)
+            return result
+        finally:
+            if self.__in_flight.get(key, (None, None))[0] is event:
+                del self.__in_flight[key]
+            event.set()
+
+    def __store(self, key: Tuple[str, bytes], result: Dict[str, Any], generation: int):
+        if self.__size == 0 or not result['status'] or generation != self.__generation:
+            return
+
+        self.__results[key] = (result, time.monotonic() + self.__ttl_s)
+        self.__results.move_to_end(key)
+        if len(self.__results) > self.__size:
+            self.__results.popitem(last=False)
@@ -0,0 +1,246 @@
+"""
+Load-aware routing of the computation requests from the Gateway to Workers.
+
+"""
+
+import math
+import pynng
+import random
+import trio
+
+from typing import Any, Collection, Dict, List, Optional
+
+from core.frame import Frame
+from core.utility import addr_bound, addr_for_worker
+
+ROUTING_LEAST_OUTSTANDING = 'least_outstanding'
+ROUTING_P2C = 'p2c'
+
+class WorkerState:
+    """
+    A Worker connected to the Gateway's computation socket.
+
+    The requests are sent to the Worker through its own socket, the responses are 
+    received through the pipe of the socket shared by all the Workers.
+    """
+
+    def __init__(self, pipe: Any, sock: pynng.Socket, latency_ms: float):
+        self.pipe = pipe
+        self.sock = sock
+        self.count_in_flight = 0
+        self.count_requests = 0
+        self.count_timeouts = 0
+        self.latency_ewma_ms = latency_ms
+
+        # The status and metrics pushed by the Worker with its last heartbeat
+        self.status = None
+        self.metrics = {}
+        self.time_heartbeat = 0.0
+
+    @property
+    def address(self) -> str:
+        return str(self.pipe.remote_address)
+
+    @property
+    def cost(self) -> float:
+        """
+        The expected time to complete one more request on this Worker.
+        """
+        return (self.count_in_flight + 1) * self.latency_ewma_ms
+
+class Router:
+    """
+    Keeps the table of Workers connected with their requests in flight and
+    the exponentially weighted moving average (EWMA) of their latency.
+
+    A request is passed to the Worker expected to complete it first: either the best of
+    all the Workers (least outstanding requests weighted by latency), or the best of
+    two Workers chosen at random (power of two choices). The Workers timed out are
+    accounted with the latency of the timeout, so they are avoided.
+
+    The Workers push their status with heartbeats, the Workers not heard from 
+    for the expiry time are not the members of the cluster anymore.
+
+    Every Worker connected gets its own computation socket: the socket shared by all the Workers
+    is polyamorous, and nng drops the messages sent through it when the Worker falls behind
+    (the requests are sent through the Worker's own socket with backpressure instead).
+
+    All the methods are called from the trio thread, the pipe callbacks of nng
+    are passed there with the trio token.
+    """
+
+    # Latency assumed for the first Worker connected
+    LATENCY_INITIAL_MS = 1.0
+
+    def __init__(self, routing: str, ewma_alpha: float, heartbeat_expiry_ms: int):
+        assert routing in (ROUTING_LEAST_OUTSTANDING, ROUTING_P2C), \
+            f"unknown routing: {routing}"
+        assert 0.0 < ewma_alpha <= 1.0, \
+            f"EWMA alpha should be in (0, 1], got: {ewma_alpha}"
+        assert heartbeat_expiry_ms > 0, \
+            f"heartbeat expiry time should be greater than 0, got: {heartbeat_expiry_ms}"
+
+        self.__routing = routing
+        self.__ewma_alpha = ewma_alpha
+        self.__heartbeat_expiry_s = heartbeat_expiry_ms / 1000
+
+        self.__workers = {}
+        self.__workers_changed = trio.Event()
+
+        # The pipes of the Workers connected, not given their own sockets yet
+        self.__addr = ''
+        self.__pipes_connected = {}
+        self.__chan_pipes_send, self.__chan_pipes_receive = trio.open_memory_channel(math.inf)
+
+        # (Worker's pipe id, request id) -> reply slot
+        self.__in_flight = {}
+
+    @property
+    def workers(self) -> List[WorkerState]:
+        return list(self.__workers.values())
+
+    @property
+    def members(self) -> List[WorkerState]:
+        """
+        Returns the Workers sent heartbeats within the expiry time.
+        """
+        time_expired = trio.current_time() - self.__heartbeat_expiry_s
+        return [w for w in self.__workers.values()
+            if w.status is not None and w.time_heartbeat > time_expired]
+
+    def attach(self, sock: pynng.Socket, addr: str):
+        """
+        Tracks the Workers connecting to and disconnecting from the socket listening at addr.
+        """
+        self.__addr = addr
+        token = trio.lowlevel.current_trio_token()
+
+        def run_in_trio(fn, pipe):
+            try:
+                token.run_sync_soon(fn, pipe)
+            except trio.RunFinishedError:
+                pass
+
+        sock.add_post_pipe_connect_cb(lambda pipe: run_in_trio(self.__connect, pipe))
+        sock.add_post_pipe_remove_cb(lambda pipe: run_in_trio(self.__disconnect, pipe))
+
+    async def connect_workers(self):
+        """
+        Gives every Worker connected its own socket: listens for the Worker at the address of its own
+        and passes the address to the Worker (the first message of the pipe, so it's never dropped).
+        Runs until cancelled, the sockets are closed then.
+        """
+        try:
+            async for pipe in self.__chan_pipes_receive:
+                if pipe.id not in self.__pipes_connected:
+                    continue
+
+                sock = pynng.Pair1()
+                try:
+                    addr = addr_for_worker(self.__addr, pipe.id)
+                    listener = sock.listen(addr)
+                    addr = addr_bound(addr, str(listener.local_address))
+                    await pipe.asend(Frame.encode_address(addr))
+                except pynng.NNGException:
+                    sock.close()
+                    continue
+
+                if self.__pipes_connected.pop(pipe.id, None) is None:
+                    # The Worker has disconnected meanwhile
+                    sock.close()
+                    continue
+
+                # A new Worker starts with the best latency known, so it's tried soon
+                latency_ms = min((w.latency_ewma_ms for w in self.__workers.values()),
+                    default=Router.LATENCY_INITIAL_MS)
+                self.__workers[pipe.id] = WorkerState(pipe, sock, latency_ms)
+                self.__notify()
+        finally:
+            for worker in self.__workers.values():
+                worker.sock.close()
+
+    async def choose(self, exclude: Collection[WorkerState] = ()) -> WorkerState:
+        """
+        Returns the best Worker (waits for a Worker to connect when there are none).
+
+        The Workers excluded are chosen only when there are no others.
+        """
+        while len(self.__workers) == 0:
+            await self.__workers_changed.wait()
+
+        workers = [w for w in self.__workers.values() if w not in exclude]
+        if len(workers) == 0:
+            workers = list(self.__workers.values())
+        if self.__routing == ROUTING_P2C and len(workers) > 2:
+            workers = random.sample(workers, 2)
+        return min(workers, key=lambda w: w.cost)
+
+    async def exchange(self, worker: WorkerState, request_id: str, frame: bytes,
+        timeout_s: float = math.inf) -> Optional[bytes]:
+        """
+        Passes the request frame to the Worker.
+
+        Returns the response frame, or None when the Worker disconnected or did not respond in time.
+        """
+        key = (worker.pipe.id, request_id)
+        slot_send, slot_receive = trio.open_memory_channel(1)
+        self.__in_flight[key] = slot_send
+        worker.count_in_flight += 1
+        time_start = trio.current_time()
+        response = None
+        try:
+            with trio.move_on_after(timeout_s) as cancel_scope:
+                await worker.sock.asend(frame)
+                response = await slot_receive.receive()
+        except pynng.NNGException:
+            pass
+        finally:
+            self.__in_flight.pop(key, None)
+            worker.count_in_flight -= 1
+
+        if cancel_scope.cancelled_caught:
+            # Note: the latency is known to be the timeout at least, so the Worker stalled is avoided
+            worker.count_timeouts += 1
+            self.__update_latency(worker, timeout_s * 1000)
+        elif response is not None:
+            worker.count_requests += 1
+            self.__update_latency(worker, (trio.current_time() - time_start) * 1000)
+        return response
+
+    def deliver(self, pipe: Any, request_id: str, response: bytes):
+        """
+        Passes the response frame received from the Worker to the request waiting for it.
+        """
+        slot_send = self.__in_flight.pop((pipe.id, request_id), None)
+        if slot_send is not None:
+            slot_send.send_nowait(response)
+
+    def heartbeat(self, pipe: Any, status: Dict[str, Any]):
+        worker = self.__workers.get(pipe.id)
+        if worker is not None:
+            worker.metrics = status.pop('metrics', {})
+            worker.status = status
+            worker.time_heartbeat = trio.current_time()
+
+    def __update_latency(self, worker: WorkerState, latency_ms: float):
+        worker.latency_ewma_ms += self.__ewma_alpha * (latency_ms - worker.latency_ewma_ms)
+
+    def __connect(self, pipe: Any):
+        self.__pipes_connected[pipe.id] = pipe
+        self.__chan_pipes_send.send_nowait(pipe)
+
+    def __disconnect(self, pipe: Any):
+        self.__pipes_connected.pop(pipe.id, None)
+        worker = self.__workers.pop(pipe.id, None)
+        if worker is None:
+            return
+        worker.sock.close()
+
+        # Requests in flight are never responded by this Worker
+        for key in [key for key in self.__in_flight if key[0] == pipe.id]:
+            self.__in_flight.pop(key).send_nowait(None)
+        self.__notify()
+
+    def __notify(self):
+        self.__workers_changed.set()
+        self.__workers_changed = trio.Event()
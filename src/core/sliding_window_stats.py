@@ -3,12 +3,27 @@ Sliding Window statistics calculator.
 
 """
 
-from typing import List
+import time
+
+from array import array
+from collections import deque
+
+from core.histogram import LogHistogram
+from core.time_window_stats import TimeWindowSnapshot, TimeWindowStats
 
 class SlidingWindowStats:
     """
-    This class supports the Sliding Window based "average value" statistics computation. 
+    This class supports the Sliding Window based statistics computation:
+    the average value, percentiles and maximum of the last window_size values,
+    and the same statistics (with rates) of the values added within the last seconds (see TIME_WINDOWS_S).
+
+    Adding a value has O(1) complexity (amortized): the values are kept in a ring buffer,
+    counted in a histogram with logarithmic buckets, and the candidates for the maximum
+    are kept in a monotonic queue.
     """
+
+    TIME_WINDOWS_S = (1, 10, 60)
+
     def __init__(self, window_size = 100, modifications_before_fix = 100000000):
         assert window_size > 1, \
             f"window size should be greater than 1, got: {window_size}"
@@ -16,9 +31,18 @@ class SlidingWindowStats:
             f"modifications count should be greater than 1, got: {modifications_before_fix}"
 
         self.__window_size = window_size
-        self.__modifications_before_fix = modifications_before_fix 
+        self.__modifications_before_fix = modifications_before_fix
+
+        self.__values = array('d', bytes(8 * window_size))
+        # Note: the histogram buckets of the values are kept, so they are computed once per value
+        self.__buckets = array('i', bytes(4 * window_size))
+        self.__count_values = 0
+        self.__index_next = 0
+        self.__histogram = LogHistogram()
+        # (number of the value, value) of the values greater than all the values added after them
+        self.__max_candidates = deque()
+        self.__time_windows = TimeWindowStats(max(SlidingWindowStats.TIME_WINDOWS_S))
 
-        self.__values = []
         self.__total = 0.0
         self.__total_is_valid = True
         self.__count_modifications = 0
@@ -33,15 +57,43 @@ class SlidingWindowStats:
         """
         Returns the average value of the current Sliding Window.
 
-        When necessary, computes the value on the fly. 
-        In case of computation has O(n) complexity 
+        When necessary, computes the value on the fly.
+        In case of computation has O(n) complexity
         (where n is the Sliding Window size), otherwise O(1)
-        """ 
-        if len(self.__values) == 0:
+        """
+        if self.__count_values == 0:
             return 0.0
         if not self.__total_is_valid:
             self.__compute_total()
-        return self.__total / len(self.__values)
+        return self.__total / self.__count_values
+
+    @property
+    def max(self) -> float:
+        """
+        Returns the maximum value of the current Sliding Window (with O(1) complexity).
+        """
+        if self.__count_values == 0:
+            return 0.0
+        return self.__max_candidates[0][1]
+
+    @property
+    def histogram(self) -> LogHistogram:
+        """
+        Returns the histogram of the values of the current Sliding Window (not to be modified).
+        """
+        return self.__histogram
+
+    def percentile(self, q: float) -> float:
+        """
+        Returns the q-th percentile (q is in [0, 100]) of the current Sliding Window.
+        """
+        return self.__histogram.percentile(q)
+
+    def time_window(self, window_s: float) -> TimeWindowSnapshot:
+        """
+        Returns the statistics of the values added within the last window_s seconds.
+        """
+        return self.__time_windows.snapshot(window_s, time.monotonic())
 
     def add_value(self, value: float):
         """
@@ -49,18 +101,32 @@ class SlidingWindowStats:
         """
 
         self.__count_values_handled += 1
+        bucket = LogHistogram.bucket(value)
+        self.__time_windows.add_value(value, time.monotonic(), bucket)
+
+        if self.__count_values == self.__window_size:
+            self.__remove_oldest_value()
+        else:
+            self.__count_values += 1
 
-        self.__ensure_place_available()
-        self.__values.append(value)
+        self.__values[self.__index_next] = value
+        self.__buckets[self.__index_next] = bucket
+        self.__index_next = (self.__index_next + 1) % self.__window_size
+        self.__histogram.add_to_bucket(bucket)
         self.__value_is_added(value)
 
-    def __ensure_place_available(self):
-        if len(self.__values) == self.__window_size:
-            self.__remove_oldest_value()
+        # Note: the values before the greater one added are never the maximum anymore
+        max_candidates = self.__max_candidates
+        while len(max_candidates) > 0 and max_candidates[-1][1] <= value:
+            max_candidates.pop()
+        max_candidates.append((self.__count_values_handled, value))
+        if max_candidates[0][0] <= self.__count_values_handled - self.__window_size:
+            max_candidates.popleft()
 
     def __remove_oldest_value(self):
-        assert len(self.__values) > 0, "unable to remove from the empty sliding window"
-        value_removed = self.__values.pop(0)
+        # Note: the oldest value is the one to be overwritten next
+        value_removed = self.__values[self.__index_next]
+        self.__histogram.remove_from_bucket(self.__buckets[self.__index_next])
         self.__value_is_removed(value_removed)
 
     def __value_is_removed(self, value_removed: float):
@@ -72,13 +138,13 @@ class SlidingWindowStats:
         else:
             self.__total += value_added
             self.__count_modifications += 1
- 
+
     def __modifications_limit_reached(self):
         self.__total_is_valid = False
 
     def __compute_total(self):
         self.__total = 0.0
-        for value in self.__values:
+        for value in self.__values[:self.__count_values]:
             self.__total += value
 
         self.__count_modifications = 0
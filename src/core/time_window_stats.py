@@ -0,0 +1,126 @@
+"""
+Time Window statistics calculator.
+
+"""
+
+import math
+
+from typing import Optional
+
+from core.histogram import LogHistogram
+
+class TimeWindowSnapshot:
+    """
+    Statistics of the values added within a time window.
+    """
+
+    def __init__(self, window_s: float, count: int, total: float, value_max: float,
+        histogram: LogHistogram):
+
+        self.__window_s = window_s
+        self.__count = count
+        self.__total = total
+        self.__value_max = value_max
+        self.__histogram = histogram
+
+    @property
+    def window_s(self) -> float:
+        return self.__window_s
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    @property
+    def rate(self) -> float:
+        """
+        Returns the number of values added per second.
+        """
+        return self.__count / self.__window_s
+
+    @property
+    def average(self) -> float:
+        if self.__count == 0:
+            return 0.0
+        return self.__total / self.__count
+
+    @property
+    def max(self) -> float:
+        return self.__value_max
+
+    @property
+    def histogram(self) -> LogHistogram:
+        return self.__histogram
+
+    def percentile(self, q: float) -> float:
+        return self.__histogram.percentile(q)
+
+class _Slot:
+    def __init__(self):
+        self.tick = -1
+        self.count = 0
+        self.total = 0.0
+        self.value_max = 0.0
+        self.histogram = LogHistogram()
+
+    def reset(self, tick: int):
+        self.tick = tick
+        self.count = 0
+        self.total = 0.0
+        self.value_max = 0.0
+        self.histogram.clear()
+
+class TimeWindowStats:
+    """
+    This class supports the statistics of the values added within the last seconds
+    (up to horizon_s seconds).
+
+    The time is split to slots of resolution_s seconds kept in a ring,
+    so adding a value has O(1) complexity and the oldest values are dropped
+    as their slots are reused.
+    """
+
+    def __init__(self, horizon_s: float, resolution_s: float = 0.1):
+        assert resolution_s > 0, \
+            f"resolution should be greater than 0, got: {resolution_s}"
+        assert horizon_s >= resolution_s, \
+            f"horizon should not be less than resolution, got: {horizon_s}"
+
+        self.__resolution_s = resolution_s
+        self.__slots = [_Slot() for _ in range(math.ceil(horizon_s / resolution_s) + 1)]
+
+    def add_value(self, value: float, time_now: float, bucket: Optional[int] = None):
+        """
+        Adds the value, its LogHistogram bucket is computed when not passed.
+        """
+        tick = int(time_now / self.__resolution_s)
+        slot = self.__slots[tick % len(self.__slots)]
+        if slot.tick != tick:
+            slot.reset(tick)
+
+        slot.count += 1
+        slot.total += value
+        if value > slot.value_max:
+            slot.value_max = value
+        slot.histogram.add_to_bucket(LogHistogram.bucket(value) if bucket is None else bucket)
+
+    def snapshot(self, window_s: float, time_now: float) -> TimeWindowSnapshot:
+        """
+        Returns the statistics of the values added within the last window_s seconds.
+        """
+        tick_now = int(time_now / self.__resolution_s)
+        count_ticks = min(round(window_s / self.__resolution_s), len(self.__slots) - 1)
+        tick_oldest = tick_now - count_ticks
+
+        count = 0
+        total = 0.0
+        value_max = 0.0
+        histogram = LogHistogram()
+        for slot in self.__slots:
+            if tick_oldest < slot.tick <= tick_now:
+                count += slot.count
+                total += slot.total
+                value_max = max(value_max, slot.value_max)
+                histogram.merge(slot.histogram)
+
+        return TimeWindowSnapshot(count_ticks * self.__resolution_s, count, total, value_max, histogram)
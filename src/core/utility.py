@@ -1,9 +1,19 @@
+import functools
+import re
+import socket
+
 from netifaces import interfaces, ifaddresses, AF_INET
 from typing import List
 
+# The TCP address: everything up to the port, the port
+_ADDR_TCP = re.compile(r'(tcp[46]?://.*:)(\d+)')
+
+@functools.lru_cache(maxsize=1)
 def get_local_ips() -> List:
     """ 
     Assumes the host has an external IP
+
+    Note: the interfaces are walked once, the same list is returned afterwards.
     """
 
     result = []
@@ -13,3 +23,69 @@ def get_local_ips() -> List:
         if addr != 'No IP addr' and addr != '127.0.0.1':
             result.append(addr)
     return result
+
+def addr_for_process(addr: str, index: int, port_step: int) -> str:
+    """
+    Returns the address of the Gateway process with the index specified:
+    the TCP port is greater by index * port_step, other addresses get the index suffix.
+
+    The first process (index 0) uses the address as is.
+    """
+
+    if index == 0:
+        return addr
+
+    match = _ADDR_TCP.fullmatch(addr)
+    if match is not None:
+        return f'{match.group(1)}{int(match.group(2)) + index * port_step}'
+    return f'{addr}.{index}'
+
+def addr_for_worker(addr: str, worker_id: int) -> str:
+    """
+    Returns the address the Gateway listens at for the Worker with the id specified:
+    the TCP port is any free one (0), other addresses get the Worker's suffix.
+    """
+
+    match = _ADDR_TCP.fullmatch(addr)
+    if match is not None:
+        return f'{match.group(1)}0'
+    return f'{addr}.worker{worker_id}'
+
+def addr_bound(addr: str, addr_local: str) -> str:
+    """
+    Returns the address the listener (listening at addr) is bound to: the TCP port of 
+    the listener's local address (host:port) is the one chosen by the system, other addresses as is.
+    """
+
+    match = _ADDR_TCP.fullmatch(addr)
+    if match is not None:
+        return f'{match.group(1)}{addr_local.rpartition(":")[2]}'
+    return addr
+
+def addr_on_host(addr: str, addr_host: str) -> str:
+    """
+    Returns the TCP address at the host of addr_host (the address the Worker dials): 
+    the Gateway may listen at any host, other addresses as is.
+    """
+
+    match = _ADDR_TCP.fullmatch(addr)
+    match_host = _ADDR_TCP.fullmatch(addr_host)
+    if match is not None and match_host is not None:
+        return f'{match_host.group(1)}{match.group(2)}'
+    return addr
+
+def bind_reuse_port(addr: str) -> socket.socket:
+    """
+    Returns the TCP socket bound to the address (host:port) with SO_REUSEPORT,
+    so every process binding the same address accepts a share of the connections.
+    """
+
+    host, _, port = addr.rpartition(':')
+    host = host.strip('[]')
+
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, int(port)))
+    return sock
@@ -0,0 +1,156 @@
+"""
+NN weights distribution support: the weights are passed from the Gateway to Workers
+as raw binary chunks (optionally zstd compressed) and are identified by their content hash.
+
+"""
+
+import base64
+import binascii
+import hashlib
+import tempfile
+
+from typing import Any, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_NONE = ''
+COMPRESSION_ZSTD = 'zstd'
+
+# Files larger than this are kept on disk rather than in memory
+SIZE_SPOOL_MAX = 4 * 1024 * 1024
+
+# Size of the Base64 text decoded at once (a multiple of 4)
+SIZE_BASE64_BLOCK = 256 * 1024
+
+def supported_compressions() -> List[str]:
+    """
+    Returns the compressions which can be used in this process.
+    """
+    if zstandard is None:
+        return []
+    return [COMPRESSION_ZSTD]
+
+async def read_base64_upload(upload: Any) -> Tuple[Any, str, int]:
+    """
+    Decodes the Base64 encoded uploaded file block by block (so it's never loaded to the memory at once).
+
+    Returns the file with decoded data, its SHA-256 hash and size.
+    Raises binascii.Error when the file is not Base64 encoded.
+    """
+    weights_file = tempfile.SpooledTemporaryFile(max_size=SIZE_SPOOL_MAX)
+    weights_hash = hashlib.sha256()
+    size = 0
+
+    rest = b''
+    while True:
+        block = await upload.read(SIZE_BASE64_BLOCK)
+        if not block:
+            break
+
+        # Note: line breaks are allowed in Base64 files but break the blocks alignment
+        text = rest + block.translate(None, b' \t\r\n')
+        size_aligned = len(text) - len(text) % 4
+        rest = text[size_aligned:]
+
+        data = base64.b64decode(text[:size_aligned], validate=True)
+        weights_file.write(data)
+        weights_hash.update(data)
+        size += len(data)
+
+    if rest:
+        weights_file.close()
+        raise binascii.Error('Base64 text has wrong length')
+
+    weights_file.seek(0)
+    return weights_file, weights_hash.hexdigest(), size
+
+def compress_chunk(chunk: bytes, compression: str) -> bytes:
+    if compression == COMPRESSION_ZSTD:
+        return zstandard.ZstdCompressor().compress(chunk)
+    return chunk
+
+class WeightsReceiver:
+    """
+    Collects the chunks of weights on a Worker and checks the result against its hash.
+    """
+
+    def __init__(self):
+        self.__file = None
+        self.__nn_id = ''
+        self.__weights_hash = ''
+
+    @property
+    def nn_id(self) -> str:
+        return self.__nn_id
+
+    @property
+    def weights_hash(self) -> str:
+        return self.__weights_hash
+
+    def begin(self, nn_id: str, weights_hash: str, size: int, count_chunks: int):
+        """
+        Starts receiving new weights. The weights being received are dropped.
+        """
+        self.abort()
+
+        self.__file = tempfile.SpooledTemporaryFile(max_size=SIZE_SPOOL_MAX)
+        self.__nn_id = nn_id
+        self.__weights_hash = weights_hash
+        self.__size = size
+        self.__count_chunks = count_chunks
+        self.__index_next = 0
+        self.__hash = hashlib.sha256()
+
+    def is_receiving(self, weights_hash: str) -> bool:
+        return self.__file is not None and self.__weights_hash == weights_hash
+
+    def add_chunk(self, index: int, chunk: bytes, compression: str) -> bool:
+        """
+        Adds the next chunk. Returns False when the chunk is out of order or can not be decompressed.
+        """
+        if index != self.__index_next:
+            return False
+
+        if compression == COMPRESSION_ZSTD:
+            if zstandard is None:
+                return False
+            try:
+                chunk = zstandard.ZstdDecompressor().decompress(chunk)
+            except zstandard.ZstdError:
+                return False
+        elif compression != COMPRESSION_NONE:
+            return False
+
+        self.__file.write(chunk)
+        self.__hash.update(chunk)
+        self.__index_next += 1
+        return True
+
+    def finish(self) -> Optional[Any]:
+        """
+        Completes receiving the weights.
+
+        Returns the file with the weights, or None when the weights received are incomplete or corrupted.
+        """
+        weights_file = self.__file
+        self.__file = None
+
+        if weights_file is None:
+            return None
+
+        if self.__index_next != self.__count_chunks \
+                or weights_file.tell() != self.__size \
+                or self.__hash.hexdigest() != self.__weights_hash:
+            weights_file.close()
+            return None
+
+        weights_file.seek(0)
+        return weights_file
+
+    def abort(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
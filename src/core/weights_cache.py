@@ -0,0 +1,126 @@
+"""
+On-disk cache of the weights loaded by a Worker: allows to restore the NNs after restart.
+
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+from typing import Any, Dict, List, Optional
+
+class WeightsCache:
+    """
+    Keeps the weights in the cache directory as '<hash>.pt' files,
+    and the 'index.json' file mapping NN ids to the weights hashes (and the optimizations requested).
+
+    The index lists the NNs in the order of loading (the least recent first),
+    the NN loaded last is the active one.
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, cache_dir: str, count_models_max: int):
+        assert count_models_max > 0, \
+            f"models count should be greater than 0, got: {count_models_max}"
+
+        self.__cache_dir = cache_dir
+        self.__count_models_max = count_models_max
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.__models = self.__read_index()
+
+    @property
+    def nn_ids(self) -> List[str]:
+        return [m['nn_id'] for m in self.__models]
+
+    def path(self, weights_hash: str) -> Optional[str]:
+        """
+        Returns the path to the weights with the hash specified, None when there are no such weights.
+        """
+        path = self.__weights_path(weights_hash)
+        if not os.path.isfile(path):
+            return None
+        return path
+
+    def store(self, nn_id: str, weights_hash: str, weights_file: Any, optimization: str = ''):
+        """
+        Stores the weights (when not stored yet) and makes the NN the active one.
+        """
+        if self.path(weights_hash) is None:
+            weights_file.seek(0)
+            self.__write_atomically(self.__weights_path(weights_hash),
+                lambda f: shutil.copyfileobj(weights_file, f))
+
+        self.activate(nn_id, weights_hash, optimization)
+
+    def activate(self, nn_id: str, weights_hash: str, optimization: str = ''):
+        """
+        Makes the NN with the weights already stored the active one.
+        The optimization (empty for the Worker's default) is applied again when the NN is restored.
+        """
+        self.__models = [m for m in self.__models if m['nn_id'] != nn_id]
+        self.__models.append({'nn_id': nn_id, 'hash': weights_hash, 'optimization': optimization})
+
+        models_dropped = self.__models[:-self.__count_models_max]
+        self.__models = self.__models[-self.__count_models_max:]
+
+        self.__write_atomically(os.path.join(self.__cache_dir, WeightsCache.INDEX_FILE),
+            lambda f: f.write(json.dumps({'models': self.__models}).encode()))
+
+        hashes_kept = set(m['hash'] for m in self.__models)
+        for m in models_dropped:
+            if m['hash'] not in hashes_kept:
+                self.__remove(self.__weights_path(m['hash']))
+
+    def restore(self, inferencer: Any) -> List[str]:
+        """
+        Loads the NNs stored (memory mapped where possible) to the inferencer, the active one is loaded last.
+        Returns ids of NNs restored.
+        """
+        restored = []
+        for m in self.__models:
+            # Note: the index written before the optimizations were introduced has none
+            optimization = m.get('optimization', '')
+            if inferencer.reuse_weights(m['nn_id'], m['hash'], optimization):
+                restored.append(m['nn_id'])
+                continue
+
+            path = self.path(m['hash'])
+            if path is None:
+                continue
+            res_status, _ = inferencer.load_weights(m['nn_id'], path, m['hash'], mmap=True, optimization=optimization)
+            if res_status:
+                restored.append(m['nn_id'])
+        return restored
+
+    def __read_index(self) -> List[Dict[str, str]]:
+        try:
+            with open(os.path.join(self.__cache_dir, WeightsCache.INDEX_FILE), 'rb') as f:
+                return json.loads(f.read())['models']
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def __weights_path(self, weights_hash: str) -> str:
+        return os.path.join(self.__cache_dir, f'{weights_hash}.pt')
+
+    def __write_atomically(self, path: str, write):
+        """
+        Writes the file so it's never seen partially written (even after a crash).
+        """
+        fd, path_tmp = tempfile.mkstemp(dir=self.__cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(path_tmp, path)
+        except BaseException:
+            self.__remove(path_tmp)
+            raise
+
+    @staticmethod
+    def __remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,415 @@
+"""
+Asynchronous tasks of the Worker.
+
+"""
+
+import base64
+import functools
+import json
+import math
+import time
+import traceback
+import trio
+
+from typing import Any, Dict, List, Optional
+
+from core.app_stats import ApplicationStatistics
+from core.cmd import Command
+from core.executor import Executor
+from core.frame import Frame
+from core.inferencer import Inferencer
+from core.metrics import Counter, Metrics, Stage
+from core.msg_helper import MessageHelper
+from core.pending import PendingRequest
+from core.utility import addr_on_host, get_local_ips
+from core.weights_cache import WeightsCache
+from core.weights import WeightsReceiver, supported_compressions
+
+class _Transfer:
+    """
+    The weights passed to the Worker by a Gateway process: received chunk by chunk,
+    or loaded from the cache (receiver is None then).
+    """
+
+    def __init__(self, nn_id: str, weights_hash: str, optimization: str, receiver: Optional[WeightsReceiver]):
+        self.nn_id = nn_id
+        self.weights_hash = weights_hash
+        self.optimization = optimization
+        self.receiver = receiver
+
+async def task_work_service(responder, cache: Optional[WeightsCache], channel_heartbeat_send, channel_optimize_send):
+    """
+    Worker task to handle service requests
+
+    The weights are loaded (and stored to the cache when set) in a thread, so the predictions
+    are not stalled meanwhile, the weights found in the cache are not transferred again.
+    The weights are loaded at the end of the transfer only: the Gateway waits for the begin 
+    responses for a short time.
+    The model is optimized as requested with the weights (as set up for the Worker when not specified)
+    by the optimization task, once the Gateway is responded.
+    The Gateway is told about the NNs changed with the heartbeat sent at once.
+
+    Every Gateway process passes its own weights, so the transfers are kept by the Gateway's pipe.
+    """
+
+    inferencer = Inferencer()
+
+    # Gateway's pipe id -> the transfer in progress
+    transfers: Dict[int, _Transfer] = {}
+
+    while True:
+        cmd_msg = await responder.arecv_msg()
+        cmd_bytes = cmd_msg.bytes
+        pipe_id = cmd_msg.pipe.id
+
+        # The NN loaded by the command (to be optimized)
+        nn_id_loaded = None
+
+        # Note: a binary data may follow the command after the new line separator
+        cmd_head, _, cmd_data = cmd_bytes.partition(b'\n')
+        cmd = json.loads(cmd_head.decode('utf-8'))
+
+        if cmd['cmd'] == Command.STATUS:
+            response = _work_status()
+        elif cmd['cmd'] == Command.SET_WEIGHTS:
+            transfer = transfers.pop(pipe_id, None)
+            if transfer is not None and transfer.receiver is not None:
+                transfer.receiver.abort()
+
+            optimization = cmd.get('optimization', '')
+            skipped = inferencer.reuse_weights(cmd['nn_id'], cmd['hash'], optimization)
+            cached = not skipped and cache is not None and cache.path(cmd['hash']) is not None
+            if skipped:
+                if cache is not None:
+                    cache.activate(cmd['nn_id'], cmd['hash'], optimization)
+                _work_heartbeat_soon(channel_heartbeat_send)
+            elif cached:
+                transfers[pipe_id] = _Transfer(cmd['nn_id'], cmd['hash'], optimization, None)
+            else:
+                receiver = WeightsReceiver()
+                receiver.begin(cmd['nn_id'], cmd['hash'], cmd['size'], cmd['count_chunks'])
+                transfers[pipe_id] = _Transfer(cmd['nn_id'], cmd['hash'], optimization, receiver)
+
+            response = MessageHelper.cmd_response_set_weights_begin(skipped, cached, supported_compressions())
+        elif cmd['cmd'] == Command.SET_WEIGHTS_CHUNK:
+            transfer = transfers.get(pipe_id)
+            if transfer is None or transfer.receiver is None or not transfer.receiver.is_receiving(cmd['hash']):
+                # The chunk is for other Workers (the survey reaches every Worker), it's dropped as is
+                continue
+
+            res_status = transfer.receiver.add_chunk(cmd['index'], cmd_data, cmd['compression'])
+            response = MessageHelper.cmd_response_set_weights_chunk(res_status)
+        elif cmd['cmd'] == Command.SET_WEIGHTS_END:
+            transfer = transfers.get(pipe_id)
+            if transfer is None or transfer.weights_hash != cmd['hash']:
+                # The weights are for other Workers
+                continue
+            del transfers[pipe_id]
+
+            if transfer.receiver is None:
+                # Note: the weights cached may be evicted meanwhile by the weights passed by another Gateway process
+                path = cache.path(transfer.weights_hash)
+                if path is None:
+                    res_list = (False, 'Weights cached are not found')
+                else:
+                    res_list = await trio.to_thread.run_sync(functools.partial(inferencer.load_weights,
+                        transfer.nn_id, path, transfer.weights_hash, mmap=True, optimization=transfer.optimization))
+                    if res_list[0]:
+                        cache.activate(transfer.nn_id, transfer.weights_hash, transfer.optimization)
+            else:
+                weights_file = transfer.receiver.finish()
+                if weights_file is None:
+                    res_list = (False, 'Weights received are incomplete or corrupted')
+                else:
+                    with weights_file:
+                        res_list = await trio.to_thread.run_sync(functools.partial(inferencer.load_weights,
+                            transfer.nn_id, weights_file, cmd['hash'], optimization=transfer.optimization))
+                        if res_list[0] and cache is not None:
+                            await trio.to_thread.run_sync(cache.store, 
+                                transfer.nn_id, cmd['hash'], weights_file, transfer.optimization)
+
+            res_status = res_list[0]
+            res_trace_str = res_list[1]
+            if not res_status:
+                res_trace_str = base64.standard_b64encode(
+                    res_trace_str.encode()).decode('utf-8')
+
+            response = MessageHelper.cmd_response_set_weights(res_status, res_trace_str, transfer.receiver is None)
+            _work_heartbeat_soon(channel_heartbeat_send)
+
+            if res_status:
+                nn_id_loaded = transfer.nn_id
+
+        await responder.asend(response.encode())
+
+        if nn_id_loaded is not None:
+            await channel_optimize_send.send(nn_id_loaded)
+
+async def task_work_optimize(channel_receive):
+    """
+    Worker task to optimize the models loaded one by one (see Inferencer.optimize_weights)
+
+    The optimization is made in a thread, the predictions are made by the eager model meanwhile.
+    """
+
+    inferencer = Inferencer()
+
+    async with channel_receive:
+        async for nn_id in channel_receive:
+            await trio.to_thread.run_sync(inferencer.optimize_weights, nn_id)
+
+def _work_status() -> str:
+    """
+    Returns the Worker's status
+    """
+
+    inferencer = Inferencer()
+
+    stats = ApplicationStatistics()
+    inference_time_stats = stats.get_stats_holder(ApplicationStatistics.NN_INFERENCE_TIME)
+    req_handling_time_stats = stats.get_stats_holder(ApplicationStatistics.REQ_HANDLING_TIME)
+
+    return MessageHelper.cmd_response_status(
+        get_local_ips(), 
+        inferencer.nn_id, 
+        inferencer.nn_ids,
+        req_handling_time_stats.average,
+        req_handling_time_stats.count_values_handled, 
+        inference_time_stats.average,
+        stats.summary(ApplicationStatistics.REQ_HANDLING_TIME),
+        stats.summary(ApplicationStatistics.NN_INFERENCE_TIME),
+        Metrics().snapshot())
+
+def _work_heartbeat_soon(channel_heartbeat_send):
+    try:
+        channel_heartbeat_send.send_nowait(None)
+    except trio.WouldBlock:
+        # The heartbeat is already requested
+        pass
+
+async def task_work_heartbeat(socks: List[Any], channel_receive, interval_ms: int):
+    """
+    Worker task to push the Worker's status to the Gateway every interval_ms 
+    (and as soon as requested through the channel)
+
+    The status is pushed to every Gateway process, those not connected are skipped till the next time.
+    """
+
+    async def send(sock, heartbeat: bytes):
+        with trio.move_on_after(interval_ms / 1000):
+            await sock.asend(heartbeat)
+
+    async with channel_receive:
+        while True:
+            heartbeat = Frame.encode_heartbeat(_work_status())
+            async with trio.open_nursery() as nursery:
+                for sock in socks:
+                    nursery.start_soon(send, sock, heartbeat)
+
+            with trio.move_on_after(interval_ms / 1000):
+                await channel_receive.receive()
+
+async def task_work_connect(socks: List[Any], socks_compute: List[Any], addrs: List[str], channel_heartbeat_send):
+    """
+    Worker task to connect the computation sockets the requests are received through
+
+    Every Gateway process passes the address of the Worker's own listener (whenever the Worker 
+    is connected to the process), the Worker's computation socket for the process dials it.
+    The Gateway is told about the Worker with the heartbeat sent at once.
+    """
+
+    async def connect(sock, sock_compute, addr_gw: str):
+        dialer = None
+        while True:
+            msg = await sock.arecv()
+            try:
+                addr = addr_on_host(Frame.decode_address(msg), addr_gw)
+            except ValueError:
+                # Never expected: the Gateway passes nothing else through the socket
+                continue
+
+            if dialer is not None:
+                # The Gateway process has restarted, the listener dialed before is gone
+                dialer.close()
+            dialer = sock_compute.dial(addr, block=False)
+            _work_heartbeat_soon(channel_heartbeat_send)
+
+    async with trio.open_nursery() as nursery:
+        for sock, sock_compute, addr_gw in zip(socks, socks_compute, addrs):
+            nursery.start_soon(connect, sock, sock_compute, addr_gw)
+
+async def task_work_predict(socks: List[Any], socks_compute: List[Any], count_receivers: int, 
+    batch_size_max: int, batch_wait_ms: float, executor: Executor):
+    """
+    Worker task to handle the 'predict' request
+
+    Runs count_receivers receiving loops on every computation socket (a socket per Gateway process),
+    so up to count_receivers requests of every Gateway process are handled simultaneously.
+    The responses are sent through the Gateway process' socket (socks).
+    When batch_size_max is greater than 1, the requests received are collected to 
+    batches (waiting for at most batch_wait_ms for the batch to fill) and 
+    every batch is passed through the NN at once.
+    The NN itself is run by the executor.
+
+    Note: every receiving loop waits for the result of its request before receiving the next one,
+    so a batch never gets more requests than there are loops: the batch is not waited for beyond that.
+    """
+
+    async with trio.open_nursery() as nursery:
+        if batch_size_max > 1:
+            count_loops = count_receivers * len(socks)
+            chan_send, chan_receive = trio.open_memory_channel(max_buffer_size=count_loops)
+            async with chan_send:
+                nursery.start_soon(_work_predict_batches, 
+                    chan_receive, min(batch_size_max, count_loops), batch_wait_ms, executor)
+                for sock, sock_compute in zip(socks, socks_compute):
+                    for _ in range(count_receivers):
+                        nursery.start_soon(_work_receive_predict, 
+                            sock, sock_compute, chan_send.clone(), executor)
+        else:
+            for sock, sock_compute in zip(socks, socks_compute):
+                for _ in range(count_receivers):
+                    nursery.start_soon(_work_receive_predict, sock, sock_compute, None, executor)
+
+async def _work_receive_predict(sock, sock_compute, channel_batch_send, executor: Executor):
+    """
+    Worker task to receive (through sock_compute) and respond (through sock) the 'predict' requests one by one.
+
+    The vectors are passed to the batching task when channel_batch_send is set, 
+    otherwise the prediction is made right here.
+    """
+
+    inferencer = Inferencer()
+
+    stats = ApplicationStatistics()
+    inference_time_stats = stats.get_stats_holder(ApplicationStatistics.NN_INFERENCE_TIME)
+    req_handling_time_stats = stats.get_stats_holder(ApplicationStatistics.REQ_HANDLING_TIME)
+    metrics = Metrics()
+
+    while True:
+        item_bytes = await sock_compute.arecv()
+
+        time_start_req = time.perf_counter()
+
+        try:
+            kind, request_id, nn_id, budget_ms, lengths, data = Frame.decode_request(item_bytes)
+            vectors = Inferencer.tensor_from_buffer(data, lengths)
+        except ValueError:
+            # The Gateway waits for the response anyway, so the error is reported back
+            _, request_id = Frame.peek(item_bytes)
+            if request_id != '':
+                trace_str = base64.standard_b64encode(
+                    traceback.format_exc().encode()).decode('utf-8')
+                await sock.asend(Frame.encode_response(request_id, [(False, trace_str, 0.0)]))
+            continue
+
+        metrics.observe(Stage.DECODE, time.perf_counter() - time_start_req)
+
+        deadline = math.inf
+        if budget_ms > 0:
+            deadline = trio.current_time() + budget_ms / 1000
+
+        if kind == Frame.KIND_PREDICT_BATCH:
+            # The shard of a batch request is already a batch: passed through the NN as is
+            time_start = time.perf_counter()
+
+            results = await _work_run_until(deadline, executor, inferencer.predict_batch, vectors, nn_id)
+
+            if results is None:
+                results = [_RESULT_EXPIRED] * len(lengths)
+            else:
+                delta_s = time.perf_counter() - time_start
+                inference_time_stats.add_value(delta_s * 1000)
+                metrics.observe(Stage.INFERENCE, delta_s)
+        else:
+            v = vectors[0]
+
+            if channel_batch_send is not None:
+                pending = PendingRequest((nn_id, v, deadline))
+                await channel_batch_send.send(pending)
+                res = await pending.wait()
+            else:
+                time_start = time.perf_counter()
+
+                res = await _work_run_until(deadline, executor, inferencer.predict, v, nn_id)
+
+                if res is None:
+                    res = _RESULT_EXPIRED
+                else:
+                    delta_s = time.perf_counter() - time_start
+                    inference_time_stats.add_value(delta_s * 1000)
+                    metrics.observe(Stage.INFERENCE, delta_s)
+
+            results = [res]
+
+        if results[0] is _RESULT_EXPIRED:
+            metrics.inc(Counter.REQUESTS_DROPPED)
+
+        time_start = time.perf_counter()
+        response_bytes = Frame.encode_response(request_id, results)
+        time_end = time.perf_counter()
+        metrics.observe(Stage.ENCODE, time_end - time_start)
+
+        delta_req_s = time_end - time_start_req
+        req_handling_time_stats.add_value(delta_req_s * 1000)
+        metrics.observe(Stage.REQUEST, delta_req_s)
+        metrics.inc(Counter.PREDICTIONS, len(results))
+        metrics.inc(Counter.PREDICTIONS_FAILED, sum(1 for res in results if not res[0]))
+
+        await sock.asend(response_bytes)
+
+# Note: the Gateway is not waiting for the expired requests anymore, the response is sent anyway
+_RESULT_EXPIRED = (False, MessageHelper.MESSAGE_DEADLINE_EXCEEDED, 0.0)
+
+async def _work_run_until(deadline: float, executor: Executor, fn, *args) -> Optional[Any]:
+    """
+    Runs fn(*args) with the executor unless the deadline is passed before it's started.
+    Returns the result of fn, or None when it's not started.
+    """
+    # Note: the executor without threads runs fn with no checkpoint, so the deadline is never checked by trio
+    if trio.current_time() >= deadline:
+        return None
+    with trio.move_on_at(deadline):
+        return await executor.run(fn, *args)
+    return None
+
+async def _work_predict_batches(channel_receive, batch_size_max: int, batch_wait_ms: float, 
+    executor: Executor):
+    """
+    Worker task to collect the 'predict' requests to batches and to run the NN on them
+    """
+
+    inferencer = Inferencer()
+
+    stats = ApplicationStatistics()
+    inference_time_stats = stats.get_stats_holder(ApplicationStatistics.NN_INFERENCE_TIME)
+    metrics = Metrics()
+
+    async with channel_receive:
+        async for pending in channel_receive:
+            batch = [pending]
+            with trio.move_on_after(batch_wait_ms / 1000):
+                while len(batch) < batch_size_max:
+                    batch.append(await channel_receive.receive())
+
+            # Requests to different NNs are passed through their NNs separately
+            time_now = trio.current_time()
+            batches_by_nn_id = {}
+            for p in batch:
+                if p.payload[2] <= time_now:
+                    p.reply(_RESULT_EXPIRED)
+                else:
+                    batches_by_nn_id.setdefault(p.payload[0], []).append(p)
+
+            for nn_id, batch_nn in batches_by_nn_id.items():
+                time_start = time.perf_counter()
+
+                results = await executor.run(
+                    inferencer.predict_batch, [p.payload[1] for p in batch_nn], nn_id)
+
+                delta_s = time.perf_counter() - time_start
+                inference_time_stats.add_value(delta_s * 1000)
+                metrics.observe(Stage.INFERENCE, delta_s)
+
+                for p, res in zip(batch_nn, results):
+                    p.reply(res)
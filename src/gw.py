@@ -11,29 +11,56 @@ Command line arguments:
 
 --addr_service    specifies the address and port of Gateway's service listener.
 --addr_worker     specifies the address and port of Gateway's computation listener.
+--addr_peers      specifies the address and port of the listener for calls between Gateway processes.
+--processes       specifies the number of Gateway processes serving the REST API (each next one listens at the next addresses).
+--dispatchers     specifies the number of prediction requests handled by the cluster simultaneously.
+--shard_size      specifies the number of vectors of a batch prediction handled by a single Worker.
+--routing         specifies the routing of prediction requests to Workers (least_outstanding or p2c).
+--weights_compression specifies the compression of weights passed to Workers (zstd or none).
+--queue_size      specifies the maximum number of prediction requests of every priority waiting for the cluster.
+--codel_target_ms specifies the time a prediction request may wait in the queue before shedding starts (0 disables shedding).
+--client_rate     specifies the prediction requests per second allowed for a client (0 means no limit).
+--client_burst    specifies the prediction requests a client may send at once above the rate.
+--attempt_timeout_ms specifies the time a Worker may take to respond before the request is retried on another Worker (0 means no limit).
+--retries         specifies the number of retries on another Worker when a Worker times out or disconnects.
+--hedge_budget    specifies the share of prediction requests duplicated to another Worker when responded slowly (0 disables hedging).
+--request_timeout_ms specifies the default time to handle a prediction request (0 means no limit).
+--result_cache_size specifies the maximum number of prediction results cached (0 disables caching).
+--result_cache_ttl_s specifies the time (in seconds) the prediction results are cached for.
+--single_flight   collapses identical prediction requests handled at once into a single one.
 -h                print this help message.
 
 """
 
 import argparse
+import multiprocessing
 import pynng
 import trio
 
+from multiprocessing.connection import Connection
+from typing import Optional
+
 from hypercorn.config import Config
 from hypercorn.trio import serve
 from starlette.applications import Starlette
 from starlette.responses import JSONResponse
 from starlette.routing import Route
 
+from core.admission import AdmissionQueue, RateLimiter
 from core.api import APIGateway
 from core.app_stats import ApplicationStatistics
 from core.defaults import Defaults
+from core.failover import Failover
 from core.help import HelpStrings
 from core.msg_helper import MessageHelper
-from core.tasks import task_gw_service, task_gw_predict
+from core.peers import Peers
+from core.result_cache import ResultCache
+from core.router import ROUTING_LEAST_OUTSTANDING, ROUTING_P2C, Router
+from core.gw_tasks import task_gw_service, task_gw_peers, task_gw_predict
+from core.utility import addr_for_process, bind_reuse_port
 from core.ver import ver_tag
 
-async def bootstrap():
+def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(add_help=False, usage=__doc__)
     p.add_argument(
         '--addr_rest',
@@ -50,69 +77,204 @@ async def bootstrap():
         default=Defaults.ADDR_WORKER,
         help=HelpStrings.addr_worker,
     )
+    p.add_argument(
+        '--addr_peers',
+        default=Defaults.ADDR_PEERS,
+        help=HelpStrings.addr_peers,
+    )
+    p.add_argument(
+        '--processes',
+        type=int,
+        default=Defaults.GW_COUNT_PROCESSES,
+        help=HelpStrings.processes,
+    )
+    p.add_argument(
+        '--dispatchers',
+        type=int,
+        default=Defaults.GW_COUNT_DISPATCHERS,
+        help=HelpStrings.dispatchers,
+    )
+    p.add_argument(
+        '--shard_size',
+        type=int,
+        default=Defaults.GW_SIZE_SHARD,
+        help=HelpStrings.shard_size,
+    )
+    p.add_argument(
+        '--routing',
+        choices=[ROUTING_LEAST_OUTSTANDING, ROUTING_P2C],
+        default=Defaults.GW_ROUTING,
+        help=HelpStrings.routing,
+    )
+    p.add_argument(
+        '--weights_compression',
+        choices=['zstd', 'none'],
+        default=Defaults.GW_WEIGHTS_COMPRESSION,
+        help=HelpStrings.weights_compression,
+    )
+    p.add_argument(
+        '--attempt_timeout_ms',
+        type=int,
+        default=Defaults.GW_ATTEMPT_TIMEOUT_MS,
+        help=HelpStrings.attempt_timeout_ms,
+    )
+    p.add_argument(
+        '--retries',
+        type=int,
+        default=Defaults.GW_COUNT_RETRIES,
+        help=HelpStrings.retries,
+    )
+    p.add_argument(
+        '--hedge_budget',
+        type=float,
+        default=Defaults.GW_HEDGE_BUDGET,
+        help=HelpStrings.hedge_budget,
+    )
+    p.add_argument(
+        '--queue_size',
+        type=int,
+        default=Defaults.GW_SIZE_QUEUE_COMPUTE,
+        help=HelpStrings.queue_size,
+    )
+    p.add_argument(
+        '--codel_target_ms',
+        type=float,
+        default=Defaults.GW_CODEL_TARGET_MS,
+        help=HelpStrings.codel_target_ms,
+    )
+    p.add_argument(
+        '--client_rate',
+        type=float,
+        default=Defaults.GW_CLIENT_RATE,
+        help=HelpStrings.client_rate,
+    )
+    p.add_argument(
+        '--client_burst',
+        type=int,
+        default=Defaults.GW_CLIENT_BURST,
+        help=HelpStrings.client_burst,
+    )
+    p.add_argument(
+        '--request_timeout_ms',
+        type=int,
+        default=Defaults.GW_REQUEST_TIMEOUT_MS,
+        help=HelpStrings.request_timeout_ms,
+    )
+    p.add_argument(
+        '--result_cache_size',
+        type=int,
+        default=Defaults.GW_SIZE_RESULT_CACHE,
+        help=HelpStrings.result_cache_size,
+    )
+    p.add_argument(
+        '--result_cache_ttl_s',
+        type=float,
+        default=Defaults.GW_RESULT_CACHE_TTL_S,
+        help=HelpStrings.result_cache_ttl_s,
+    )
+    p.add_argument(
+        '--single_flight',
+        action='store_true',
+        help=HelpStrings.single_flight,
+    )
     p.add_argument(
         '-h', '--help', 
         action='help', 
         default=argparse.SUPPRESS,
         help=HelpStrings.help)
-    args = p.parse_args()
+    return p.parse_args()
+
+async def bootstrap(args: argparse.Namespace, index: int, connection_first: Optional[Connection]):
+    if index == 0:
+        processes = f' with {args.processes} processes' if args.processes > 1 else ''
+        msg = f'Gateway (version {ver_tag}) is going to run at {args.addr_rest}{processes} ...'
+        print(msg)
 
-    msg = f'Gateway (version {ver_tag}) is going to run at {args.addr_rest} ...'
-    print(msg)
+    # Note: every process binds the REST port with SO_REUSEPORT, 
+    # so the kernel balances the connections between the Gateway processes
+    bind = args.addr_rest
+    if args.processes > 1:
+        bind = f'fd://{bind_reuse_port(args.addr_rest).detach()}'
+    conf_hypercorn = Config.from_mapping({'bind': bind})
 
-    conf_hypercorn = Config.from_mapping({'bind': args.addr_rest})
+    def addr(addr_first: str) -> str:
+        return addr_for_process(addr_first, index, Defaults.ADDR_PORT_STEP)
 
+    # Responses are passed back to the API through the reply slot of each PendingRequest
     chan_service_send_api2cluster, chan_service_receive_api2cluster = trio.open_memory_channel(
         max_buffer_size=Defaults.GW_SIZE_QUEUE_SERVICE)
-    chan_service_send_cluster2api, chan_service_receive_cluster2api = trio.open_memory_channel(
-        max_buffer_size=Defaults.GW_SIZE_QUEUE_SERVICE)
-
-    chan_compute_send_api2cluster, chan_compute_receive_api2cluster = trio.open_memory_channel(
-        max_buffer_size=Defaults.GW_SIZE_QUEUE_COMPUTE)
-    chan_compute_send_cluster2api, chan_compute_receive_cluster2api = trio.open_memory_channel(
-        max_buffer_size=Defaults.GW_SIZE_QUEUE_COMPUTE)
 
     ApplicationStatistics.setup_for_gw()
 
-    with pynng.Surveyor0(listen=args.addr_service) as sock_surveyor, \
-        pynng.Req0(listen=args.addr_worker) as sock_req:
- 
-        # TODO: Can be used to allow Gateway to remember connected Workers.
-        """
-        def pre_connect_cb(pipe):
-            addr = str(pipe.remote_address)
-            print('~~~~got connection from {}'.format(addr))
-        def post_remove_cb(pipe):
-            addr = str(pipe.remote_address)
-            print('~~~~goodbye for now from {}'.format(addr))
-        sock_req.add_pre_pipe_connect_cb(pre_connect_cb)
-        sock_req.add_post_pipe_remove_cb(post_remove_cb)
-        sock_req.listen(args.addr_worker)
-
-        await trio.sleep(0.5)
-        """
-
-        async with chan_service_send_api2cluster, chan_service_receive_api2cluster, \
-                chan_service_send_cluster2api, chan_service_receive_cluster2api, \
-                chan_compute_send_api2cluster, chan_compute_receive_api2cluster, \
-                chan_compute_send_cluster2api, chan_compute_receive_cluster2api:
+    # Prediction requests are passed to the cluster through the admission queue
+    admission = AdmissionQueue(args.queue_size, args.codel_target_ms, Defaults.GW_CODEL_INTERVAL_MS)
+    rate_limiter = RateLimiter(args.client_rate, args.client_burst, Defaults.GW_COUNT_CLIENTS_MAX)
+
+    result_cache = ResultCache(args.result_cache_size, args.result_cache_ttl_s, args.single_flight)
+
+    router = Router(args.routing, Defaults.GW_LATENCY_EWMA_ALPHA, Defaults.GW_HEARTBEAT_EXPIRY_MS)
+    failover = Failover(router, args.attempt_timeout_ms, args.retries, 
+        Defaults.GW_HEDGE_PERCENTILE, args.hedge_budget)
+
+    # Note: the polyamorous mode tells the Workers apart (by their pipes), the requests are sent 
+    # through every Worker's own socket (see Router): nng drops the polyamorous sends 
+    # to the Workers fallen behind
+    with pynng.Surveyor0(listen=addr(args.addr_service)) as sock_surveyor, \
+        pynng.Pair1(polyamorous=True) as sock_pair, \
+        pynng.Surveyor0() as sock_peers_surveyor, \
+        pynng.Respondent0() as sock_peers_respondent:
+
+        router.attach(sock_pair, addr(args.addr_worker))
+        sock_pair.listen(addr(args.addr_worker))
+
+        # Every Gateway process surveys all the others
+        peers = Peers(sock_peers_surveyor, index, args.processes, Defaults.GW_PEERS_SURVEY_TIME_MS)
+        if args.processes > 1:
+            sock_peers_respondent.listen(addr(args.addr_peers))
+            for index_peer in range(args.processes):
+                if index_peer != index:
+                    sock_peers_surveyor.dial(
+                        addr_for_process(args.addr_peers, index_peer, Defaults.ADDR_PORT_STEP), block=False)
+
+        api = APIGateway(chan_service_send_api2cluster, admission, rate_limiter,
+            args.shard_size, result_cache, router, peers, args.request_timeout_ms)
+
+        async with chan_service_send_api2cluster, chan_service_receive_api2cluster:
             async with trio.open_nursery() as nursery:
-                nursery.start_soon(task_gw_predict, 
-                    chan_compute_send_cluster2api, chan_compute_receive_api2cluster, sock_req)
+                nursery.start_soon(router.connect_workers)
+                nursery.start_soon(task_gw_predict, admission, sock_pair, router, failover, args.dispatchers)
 
                 nursery.start_soon(task_gw_service, 
-                    chan_service_send_cluster2api, chan_service_receive_api2cluster, 
-                    chan_compute_send_api2cluster, sock_surveyor)
+                    chan_service_receive_api2cluster, sock_surveyor, router, args.weights_compression, result_cache, peers)
 
-                nursery.start_soon(serve, APIGateway(
-                    chan_service_send_api2cluster, chan_service_receive_cluster2api,
-                    chan_compute_send_api2cluster, chan_compute_receive_cluster2api), conf_hypercorn)
+                if args.processes > 1:
+                    nursery.start_soon(task_gw_peers, sock_peers_respondent, api.snapshot, result_cache)
 
-def main():
+                nursery.start_soon(serve, api, conf_hypercorn)
+
+                if connection_first is not None:
+                    # Note: the first process never writes to the connection, it's closed once the process is gone
+                    await trio.lowlevel.wait_readable(connection_first.fileno())
+                    nursery.cancel_scope.cancel()
+
+def run(args: argparse.Namespace, index: int, connection_first: Optional[Connection] = None):
     try:
-        trio.run(bootstrap, restrict_keyboard_interrupt_to_checkpoints=True)
+        trio.run(bootstrap, args, index, connection_first, restrict_keyboard_interrupt_to_checkpoints=True)
     except KeyboardInterrupt:
-        print('Exiting...')
+        if index == 0:
+            print('Exiting...')
+
+def main():
+    args = parse_args()
+
+    # The other processes are stopped with the first one (whatever the way it's stopped):
+    # the sending end of the connection is held by the first process only
+    context = multiprocessing.get_context('spawn')
+    connection_receive, connection_send = context.Pipe(duplex=False)
+    for index in range(1, args.processes):
+        context.Process(target=run, args=(args, index, connection_receive), daemon=True).start()
+
+    run(args, 0)
 
 if __name__ == '__main__':
     main()
@@ -11,17 +11,36 @@ Command line arguments:
 
 --addr_service    specifies the address and port of Gateway's service listener.
 --addr_worker     specifies the address and port of Gateway's computation listener.
+--gateways        specifies the number of Gateway processes to connect to (the addresses of the next ones are derived).
+--receivers       specifies the number of prediction requests awaited simultaneously on every Gateway socket (--contexts is its deprecated alias).
+--batch_size      specifies the maximum size of a batch of predictions (1 disables batching).
+--batch_wait_ms   specifies the maximum time to wait for a batch to fill (in milliseconds).
+--threads         specifies the number of threads running the inference (0 runs it in the event loop).
+--models_max      specifies the maximum number of NN models held at once.
+--models_memory_mb specifies the maximum memory taken by NN models held at once (0 means no limit).
+--optimization    specifies the optimization of NN models loaded (none, script or int8) unless specified with the weights.
+--optimization_tolerance specifies the maximum relative difference of the optimized NN outputs from the eager NN ones.
+--torch_threads   specifies the number of threads used by PyTorch for a single inference (0 keeps the PyTorch default).
+--cache_dir       specifies the directory to keep the weights loaded (they are restored from it at start).
+--heartbeat_ms    specifies the interval of heartbeats sent to the Gateway with the Worker's status (in milliseconds).
 -h                print this help message.
 """
 
 import argparse
+import contextlib
 import pynng
 import trio
 
 from core.app_stats import ApplicationStatistics
 from core.defaults import Defaults
+from core.executor import Executor
 from core.help import HelpStrings
-from core.tasks import task_work_service, task_work_predict
+from core.inferencer import Inferencer
+from core.optimization import OPTIMIZATIONS
+from core.weights_cache import WeightsCache
+from core.work_tasks import task_work_service, task_work_connect, task_work_predict, task_work_heartbeat, \
+    task_work_optimize
+from core.utility import addr_for_process
 from core.ver import ver_tag
 
 async def bootstrap():
@@ -36,6 +55,80 @@ async def bootstrap():
         default=Defaults.ADDR_WORKER,
         help=HelpStrings.addr_worker,
     )
+    p.add_argument(
+        '--gateways',
+        type=int,
+        default=Defaults.WORK_COUNT_GATEWAYS,
+        help=HelpStrings.gateways,
+    )
+    p.add_argument(
+        '--receivers',
+        # Note: the deprecated name of the option (it set the number of Rep0 contexts once)
+        '--contexts',
+        dest='receivers',
+        type=int,
+        default=Defaults.WORK_COUNT_RECEIVERS,
+        help=HelpStrings.receivers,
+    )
+    p.add_argument(
+        '--batch_size',
+        type=int,
+        default=Defaults.WORK_SIZE_BATCH_MAX,
+        help=HelpStrings.batch_size,
+    )
+    p.add_argument(
+        '--batch_wait_ms',
+        type=float,
+        default=Defaults.WORK_BATCH_WAIT_MS,
+        help=HelpStrings.batch_wait_ms,
+    )
+    p.add_argument(
+        '--threads',
+        type=int,
+        default=Defaults.WORK_COUNT_THREADS,
+        help=HelpStrings.threads,
+    )
+    p.add_argument(
+        '--models_max',
+        type=int,
+        default=Defaults.WORK_COUNT_MODELS_MAX,
+        help=HelpStrings.models_max,
+    )
+    p.add_argument(
+        '--models_memory_mb',
+        type=int,
+        default=Defaults.WORK_SIZE_MODELS_MAX_MB,
+        help=HelpStrings.models_memory_mb,
+    )
+    p.add_argument(
+        '--optimization',
+        choices=OPTIMIZATIONS,
+        default=Defaults.WORK_OPTIMIZATION,
+        help=HelpStrings.optimization,
+    )
+    p.add_argument(
+        '--optimization_tolerance',
+        type=float,
+        default=Defaults.WORK_OPTIMIZATION_TOLERANCE,
+        help=HelpStrings.optimization_tolerance,
+    )
+    p.add_argument(
+        '--torch_threads',
+        type=int,
+        default=Defaults.WORK_COUNT_TORCH_THREADS,
+        help=HelpStrings.torch_threads,
+    )
+    p.add_argument(
+        '--cache_dir',
+        default=Defaults.WORK_CACHE_DIR,
+        help=HelpStrings.cache_dir,
+    )
+    p.add_argument(
+        '--heartbeat_ms',
+        type=int,
+        default=Defaults.WORK_HEARTBEAT_INTERVAL_MS,
+        help=HelpStrings.heartbeat_ms,
+    )
     p.add_argument(
         '-h', '--help', 
         action='help', 
@@ -44,14 +137,53 @@ async def bootstrap():
     args = p.parse_args()
 
     ApplicationStatistics.setup_for_work()
+    Inferencer.setup(args.models_max, args.models_memory_mb, 
+        args.optimization, args.optimization_tolerance, args.torch_threads)
+
+    cache = None
+    nn_ids_restored = []
+    if args.cache_dir != '':
+        # The weights are restored before the Worker connects to the Gateway
+        cache = WeightsCache(args.cache_dir, args.models_max)
+        nn_ids_restored = cache.restore(Inferencer())
+        for nn_id in nn_ids_restored:
+            print(f'NN {nn_id} is restored from cache')
+
+    executor = Executor(args.threads)
+
+    # The service task requests the heartbeat at once when the NNs are changed
+    chan_heartbeat_send, chan_heartbeat_receive = trio.open_memory_channel(max_buffer_size=1)
 
-    with pynng.Respondent0(dial=args.addr_service) as sock_responder, \
-            pynng.Rep0(dial=args.addr_worker, 
+    # The NNs loaded are optimized by the optimization task (the NNs restored are optimized first)
+    chan_optimize_send, chan_optimize_receive = trio.open_memory_channel(max_buffer_size=args.models_max)
+    for nn_id in nn_ids_restored:
+        chan_optimize_send.send_nowait(nn_id)
+
+    # Note: every Gateway process has its own computation socket, so the responses are sent 
+    # to the process waiting for them (with backpressure), and the process passes the address of 
+    # the Worker's own listener the requests are received from (with backpressure as well)
+    with pynng.Respondent0() as sock_responder, contextlib.ExitStack() as stack:
+        addrs_worker = [addr_for_process(args.addr_worker, index, Defaults.ADDR_PORT_STEP) 
+            for index in range(args.gateways)]
+        socks_pair = []
+        socks_compute = []
+        for index in range(args.gateways):
+            sock_responder.dial(addr_for_process(args.addr_service, index, Defaults.ADDR_PORT_STEP))
+            socks_pair.append(stack.enter_context(pynng.Pair1(
+                dial=addrs_worker[index], 
+                reconnect_time_min=Defaults.WORK_RECONNECT_TIME_MIN_MS, 
+                reconnect_time_max=Defaults.WORK_RECONNECT_TIME_MAX_MS)))
+            socks_compute.append(stack.enter_context(pynng.Pair1(
                 reconnect_time_min=Defaults.WORK_RECONNECT_TIME_MIN_MS, 
-                reconnect_time_max=Defaults.WORK_RECONNECT_TIME_MAX_MS) as sock_rep:
+                reconnect_time_max=Defaults.WORK_RECONNECT_TIME_MAX_MS)))
+
         async with trio.open_nursery() as nursery:
-            nursery.start_soon(task_work_predict, sock_rep)
-            nursery.start_soon(task_work_service, sock_responder)
+            nursery.start_soon(task_work_connect, socks_pair, socks_compute, addrs_worker, chan_heartbeat_send)
+            nursery.start_soon(task_work_predict, 
+                socks_pair, socks_compute, args.receivers, args.batch_size, args.batch_wait_ms, executor)
+            nursery.start_soon(task_work_service, sock_responder, cache, chan_heartbeat_send, chan_optimize_send)
+            nursery.start_soon(task_work_optimize, chan_optimize_receive)
+            nursery.start_soon(task_work_heartbeat, socks_pair, chan_heartbeat_receive, args.heartbeat_ms)
 
 def main():
     try:
@@ -0,0 +1,3 @@
+curl -X POST http://127.0.0.1:54321/predict_batch \
+   -H 'Content-Type: application/json' \
+   -d '{"vectors": [[0.1, 0.2], [0.446, 0.554], [0.33333, 0.33333, 0.33333]]}'